@@ -0,0 +1,245 @@
+"""
+Copyright 2020 Google LLC
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    https://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import random
+import resource
+import statistics
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from formats import BinarySensorParser
+from formats import encode_binary_log
+from parser import GoogleSensorParser
+from parser import Parser
+from transport import iter_binary
+
+SENSOR_NAMES = ['BMI160 Gyroscope', 'BMI160 Accelerometer', 'AK09918 Magnetometer',
+                'Linear Acceleration Sensor', 'TMD2725 Ambient Light', 'BMP380 Pressure']
+
+# Metrics whose name ends with this are better when higher, all others when lower.
+RATE_SUFFIX = '_per_s'
+
+def generate_log(path, lines, sensors=3, dimensions=3, seed=0, latency=True, header_sensors=None):
+    """Writes a synthetic Google formatted sensor log.
+
+    Args:
+        path: Where the log is written.
+        lines: The number of body lines to write.
+        sensors: The number of sensors interleaved in the body.
+        dimensions: The number of data channels per sensor.
+        seed: Seed for the random data values, equal seeds produce equal files.
+        latency: Whether body lines end with a latency field.
+        header_sensors: The number of sensors declared in the header, at least
+            sensors. Sensors beyond sensors have no points. Defaults to sensors.
+    """
+    rng = random.Random(seed)
+    with open(path, "w") as f:
+        for i in range(max(header_sensors or sensors, sensors)):
+            name = SENSOR_NAMES[i % len(SENSOR_NAMES)]
+            f.write("Sensor %d: sensor type %d.0: %s.\n" % (i, i + 1, name))
+
+        ts = 1000000
+        for i in range(lines):
+            ts += rng.randint(900, 1100)
+            data = " ".join("%.6f" % rng.uniform(-10, 10) for _ in range(dimensions))
+            if latency:
+                f.write("Sensor: %d.0 TS: %d Data: %s Latency: %d\n"
+                        % (i % sensors + 1, ts, data, rng.randint(0, 5000)))
+            else:
+                f.write("Sensor: %d.0 TS: %d Data: %s \n" % (i % sensors + 1, ts, data))
+
+def best_time(fn, repeat: int) -> float:
+    """Returns the shortest of repeat wall-clock times of fn(), in seconds."""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+def time_parse(parser, path, lines, repeat=1) -> float:
+    """Parses path repeat times and returns the best throughput in lines per second."""
+    return lines / best_time(lambda: parser.parse(path), repeat)
+
+def parse_peak_rss(parser, path) -> float:
+    """Parses path in a child process and returns its peak resident set size in MiB.
+
+    Runs in a freshly spawned interpreter, so the peak isn't inflated by
+    earlier benchmarks or by memory inherited from this process.
+    """
+    parser.parse(path)
+    # ru_maxrss is in KiB on Linux and in bytes on macOS.
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1 << 20 if sys.platform == 'darwin' else 1 << 10)
+
+def peak_rss(parser, path) -> float:
+    """Returns parse_peak_rss measured in a spawned worker process."""
+    with multiprocessing.get_context('spawn').Pool(1) as pool:
+        return pool.apply(parse_peak_rss, (parser, path))
+
+def bench_parse(path, lines, repeat) -> dict:
+    """Benchmarks parsing path with each parser, and returns the samples parsed by GoogleSensorParser."""
+    google = GoogleSensorParser([path])
+    # The same format without the fused line regex, i.e. one search per field.
+    generic = Parser([path], google.regex)
+    samples = google.parse(path)
+
+    binary_path = path + '.bin'
+    with open(binary_path, 'wb') as f:
+        f.write(encode_binary_log(samples))
+    binary = BinarySensorParser([binary_path])
+
+    results = {
+        'parse.fused.lines_per_s': time_parse(google, path, lines, repeat),
+        'parse.generic.lines_per_s': time_parse(generic, path, lines, repeat),
+        'parse.binary.lines_per_s': time_parse(binary, binary_path, lines, repeat),
+        'parse.fused.peak_rss_mb': peak_rss(google, path),
+        'parse.binary.peak_rss_mb': peak_rss(binary, binary_path),
+    }
+    return results, samples
+
+def bench_serialize(samples, repeat) -> dict:
+    """Benchmarks encoding parsed samples as the JSON and binary /upload responses."""
+    parser = GoogleSensorParser([])
+    json_size = len(parser.jsonify(samples))
+    binary_size = sum(len(part) for part in iter_binary(samples))
+    return {
+        'serialize.json_s': best_time(lambda: parser.jsonify(samples), repeat),
+        'serialize.binary_s': best_time(lambda: b"".join(iter_binary(samples)), repeat),
+        'serialize.json_mb': json_size / (1 << 20),
+        'serialize.binary_mb': binary_size / (1 << 20),
+    }
+
+def bench_stats(samples, repeat, avg_period=100, stdev_period=100) -> dict:
+    """Benchmarks /stats requests for every channel of the first sample through the Flask test client.
+
+    Cold requests use a dataset whose statistics aren't cached yet, warm
+    requests repeat the same request.
+    """
+    # Imported here so parsing can be benchmarked without the server's dependencies.
+    import server
+
+    client = server.app.test_client()
+    # Channel keys are strings, as sent by the frontend.
+    request = {'sample': 0, 'channels': [str(key) for key in samples[0].data] + ['timestamp_diffs'],
+               'avg_period': avg_period, 'stdev_period': stdev_period}
+
+    def post(dataset_id):
+        response = client.post('/stats', data=json.dumps(dict(request, dataset_id=dataset_id)))
+        if response.status_code != 200:
+            raise RuntimeError("/stats failed: %s" % response.get_data(as_text=True))
+
+    cold, warm = [], []
+    for i in range(repeat):
+        dataset_id = 'benchmark-%d-%d' % (os.getpid(), i)
+        server.datasets.add(dataset_id, samples)
+        start = time.perf_counter()
+        post(dataset_id)
+        cold.append(time.perf_counter() - start)
+        warm.append(best_time(lambda: post(dataset_id), 1))
+    return {
+        'stats.cold_s': statistics.median(cold),
+        'stats.warm_s': statistics.median(warm),
+    }
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    """Lists the metrics of results that are worse than in baseline by more than tolerance.
+
+    Args:
+        results, baseline: Metric name to value dicts, as in the 'results' of main's output.
+        tolerance: The allowed relative change, e.g. 0.1 for 10%.
+
+    Returns:
+        A list of (metric, baseline value, value) tuples. Metrics missing from
+        either dict are ignored.
+    """
+    regressions = []
+    for metric, value in results.items():
+        expected = baseline.get(metric)
+        if not expected:
+            continue
+        change = (value - expected) / expected
+        if metric.endswith(RATE_SUFFIX):
+            change = -change
+        if change > tolerance:
+            regressions.append((metric, expected, value))
+    return regressions
+
+def main():
+    arg_parser = argparse.ArgumentParser(
+        description="Benchmarks parsing, serialization and /stats on a synthetic log.")
+    arg_parser.add_argument('--lines', type=int, default=1000000)
+    arg_parser.add_argument('--sensors', type=int, default=3)
+    arg_parser.add_argument('--dimensions', type=int, default=3)
+    arg_parser.add_argument('--header-sensors', type=int, default=None,
+                            help="Sensors declared in the header, defaults to --sensors.")
+    arg_parser.add_argument('--no-latency', dest='latency', action='store_false')
+    arg_parser.add_argument('--seed', type=int, default=0)
+    arg_parser.add_argument('--repeat', type=int, default=3,
+                            help="Runs per benchmark, the best time is reported.")
+    arg_parser.add_argument('--skip-stats', action='store_true',
+                            help="Skips the /stats benchmark, which imports the server.")
+    arg_parser.add_argument('--output', help="Writes the JSON results to this file too.")
+    arg_parser.add_argument('--baseline', help="JSON results of an earlier run to compare with.")
+    arg_parser.add_argument('--tolerance', type=float, default=0.1,
+                            help="Relative change allowed before a metric counts as a regression.")
+    args = arg_parser.parse_args()
+
+    config = {key: getattr(args, key) for key in
+              ('lines', 'sensors', 'dimensions', 'header_sensors', 'latency', 'seed', 'repeat')}
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'bench.txt')
+        generate_log(path, args.lines, args.sensors, args.dimensions, args.seed,
+                     args.latency, args.header_sensors)
+
+        results, samples = bench_parse(path, args.lines, args.repeat)
+    results.update(bench_serialize(samples, args.repeat))
+    if not args.skip_stats:
+        results.update(bench_stats(samples, args.repeat))
+
+    report = {
+        'config': config,
+        'environment': {'python': platform.python_version(), 'numpy': np.__version__,
+                        'platform': platform.platform(), 'cpus': os.cpu_count()},
+        'results': results
+    }
+    text = json.dumps(report, indent=2, sort_keys=True)
+    print(text)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get('config') != config:
+            print("warning: baseline was run with a different config", file=sys.stderr)
+        regressions = compare(results, baseline['results'], args.tolerance)
+        for metric, expected, value in regressions:
+            print("regression: %s %.6g -> %.6g" % (metric, expected, value), file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
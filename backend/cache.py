@@ -0,0 +1,309 @@
+"""
+Copyright 2020 Google LLC
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    https://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import hashlib
+import json
+import os
+import re
+import logging
+import shutil
+import tempfile
+import threading
+
+from collections import OrderedDict
+
+import numpy as np
+
+from parser import Sample
+
+logger = logging.getLogger(__name__)
+
+# Number of bytes read at a time when hashing an upload.
+HASH_BLOCK_BYTES = 1 << 20
+# Keys are hex digests, anything else can't name a cache file.
+KEY_PATTERN = re.compile('[0-9a-f]+')
+
+def content_key(source, parser) -> str:
+    """Computes the cache key of a file parsed by a parser.
+
+    The key covers the file contents and everything that determines how they
+    are parsed: the parser class, its regex dict and its line regex.
+
+    Args:
+        source: A path or a seekable binary file object. File objects are
+            rewound to the start afterwards.
+        parser: The Parser the file will be parsed with.
+
+    Returns:
+        A hex SHA-256 digest.
+    """
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, "rb") as f:
+            return content_key(f, parser)
+
+    digest = parser_digest(parser)
+    source.seek(0)
+    for block in iter(lambda: source.read(HASH_BLOCK_BYTES), b""):
+        digest.update(block)
+    source.seek(0)
+    return digest.hexdigest()
+
+def parser_digest(parser):
+    """Returns a SHA-256 object primed with the format of parser.
+
+    Feeding it the contents of a file, e.g. chunk by chunk as they are
+    received, gives the same key as content_key.
+    """
+    digest = hashlib.sha256()
+    digest.update(type(parser).__name__.encode())
+    for key in sorted(parser.compiled):
+        digest.update(("%s=%s\n" % (key, parser.compiled[key].pattern)).encode())
+    if parser.line_pattern is not None:
+        digest.update(parser.line_pattern.pattern.encode())
+    return digest
+
+def samples_size(samples: list) -> int:
+    """Returns the number of bytes held by the columns of samples."""
+    size = 0
+    for sample in samples:
+        size += sample.timestamps.nbytes + sample.latencies.nbytes
+        size += sum(arr.nbytes for arr in sample.data.values())
+    return size
+
+def save_samples(path, samples: list):
+    """Writes samples to a columnar capture directory, see load_samples.
+
+    The directory holds meta.json, describing each sample, and one .npy file
+    per column: '<i>_timestamps', '<i>_timestamp_diffs', '<i>_latencies' and
+    '<i>_data_<channel>' for sample i.
+
+    Captures are named by content, so an existing capture at path already
+    holds the same samples and is kept. Concurrent saves of the same path all succeed.
+
+    Raises:
+        OSError: The capture can't be written.
+    """
+    if os.path.isdir(path):
+        return
+    # Write to a temporary directory first so readers never see a partial capture.
+    directory, name = os.path.split(os.path.abspath(path))
+    temp = tempfile.mkdtemp(prefix=name + '.', suffix='.tmp', dir=directory)
+    try:
+        write_capture(temp, samples)
+        os.rename(temp, path)
+    except OSError:
+        shutil.rmtree(temp, ignore_errors=True)
+        # Another save of the same capture finished first.
+        if not os.path.isfile(os.path.join(path, 'meta.json')):
+            raise
+
+def write_capture(directory, samples: list):
+    """Writes the files of a capture of samples to an existing directory, see save_samples."""
+    meta = []
+    for i, sample in enumerate(samples):
+        timestamps = sample.timestamps
+        meta.append({
+            'sensor_name': sample.sensor_name,
+            'sensor_id': sample.sensor_id,
+            'dtype': sample.dtype.str,
+            'channels': list(sample.data),
+            'sorted': bool(np.all(timestamps[1:] >= timestamps[:-1]))
+        })
+        columns = {'timestamps': timestamps, 'timestamp_diffs': sample.timestamp_diffs,
+                   'latencies': sample.latencies}
+        columns.update(('data_%d' % key, arr) for key, arr in sample.data.items())
+        for name, arr in columns.items():
+            np.save(os.path.join(directory, '%d_%s.npy' % (i, name)), arr)
+    with open(os.path.join(directory, 'meta.json'), 'w') as f:
+        json.dump(meta, f)
+
+def load_samples(path, sensor_ids=None, channels=None, start=None, end=None) -> list:
+    """Reads the samples written by save_samples.
+
+    Columns are memory-mapped rather than read, so opening a capture costs
+    the same for any size and only the pages that are used are read from disk.
+
+    Args:
+        path: The capture directory.
+        sensor_ids: (Optional) Only load the samples of these sensor IDs.
+        channels: (Optional) Only load these data channels, by key. Samples
+            keep the original keys of the channels.
+        start, end: (Optional) Only load the points with timestamps in [start, end].
+
+    Returns:
+        A list of finalized Samples, backed by read-only memory maps unless a
+        time range of a sample with out-of-order timestamps had to be copied.
+    """
+    with open(os.path.join(path, 'meta.json')) as f:
+        meta = json.load(f)
+
+    def column(i, name):
+        return np.load(os.path.join(path, '%d_%s.npy' % (i, name)), mmap_mode='r')
+
+    samples = []
+    for i, entry in enumerate(meta):
+        if sensor_ids is not None and entry['sensor_id'] not in sensor_ids:
+            continue
+        keys = [key for key in entry['channels'] if channels is None or key in channels]
+        timestamps = column(i, 'timestamps')
+        latencies = column(i, 'latencies')
+        data = {key: column(i, 'data_%d' % key) for key in keys}
+
+        if start is None and end is None:
+            samples.append(Sample.from_arrays(entry['sensor_name'], entry['sensor_id'],
+                                              timestamps, data, latencies, column(i, 'timestamp_diffs')))
+            continue
+
+        if entry['sorted']:
+            lo = 0 if start is None else np.searchsorted(timestamps, start, 'left')
+            hi = len(timestamps) if end is None else np.searchsorted(timestamps, end, 'right')
+            selection = slice(lo, hi)
+        else:
+            selection = np.ones(len(timestamps), dtype=bool)
+            if start is not None:
+                selection &= timestamps >= start
+            if end is not None:
+                selection &= timestamps <= end
+
+        if len(latencies) == len(timestamps):
+            latencies = latencies[selection]
+        samples.append(Sample.from_arrays(
+            entry['sensor_name'], entry['sensor_id'], timestamps[selection],
+            {key: arr[selection] for key, arr in data.items()}, latencies))
+    return samples
+
+class DatasetCache:
+    """DatasetCache keeps parsed samples in memory and on disk, keyed by content_key.
+
+    Both tiers are bounded in bytes and evict the least recently used entries.
+    Entries evicted from memory stay on disk and are reloaded on the next hit.
+
+    Attributes:
+        directory: Where cached samples are written as save_samples captures,
+            None to only cache in memory.
+        memory_bytes: The maximum size of the samples held in memory.
+        disk_bytes: The maximum size of the files in directory.
+        hits: Number of get calls answered from memory or disk.
+        disk_hits: Number of hits that had to be loaded from disk.
+        misses: Number of get calls for keys that aren't cached.
+    """
+
+    def __init__(self, directory=None, memory_bytes=1 << 30, disk_bytes=10 << 30):
+        """Initializes an empty cache, creating directory if needed."""
+        self.directory = directory
+        self.memory_bytes = memory_bytes
+        self.disk_bytes = disk_bytes
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        # key: (samples, size), ordered from least to most recently used.
+        self.memory = OrderedDict()
+        self.memory_used = 0
+        self.lock = threading.Lock()
+
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+
+    def path(self, key) -> str:
+        return os.path.join(self.directory, key)
+
+    def get(self, key):
+        """Returns the cached samples for key, or None if they aren't cached."""
+        with self.lock:
+            if key in self.memory:
+                self.memory.move_to_end(key)
+                self.hits += 1
+                return self.memory[key][0]
+
+        on_disk = self.directory is not None and KEY_PATTERN.fullmatch(key)
+        if on_disk and os.path.isdir(self.path(key)):
+            try:
+                samples = load_samples(self.path(key))
+            except (OSError, ValueError, KeyError):
+                # A corrupt or concurrently evicted file is treated as a miss.
+                samples = None
+            if samples is not None:
+                # Mark the file as recently used for disk eviction.
+                os.utime(self.path(key))
+                with self.lock:
+                    self.hits += 1
+                    self.disk_hits += 1
+                    self.remember(key, samples)
+                return samples
+
+        with self.lock:
+            self.misses += 1
+        return None
+
+    def put(self, key, samples: list):
+        """Caches samples under key in memory and, if enabled, on disk."""
+        with self.lock:
+            self.remember(key, samples)
+
+        if self.directory is not None:
+            try:
+                save_samples(self.path(key), samples)
+                self.evict_disk()
+            except OSError as e:
+                # The disk tier is only an optimization, e.g. the disk may be full.
+                logger.warning("Failed to cache %s on disk: %s", key, e)
+
+    def remember(self, key, samples: list):
+        """Adds samples to the memory tier and evicts until it fits. Requires self.lock."""
+        if key in self.memory:
+            self.memory_used -= self.memory.pop(key)[1]
+
+        size = samples_size(samples)
+        self.memory[key] = (samples, size)
+        self.memory_used += size
+        while self.memory_used > self.memory_bytes and self.memory:
+            _, (_, evicted_size) = self.memory.popitem(last=False)
+            self.memory_used -= evicted_size
+
+    def evict_disk(self):
+        """Deletes the least recently used captures until the directory fits in disk_bytes."""
+        captures = []
+        for name in os.listdir(self.directory):
+            # Skips temporary directories of captures being written.
+            if not KEY_PATTERN.fullmatch(name):
+                continue
+            try:
+                path = self.path(name)
+                size = sum(entry.stat().st_size for entry in os.scandir(path))
+                captures.append((os.stat(path).st_mtime, size, name))
+            except FileNotFoundError:
+                pass
+
+        used = sum(size for _, size, _ in captures)
+        for _, size, name in sorted(captures):
+            if used <= self.disk_bytes:
+                break
+            shutil.rmtree(self.path(name), ignore_errors=True)
+            used -= size
+
+    def stats(self) -> dict:
+        """Returns the hit/miss counters and the size of each tier."""
+        with self.lock:
+            return {
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'memory_entries': len(self.memory),
+                'memory_bytes': self.memory_used,
+                'memory_limit': self.memory_bytes,
+                'disk_limit': self.disk_bytes if self.directory is not None else 0
+            }
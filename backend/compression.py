@@ -0,0 +1,139 @@
+"""
+Copyright 2020 Google LLC
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    https://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import bz2
+import lzma
+import mmap
+import os
+import zlib
+
+from collections import OrderedDict
+
+try:
+    import zstandard
+except ImportError:
+    # zstd compressed files are still detected, but can't be decompressed.
+    zstandard = None
+
+# Number of compressed bytes read from a file at a time.
+READ_BYTES = 1 << 18
+
+def new_zstd_decompressor():
+    """Returns a streaming zstd decompressor, see CODECS."""
+    if zstandard is None:
+        raise ValueError("Decompressing zstd files requires the zstandard package")
+    return zstandard.ZstdDecompressor().decompressobj()
+
+# name: (magic bytes, function returning a new streaming decompressor).
+CODECS = OrderedDict([
+    ('gzip', (b'\x1f\x8b', lambda: zlib.decompressobj(wbits=31))),
+    ('bzip2', (b'BZh', bz2.BZ2Decompressor)),
+    ('xz', (b'\xfd7zXZ\x00', lzma.LZMADecompressor)),
+    ('zstd', (b'\x28\xb5\x2f\xfd', new_zstd_decompressor)),
+])
+# Number of bytes needed to tell every codec apart.
+MAGIC_BYTES = max(len(magic) for magic, _ in CODECS.values())
+
+def detect_compression(head: bytes):
+    """Returns the name of the codec whose magic bytes head starts with, or None."""
+    for name, (magic, _) in CODECS.items():
+        if head.startswith(magic):
+            return name
+    return None
+
+def compression_of(source):
+    """Returns the codec of a path, binary file object or buffer, or None if it is not compressed.
+
+    File objects are rewound.
+    """
+    if isinstance(source, (bytes, bytearray, mmap.mmap)):
+        return detect_compression(bytes(source[:MAGIC_BYTES]))
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, 'rb') as f:
+            return detect_compression(f.read(MAGIC_BYTES))
+    source.seek(0)
+    head = source.read(MAGIC_BYTES)
+    source.seek(0)
+    return detect_compression(head)
+
+class Decompressor:
+    """Decompressor decompresses a stream pushed to it in chunks, e.g. as it is uploaded.
+
+    Concatenated streams, such as gzip files appended to each other, are
+    decompressed one after the other like a single stream.
+
+    Attributes:
+        codec: The name of the codec, a key of CODECS.
+    """
+
+    def __init__(self, codec: str):
+        self.codec = codec
+        self.decompressor = CODECS[codec][1]()
+
+    def decompress(self, data: bytes) -> bytes:
+        """Returns the bytes decompressed from data and the chunks before it."""
+        blocks = []
+        while data:
+            if self.decompressor.eof:
+                # The previous stream ended, data starts the next one.
+                self.decompressor = CODECS[self.codec][1]()
+            blocks.append(self.decompressor.decompress(data))
+            data = self.decompressor.unused_data if self.decompressor.eof else b''
+        return b''.join(blocks)
+
+def iter_decompressed(source, codec: str, read_bytes=READ_BYTES):
+    """Decompresses a path or binary file object one block at a time.
+
+    Yields:
+        Non-empty blocks of decompressed bytes, which join to the whole contents.
+    """
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, 'rb') as f:
+            yield from iter_decompressed(f, codec, read_bytes)
+        return
+
+    source.seek(0)
+    decompressor = Decompressor(codec)
+    for chunk in iter(lambda: source.read(read_bytes), b''):
+        block = decompressor.decompress(chunk)
+        if block:
+            yield block
+
+def read_prefix(source, size: int) -> bytes:
+    """Returns the first size bytes of the contents of a path or seekable binary file object.
+
+    Compressed files are decompressed only as far as needed. File objects are rewound.
+    """
+    codec = compression_of(source)
+    if codec is None:
+        if isinstance(source, (str, os.PathLike)):
+            with open(source, 'rb') as f:
+                return f.read(size)
+        source.seek(0)
+        head = source.read(size)
+        source.seek(0)
+        return head
+
+    head = bytearray()
+    blocks = iter_decompressed(source, codec)
+    for block in blocks:
+        head += block
+        if len(head) >= size:
+            break
+    blocks.close()
+    if not isinstance(source, (str, os.PathLike)):
+        source.seek(0)
+    return bytes(head[:size])
@@ -0,0 +1,191 @@
+"""
+Copyright 2020 Google LLC
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    https://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import threading
+
+from collections import OrderedDict
+
+import numpy as np
+
+from lod import build_pyramids
+
+# Maximum size of the arrays in the results memoized by one Dataset.
+MAX_RESULT_BYTES = 32 << 20
+
+def result_nbytes(result) -> int:
+    """Returns the size of the NumPy arrays held by a result, nested in dicts, lists and tuples."""
+    if isinstance(result, np.ndarray):
+        return result.nbytes
+    if isinstance(result, dict):
+        return sum(result_nbytes(value) for value in result.values())
+    if isinstance(result, (list, tuple)):
+        return sum(result_nbytes(value) for value in result)
+    return 0
+
+class Dataset:
+    """Dataset holds the samples parsed from one upload and results derived from them.
+
+    Attributes:
+        dataset_id: string - The ID returned to the frontend by /upload.
+        samples: The list of Sample objects, in the order of the upload response.
+        pyramids: A list with the build_pyramids result of each sample.
+        results: OrderedDict - Memoized analysis results, keyed by a tuple that
+            starts with the name of the analysis, least recently used first,
+            see memoize.
+        max_result_bytes: The maximum size of the memoized results.
+    """
+
+    def __init__(self, dataset_id: str, samples: list, max_result_bytes=MAX_RESULT_BYTES):
+        """Initializes the dataset and builds the LOD pyramids of every sample."""
+        self.dataset_id = dataset_id
+        self.samples = samples
+        self.pyramids = [build_pyramids(sample) for sample in samples]
+        self.results = OrderedDict()
+        self.result_sizes = {}
+        self.max_result_bytes = max_result_bytes
+        self.lock = threading.Lock()
+
+    def channel(self, sample: int, channel: str):
+        """Looks up a trace by the references the frontend uses.
+
+        Args:
+            sample: The index of the sample in the upload response.
+            channel: A data channel key ('0', ..., 'n'), 'timestamp_diffs' or 'latencies'.
+
+        Returns:
+            A tuple of the timestamps and values arrays of the trace.
+
+        Raises:
+            KeyError: No such sample or channel.
+        """
+        pyramid = self.pyramid(sample, channel)
+        return pyramid.timestamps, pyramid.values
+
+    def pyramid(self, sample: int, channel: str):
+        """Looks up the LOD pyramid of a trace, see channel.
+
+        Raises:
+            KeyError: No such sample or channel.
+        """
+        sample = int(sample)
+        if not 0 <= sample < len(self.samples):
+            raise KeyError("Unknown sample: %d" % sample)
+        pyramids = self.pyramids[sample]
+        if str(channel) not in pyramids:
+            raise KeyError("Unknown channel: %s" % channel)
+        return pyramids[str(channel)]
+
+    def channels(self, sample: int) -> list:
+        """Returns the names of the traces of a sample, as accepted by channel.
+
+        Raises:
+            KeyError: No such sample.
+        """
+        sample = int(sample)
+        if not 0 <= sample < len(self.samples):
+            raise KeyError("Unknown sample: %d" % sample)
+        return list(self.pyramids[sample])
+
+    def stack(self, sample: int):
+        """Stacks every trace of a sample into one 2-D array.
+
+        Args:
+            sample: The index of the sample in the upload response.
+
+        Returns:
+            A tuple of the list of channel names, as accepted by channel, and a
+            float64 array with one row per channel.
+
+        Raises:
+            KeyError: No such sample.
+        """
+        channels = self.channels(sample)
+        pyramids = self.pyramids[int(sample)]
+        length = len(self.samples[int(sample)].timestamps)
+
+        matrix = np.empty((len(pyramids), length))
+        for row, pyramid in zip(matrix, pyramids.values()):
+            row[:] = pyramid.values
+        return channels, matrix
+
+    def memoize(self, key: tuple, compute):
+        """Returns the result stored under key, calling compute() to produce it on first use.
+
+        The least recently used results are evicted once the results hold more
+        than max_result_bytes, and larger results aren't stored at all.
+        """
+        with self.lock:
+            if key in self.results:
+                self.results.move_to_end(key)
+                return self.results[key]
+        result = compute()
+        nbytes = result_nbytes(result)
+
+        with self.lock:
+            if key in self.results:
+                return self.results[key]
+            if nbytes > self.max_result_bytes:
+                return result
+            self.results[key] = result
+            self.result_sizes[key] = nbytes
+            used = sum(self.result_sizes.values())
+            while used > self.max_result_bytes:
+                evicted, _ = self.results.popitem(last=False)
+                used -= self.result_sizes.pop(evicted)
+            return result
+
+class DatasetStore:
+    """DatasetStore keeps the most recently used Datasets by ID.
+
+    Datasets evicted from the store can be restored from the parsed-dataset
+    cache, since /upload uses the cache key as the dataset ID.
+
+    Attributes:
+        cache: The DatasetCache consulted for IDs that aren't in the store, or None.
+        max_datasets: The number of Datasets kept.
+    """
+
+    def __init__(self, cache=None, max_datasets=16):
+        self.cache = cache
+        self.max_datasets = max_datasets
+        self.datasets = OrderedDict()
+        self.lock = threading.Lock()
+
+    def add(self, dataset_id: str, samples: list) -> Dataset:
+        """Registers samples under dataset_id, reusing the existing Dataset if present."""
+        with self.lock:
+            if dataset_id in self.datasets:
+                self.datasets.move_to_end(dataset_id)
+                return self.datasets[dataset_id]
+
+        dataset = Dataset(dataset_id, samples)
+        with self.lock:
+            self.datasets[dataset_id] = dataset
+            while len(self.datasets) > self.max_datasets:
+                self.datasets.popitem(last=False)
+        return dataset
+
+    def get(self, dataset_id: str):
+        """Returns the Dataset for dataset_id, or None if it is unknown."""
+        with self.lock:
+            if dataset_id in self.datasets:
+                self.datasets.move_to_end(dataset_id)
+                return self.datasets[dataset_id]
+
+        samples = self.cache.get(dataset_id) if self.cache is not None else None
+        if samples is None:
+            return None
+        return self.add(dataset_id, samples)
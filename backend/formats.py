@@ -0,0 +1,519 @@
+"""
+Copyright 2020 Google LLC
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    https://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import json
+import math
+import mmap
+import os
+import re
+import struct
+
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from compression import compression_of
+from compression import read_prefix
+
+from parser import MIN_RANGE_BYTES
+from parser import GoogleSensorParser
+from parser import Parser
+from parser import Sample
+from parser import new_samples
+from parser import open_buffer
+
+# Number of bytes at the start of a file that formats are detected from.
+DETECT_BYTES = 8192
+# The format used when no detect function recognizes a file.
+DEFAULT_FORMAT = 'google'
+
+# name: (Parser subclass, detect function), in the order formats are tried.
+FORMATS = OrderedDict()
+
+def register(name: str, detect):
+    """Class decorator adding a Parser subclass to FORMATS.
+
+    Args:
+        name: The name of the format.
+        detect: A function taking the first DETECT_BYTES of a file and
+            returning whether it is in this format.
+    """
+    def decorator(cls):
+        FORMATS[name] = (cls, detect)
+        return cls
+    return decorator
+
+def read_head(source, size=DETECT_BYTES) -> bytes:
+    """Returns the first size bytes of a path or seekable binary file object, rewinding the latter.
+
+    Compressed files are decompressed, so formats are detected from their contents.
+    """
+    return read_prefix(source, size)
+
+def detect_format(head: bytes) -> str:
+    """Returns the name of the first registered format that recognizes head, or DEFAULT_FORMAT."""
+    for name, (_, detect) in FORMATS.items():
+        if detect(head):
+            return name
+    return DEFAULT_FORMAT
+
+def parser_for(source, files=None) -> Parser:
+    """Returns a parser for the detected format of source, see read_head for source."""
+    cls, _ = FORMATS[detect_format(read_head(source))]
+    return cls(files or [])
+
+def parse_file(path) -> list:
+    """Parses a file in its detected format.
+
+    Defined at module level so that parse_all can run it in worker processes.
+    """
+    return parser_for(path, [path]).parse(path)
+
+def parse_all(paths: list, workers=None) -> list:
+    """Parses files concurrently, one worker process per file, each in its detected format.
+
+    Args:
+        paths: The paths of the files.
+        workers: The maximum number of processes, None for one per CPU. Files
+            are parsed in this process when there is only one process or file.
+
+    Returns:
+        A list with the list of Samples of each file, in the order of paths.
+    """
+    workers = min(workers or os.cpu_count(), len(paths))
+    if workers <= 1:
+        return [parse_file(path) for path in paths]
+    with ProcessPoolExecutor(workers) as executor:
+        return list(executor.map(parse_file, paths))
+
+# Binary logs start with MAGIC, the byte length of their JSON header as a
+# little-endian uint32, and the header. Fixed-size records follow until the end
+# of the file, see record_dtype.
+MAGIC = b'SDVBIN1\n'
+HEADER_START = len(MAGIC) + 4
+# The dtype of the data channels of records when the header doesn't set one.
+DATA_DTYPE = '<f4'
+# A regex that never matches, for Parser fields of formats without text lines.
+NO_MATCH = '(?!)'
+
+def record_dtype(dimensions: int, data_dtype=DATA_DTYPE) -> np.dtype:
+    """Returns the packed structured dtype of the records of a binary log.
+
+    A record holds one point: its timestamp, the sensor type it was read from,
+    dimensions data values and a latency, which is negative when unknown.
+    """
+    return np.dtype([('timestamp', '<i8'), ('sensor_type', '<i4'),
+                     ('data', data_dtype, (dimensions,)), ('latency', '<i8')])
+
+def binary_body_start(head) -> int:
+    """Returns the offset of the first record of a binary log from its first HEADER_START bytes."""
+    length, = struct.unpack('<I', bytes(head[len(MAGIC):HEADER_START]))
+    return HEADER_START + length
+
+def binary_header_end(buffer):
+    """Returns the offset of the first record of a binary log, or None if buffer ends before it."""
+    if len(buffer) < HEADER_START:
+        return None
+    end = binary_body_start(buffer)
+    return end if len(buffer) >= end else None
+
+def encode_binary_log(samples: list, data_dtype=DATA_DTYPE) -> bytes:
+    """Encodes Samples as a binary log, with points of all sensors interleaved by timestamp.
+
+    The type of each sensor is its index in samples. Sensors with fewer
+    dimensions than the others are padded with zeros, which are dropped again
+    by BinarySensorParser since the header records their dimensions.
+    """
+    dimensions = max([len(sample.data) for sample in samples] or [1])
+    header = {
+        'dimensions': dimensions,
+        'data_dtype': data_dtype,
+        'sensors': [{'type': i, 'sensor_id': sample.sensor_id, 'sensor_name': sample.sensor_name,
+                     'dimensions': len(sample.data)} for i, sample in enumerate(samples)]
+    }
+    text = json.dumps(header).encode()
+    # Pad the header with whitespace so records start 8-byte aligned.
+    text += b' ' * (-(HEADER_START + len(text)) % 8)
+
+    dtype = record_dtype(dimensions, data_dtype)
+    records = np.zeros(sum(len(sample.timestamps) for sample in samples), dtype=dtype)
+    position = 0
+    for i, sample in enumerate(samples):
+        points = records[position:position + len(sample.timestamps)]
+        points['timestamp'] = sample.timestamps
+        points['sensor_type'] = i
+        for j, values in enumerate(sample.data.values()):
+            points['data'][:, j] = values
+        latencies = sample.latencies
+        points['latency'] = latencies if len(latencies) == len(points) else -1
+        position += len(points)
+    records = records[np.argsort(records['timestamp'], kind='stable')]
+    return MAGIC + struct.pack('<I', len(text)) + text + records.tobytes()
+
+# Magic bytes are the most specific test, so the binary format is tried first.
+@register('binary', lambda head: head.startswith(MAGIC))
+class BinarySensorParser(Parser):
+    """Implementation of Parser for binary logs of fixed-size records.
+
+    The JSON header of a log names its sensors:
+        dimensions: The number of data values in every record.
+        data_dtype: (Optional) The NumPy dtype of the data values, DATA_DTYPE by default.
+        sensors: A list of objects with the type used in records, sensor_id,
+            sensor_name and optionally dimensions, if the sensor uses fewer
+            data values than the records hold.
+
+    Records are decoded with np.frombuffer straight from the memory-mapped
+    file, and split by sensor type with one vectorized mask per sensor, so no
+    Python code runs per point. Blocks of records end on record boundaries.
+
+    The layout of a log, returned by read_layout, holds its record dtype and
+    its sensors by type.
+
+    Attributes:
+        fields: A dict from the Parser fields to the header keys and record
+            fields they are read from. The Parser regexes never match, since
+            binary logs have no text lines.
+    """
+
+    FIELDS = {
+        'sensor_name': 'sensor_name',
+        'sensor_id': 'sensor_id',
+        'inline_id': 'sensor_type',
+        'timestamp': 'timestamp',
+        'data': 'data',
+        'latency': 'latency',
+    }
+
+    def __init__(self, files: list):
+        """Inits class with list of files only."""
+        self.fields = dict(self.FIELDS)
+        super().__init__(files, {field: NO_MATCH for field in self.FIELDS})
+
+    def read_headers(self, source):
+        """Reads the JSON header of a binary log.
+
+        Returns:
+            A tuple of the list of (sensor_name, sensor_id) pairs and the byte
+            offset of the first record.
+
+        Raises:
+            ValueError: source is not a binary log or its header is truncated.
+        """
+        headers, body_start, _ = self.read_binary_header(source)
+        return headers, body_start
+
+    def read_layout(self, source) -> dict:
+        """Reads the record dtype and the sensors by type from the JSON header of a binary log.
+
+        Raises:
+            ValueError: source is not a binary log or its header is truncated.
+        """
+        return self.read_binary_header(source)[2]
+
+    def read_binary_header(self, source):
+        """Reads the JSON header of a binary log.
+
+        Returns:
+            A tuple of the list of (sensor_name, sensor_id) pairs, the byte
+            offset of the first record and the layout of the log.
+
+        Raises:
+            ValueError: source is not a binary log or its header is truncated.
+        """
+        if not isinstance(source, (bytes, mmap.mmap)):
+            if compression_of(source) is not None:
+                # Only the header is decompressed.
+                head = read_prefix(source, HEADER_START)
+                if len(head) == HEADER_START:
+                    head = read_prefix(source, binary_body_start(head))
+                return self.read_binary_header(head)
+            with open_buffer(source) as buffer:
+                return self.read_binary_header(buffer)
+
+        if bytes(source[:len(MAGIC)]) != MAGIC:
+            raise ValueError("Missing binary log magic")
+        body_start = binary_header_end(source)
+        if body_start is None:
+            raise ValueError("Truncated binary log header")
+        header = json.loads(bytes(source[HEADER_START:body_start]))
+
+        fields = self.fields
+        dimensions = header['dimensions']
+        sensors, headers = {}, []
+        for sensor in header['sensors']:
+            sensor_id = str(sensor[fields['sensor_id']])
+            sensors[int(sensor['type'])] = (sensor_id, sensor.get('dimensions', dimensions))
+            headers.append((sensor[fields['sensor_name']], sensor_id))
+        layout = {
+            'dtype': record_dtype(dimensions, header.get('data_dtype', DATA_DTYPE)),
+            'dimensions': dimensions,
+            'sensors': sensors
+        }
+        return headers, body_start, layout
+
+    def read_buffer(self, buffer, start: int, end: int, samples: dict, layout=None):
+        """Reads every whole record in the byte range [start, end) of buffer.
+
+        Samples for sensor types missing from the header are added to samples.
+        Without a layout, buffer must hold the whole log, header included.
+        """
+        if layout is None:
+            layout = self.read_layout(buffer)
+        fields = self.fields
+        dtype = layout['dtype']
+
+        count = (end - start) // dtype.itemsize
+        if count <= 0:
+            return
+        self.lines_read += count
+        # A view of buffer, every array kept below is a copy made by masking.
+        records = np.frombuffer(buffer, dtype, count, start)
+        types = records[fields['inline_id']]
+        for sensor_type in np.unique(types):
+            selected = records[types == sensor_type]
+            sensor_id, dimensions = layout['sensors'].get(
+                int(sensor_type), (str(sensor_type), layout['dimensions']))
+            sample = samples.get(sensor_id)
+            if sample is None:
+                sample = samples[sensor_id] = Sample('Sensor ' + sensor_id, sensor_id)
+            if not sample.performed_dimension_set:
+                sample.set_dimensions(dimensions)
+
+            data = selected[fields['data']]
+            latencies = selected[fields['latency']]
+            sample.add_points(selected[fields['timestamp']],
+                              [data[:, i] for i in range(len(sample.columns))],
+                              latencies[latencies >= 0])
+
+    def block_end(self, buffer, position: int, block_bytes: int, layout=None) -> int:
+        """Returns the end of the last whole record within about block_bytes of position."""
+        if layout is None:
+            layout = self.read_layout(buffer)
+        itemsize = layout['dtype'].itemsize
+        return min(position + max(block_bytes // itemsize, 1) * itemsize, len(buffer))
+
+    def records_end(self, buffer, header: bool, layout=None) -> int:
+        """Returns the length of the longest prefix of buffer that holds only whole records."""
+        start = 0
+        if header:
+            start = binary_header_end(buffer)
+            if start is None:
+                return 0
+            layout = self.read_layout(bytes(buffer[:start]))
+        itemsize = layout['dtype'].itemsize
+        return start + (len(buffer) - start) // itemsize * itemsize
+
+    def split_body(self, file, body_start: int, parts: int, layout=None) -> list:
+        """Splits the records of file into up to parts ranges, see Parser.split_body."""
+        if layout is None:
+            layout = self.read_layout(file)
+        itemsize = layout['dtype'].itemsize
+        size = os.path.getsize(file)
+        count = (size - body_start) // itemsize
+        parts = max(1, min(parts, (size - body_start) // MIN_RANGE_BYTES))
+
+        bounds = [body_start + count * i // parts * itemsize for i in range(parts)] + [size]
+        return [(start, end) for start, end in zip(bounds, bounds[1:]) if start < end]
+
+GOOGLE_PATTERN = re.compile(rb"sensor type |Sensor: \S+ TS: ")
+
+register('google', GOOGLE_PATTERN.search)(GoogleSensorParser)
+
+# Delimiters recognized in the header row of CSV files, in order of preference.
+CSV_DELIMITERS = b',;\t'
+
+def header_row(head: bytes):
+    """Returns the delimiter and the column names of the first line of head, or None."""
+    line = head.split(b'\n', 1)[0].rstrip(b'\r').decode(errors='replace')
+    for delimiter in CSV_DELIMITERS.decode():
+        if delimiter in line:
+            return delimiter, [name.strip() for name in line.split(delimiter)]
+    return None
+
+def is_fractional(cell: bytes) -> bool:
+    """Returns whether a cell holds a finite number that isn't an integer."""
+    try:
+        value = float(cell)
+    except ValueError:
+        return False
+    return math.isfinite(value) and not value.is_integer()
+
+def detect_csv(head: bytes) -> bool:
+    """Returns whether head starts with a CSV header row naming a timestamp column."""
+    row = header_row(head)
+    timestamp = re.compile(CsvSensorParser.COLUMNS['timestamp'], re.IGNORECASE)
+    return row is not None and any(timestamp.fullmatch(name) for name in row[1])
+
+@register('csv', detect_csv)
+class CsvSensorParser(Parser):
+    """Implementation of Parser for CSV exports with one point per row.
+
+    The first row names the columns. Each field of the regex dict matches the
+    names of the columns it is read from, every other column is a data channel.
+    Body rows are decoded by splitting on the delimiter rather than with regexes.
+    Sensors are named by the sensor_name column or after their ID, and files
+    without a sensor_id column hold a single sensor.
+
+    The layout of a file, returned by read_layout, holds its delimiter and
+    the indices of its columns.
+
+    Attributes:
+        regex: A dict of the column name patterns, matched case-insensitively.
+    """
+
+    COLUMNS = {
+        'timestamp': 'timestamp|ts|time',
+        'sensor_id': 'sensor_id|sensor|id',
+        'sensor_name': 'sensor_name|name',
+        'latency': 'latency',
+        # Any column not claimed by another field.
+        'data': '.*',
+    }
+
+    def __init__(self, files: list):
+        """Inits class with list of files only."""
+        self.regex = dict(self.COLUMNS)
+        super().__init__(files, self.regex)
+
+    def read_layout(self, source) -> dict:
+        """Reads the delimiter and the column indices of each field from the header row.
+
+        Raises:
+            ValueError: source has no header row or no timestamp column.
+        """
+        if isinstance(source, (str, os.PathLike)) or hasattr(source, 'read'):
+            head = read_head(source)
+        else:
+            head = bytes(source[:DETECT_BYTES])
+
+        row = header_row(head)
+        if row is None:
+            raise ValueError("Missing CSV header row")
+        delimiter, names = row
+
+        layout = {'delimiter': delimiter.encode(), 'data': []}
+        for i, name in enumerate(names):
+            field = next((field for field in ('timestamp', 'sensor_id', 'sensor_name', 'latency')
+                          if field not in layout and self.compiled[field].fullmatch(name.lower())), 'data')
+            if field == 'data':
+                layout['data'].append(i)
+            else:
+                layout[field] = i
+        if 'timestamp' not in layout:
+            raise ValueError("Missing CSV timestamp column")
+        return layout
+
+    def read_headers(self, source):
+        """Reads the header row, and the sensors found in the first DETECT_BYTES of the body.
+
+        Sensors first seen later in the file are added by read_buffer.
+
+        Returns:
+            A tuple of the list of (sensor_name, sensor_id) pairs and the byte
+            offset of the first body line.
+        """
+        if isinstance(source, (str, os.PathLike)) or hasattr(source, 'read'):
+            head = read_head(source)
+        else:
+            head = bytes(source[:DETECT_BYTES])
+        layout = self.read_layout(head)
+
+        body_start = head.find(b'\n') + 1 or len(head)
+        samples = {}
+        if 'sensor_id' in layout:
+            # Only complete lines of the head are scanned.
+            body = head[body_start:head.rfind(b'\n') + 1]
+            # The lines are read again with the body, count them only then.
+            lines_read = self.lines_read
+            self.read_buffer(body, 0, len(body), samples, layout)
+            self.lines_read = lines_read
+        return [(sample.sensor_name, sample.sensor_id) for sample in samples.values()], body_start
+
+    def read_buffer(self, buffer, start: int, end: int, samples: dict, layout=None):
+        """Reads every row that starts in the byte range [start, end) of buffer.
+
+        Rows that can't be decoded, such as blank lines, are skipped. Samples
+        for sensors that aren't in samples yet are added to it.
+
+        Timestamps must be integers. A fractional timestamp can't be stored
+        without choosing a unit to scale it to, so rather than skipping every
+        row of such a file it is rejected.
+
+        Trailing empty data cells are channels the sensor doesn't have, so a
+        sensor has as many channels as the first row read for it has data
+        values. Every later row for it must fill exactly these channels and is
+        skipped otherwise, so values never shift into another channel.
+
+        Raises:
+            ValueError: No layout was given, since buffer may not hold the
+                header row, or a row has a fractional timestamp.
+        """
+        if layout is None:
+            raise ValueError("Missing CSV layout, see read_layout")
+        delimiter = layout['delimiter']
+        timestamp_column = layout['timestamp']
+        id_column = layout.get('sensor_id')
+        name_column = layout.get('sensor_name')
+        latency_column = layout.get('latency')
+        data_columns = layout['data']
+
+        # Samples by undecoded ID, since IDs are read from bytes.
+        raw_samples = {sensor_id.encode(): sample for sensor_id, sample in samples.items()}
+        default = next(iter(samples.values())) if id_column is None and samples else None
+
+        lines = bytes(buffer[start:end]).split(b'\n')
+        # The split leaves an empty string after a final newline.
+        self.lines_read += len(lines) - (not lines[-1])
+        for line in lines:
+            fields = line.rstrip(b'\r').split(delimiter)
+            try:
+                timestamp = int(fields[timestamp_column])
+                cells = [fields[i].strip() for i in data_columns]
+                while cells and not cells[-1]:
+                    cells.pop()
+                # An empty cell before the last value fails to convert.
+                values = [float(cell) for cell in cells]
+                latency = -1
+                if latency_column is not None and fields[latency_column].strip():
+                    latency = int(fields[latency_column])
+            except (ValueError, IndexError):
+                if timestamp_column < len(fields) and is_fractional(fields[timestamp_column]):
+                    raise ValueError("CSV timestamps must be integers, got %s"
+                                     % fields[timestamp_column].strip().decode())
+                continue
+            if not values:
+                continue
+
+            if id_column is None:
+                if default is None:
+                    default = new_samples([])['0']
+                    samples['0'] = default
+                sample = default
+            else:
+                raw_id = fields[id_column].strip()
+                sample = raw_samples.get(raw_id)
+                if sample is None:
+                    sensor_id = raw_id.decode()
+                    name = fields[name_column].strip().decode() if name_column is not None else ''
+                    sample = Sample(name or 'Sensor ' + sensor_id, sensor_id)
+                    raw_samples[raw_id] = samples[sensor_id] = sample
+
+            if not sample.performed_dimension_set:
+                sample.set_dimensions(len(values))
+            elif len(values) != len(sample.columns):
+                continue
+            sample.add_point(timestamp, values, latency)
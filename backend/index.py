@@ -0,0 +1,134 @@
+"""
+Copyright 2020 Google LLC
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    https://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import json
+import os
+
+import numpy as np
+
+# Number of body bytes covered by one entry of a TimeIndex.
+INDEX_BYTES = 1 << 16
+
+# Bounds recorded for sensors without points in a block, they never overlap a range.
+NO_MIN = np.iinfo(np.int64).max
+NO_MAX = np.iinfo(np.int64).min
+
+def sidecar_path(file) -> str:
+    """Returns the path of the index file stored next to a log file."""
+    return os.fspath(file) + '.idx.npz'
+
+class TimeIndex:
+    """TimeIndex is a sparse seek table from timestamps to byte offsets in a log file.
+
+    The body of the file is split into blocks of about INDEX_BYTES that end on
+    line boundaries, and the smallest and largest timestamp of each sensor in
+    each block is recorded. A time range then maps to the blocks that can hold
+    points in it, even when timestamps are out of order.
+
+    Attributes:
+        sensor_ids: The IDs of the indexed sensors, the columns of mins and maxs.
+        offsets: np.ndarray[int64] - The start offset of each block, followed by
+            the end offset of the last one.
+        mins, maxs: np.ndarray[int64] - One row per block, one column per sensor.
+        size, mtime: The size and st_mtime_ns of the file when it was indexed.
+    """
+
+    def __init__(self, sensor_ids: list, size=0, mtime=0):
+        """Initializes an index without blocks."""
+        self.sensor_ids = list(sensor_ids)
+        self.offsets = []
+        self.rows = []
+        self.size = size
+        self.mtime = mtime
+        self.mins = np.empty((0, len(self.sensor_ids)), dtype=np.int64)
+        self.maxs = self.mins
+
+    def add_block(self, start: int, end: int, timestamps: dict):
+        """Records the block [start, end) of the file.
+
+        Sensors that aren't indexed yet, such as those first seen in the body
+        of a file without sensor headers, get a column of their own.
+
+        Args:
+            start, end: The byte offsets of the block.
+            timestamps: A dict from sensor ID to the timestamps parsed from the block.
+        """
+        if not self.offsets or self.offsets[-1] != start:
+            self.offsets.append(start)
+        self.offsets.append(end)
+        self.sensor_ids += [sensor_id for sensor_id in timestamps if sensor_id not in self.sensor_ids]
+        row = []
+        for sensor_id in self.sensor_ids:
+            ts = timestamps.get(sensor_id)
+            row.append((ts.min(), ts.max()) if ts is not None and len(ts) else (NO_MIN, NO_MAX))
+        self.rows.append(row)
+
+    def finish(self):
+        """Converts the recorded blocks to arrays, called once the whole file is indexed."""
+        # Blocks recorded before a sensor was first seen have no points of it.
+        for row in self.rows:
+            row += [(NO_MIN, NO_MAX)] * (len(self.sensor_ids) - len(row))
+        bounds = np.array(self.rows, dtype=np.int64).reshape(len(self.rows), len(self.sensor_ids), 2)
+        self.mins, self.maxs = bounds[:, :, 0], bounds[:, :, 1]
+        self.offsets = np.array(self.offsets, dtype=np.int64)
+        self.rows = []
+
+    def ranges(self, start=None, end=None, sensor_ids=None) -> list:
+        """Returns the byte ranges that hold every point of some sensors in a time range.
+
+        Args:
+            start, end: (Optional) The time range, inclusive. None leaves it open.
+            sensor_ids: (Optional) The sensors of interest, defaults to all.
+
+        Returns:
+            A list of (start, end) byte offsets, adjacent blocks are merged.
+        """
+        columns = [i for i, sensor_id in enumerate(self.sensor_ids)
+                   if sensor_ids is None or sensor_id in sensor_ids]
+        overlaps = np.ones(self.mins.shape, dtype=bool)[:, columns]
+        if end is not None:
+            overlaps &= self.mins[:, columns] <= end
+        if start is not None:
+            overlaps &= self.maxs[:, columns] >= start
+        blocks = overlaps.any(axis=1)
+
+        # Runs of selected blocks become single ranges.
+        edges = np.flatnonzero(np.diff(np.concatenate([[0], blocks.view(np.int8), [0]])))
+        return [(int(self.offsets[first]), int(self.offsets[last]))
+                for first, last in zip(edges[::2], edges[1::2])]
+
+    def matches(self, file) -> bool:
+        """Returns whether file is unchanged since it was indexed."""
+        stat = os.stat(file)
+        return stat.st_size == self.size and stat.st_mtime_ns == self.mtime
+
+    def save(self, path):
+        """Writes the index to path, see load."""
+        meta = {'sensor_ids': self.sensor_ids, 'size': self.size, 'mtime': self.mtime}
+        with open(path, 'wb') as f:
+            np.savez(f, offsets=self.offsets, mins=self.mins, maxs=self.maxs,
+                     meta=np.array(json.dumps(meta)))
+
+    @classmethod
+    def load(cls, path):
+        """Reads an index written by save."""
+        with np.load(path) as arrays:
+            meta = json.loads(str(arrays['meta']))
+            index = cls(meta['sensor_ids'], meta['size'], meta['mtime'])
+            index.offsets = arrays['offsets']
+            index.mins = arrays['mins']
+            index.maxs = arrays['maxs']
+        return index
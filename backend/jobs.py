@@ -0,0 +1,192 @@
+"""
+Copyright 2020 Google LLC
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    https://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import threading
+import uuid
+
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+
+class QueueFull(Exception):
+    """Raised by JobQueue.submit when max_pending jobs are already queued or running."""
+
+def starmap(fn, arg_tuples: list) -> list:
+    """Calls fn with each tuple of arguments, to run several calls as one job."""
+    return [fn(*args) for args in arg_tuples]
+
+class Job:
+    """Job tracks one unit of work submitted to a JobQueue.
+
+    Attributes:
+        job_id: string - The ID clients poll the job with.
+        kind: string - What the job does, e.g. 'parse' or 'stats'.
+        state: One of QUEUED, RUNNING, DONE, FAILED or CANCELLED, see status.
+        result: The value returned by the job's on_done callback, once DONE.
+        error: The message of the exception the job failed with, once FAILED.
+        future: The Future of the job in the executor.
+    """
+
+    def __init__(self, job_id: str, kind: str):
+        self.job_id = job_id
+        self.kind = kind
+        self.state = QUEUED
+        self.result = None
+        self.error = None
+        self.future = None
+        self.cancel_requested = False
+
+    @property
+    def status(self) -> str:
+        """The state of the job. Queued jobs are reported as RUNNING once a worker picks them up."""
+        if self.state == QUEUED and self.future is not None and self.future.running():
+            return RUNNING
+        return self.state
+
+    @property
+    def finished(self) -> bool:
+        return self.state in (DONE, FAILED, CANCELLED)
+
+    def to_dict(self) -> dict:
+        """Returns the JSON fields describing the job, without its result."""
+        job = {'job_id': self.job_id, 'kind': self.kind, 'status': self.status}
+        if self.error is not None:
+            job['error'] = self.error
+        return job
+
+class JobQueue:
+    """JobQueue runs jobs on a bounded pool of worker processes.
+
+    At most max_pending jobs may be queued or running at once, further
+    submissions are rejected rather than left to wait. Finished jobs are kept
+    so their results can be polled, up to max_jobs of them.
+
+    Attributes:
+        max_workers: The number of worker processes, None for one per CPU.
+        max_pending: The maximum number of unfinished jobs.
+        max_jobs: The number of finished jobs kept.
+        executor: The executor jobs are run on, a ProcessPoolExecutor with
+            max_workers created on the first submit unless one is passed in.
+    """
+
+    def __init__(self, max_workers=None, max_pending=16, max_jobs=256, executor=None):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.max_jobs = max_jobs
+        self.executor = executor
+        # job_id: Job, in submission order.
+        self.jobs = OrderedDict()
+        self.lock = threading.Lock()
+
+    def submit(self, kind: str, fn, *args, on_done=None, cleanup=None) -> Job:
+        """Queues fn(*args) to run in a worker.
+
+        Args:
+            kind: The kind of the job, see Job.
+            fn, args: The function to run and its arguments. Both must be picklable.
+            on_done: (Optional) Called in this process with the value returned by
+                fn, its return value becomes the job's result. The job is only
+                reported as DONE once it returns.
+            cleanup: (Optional) Called without arguments once the job finished,
+                whatever its outcome.
+
+        Returns:
+            The submitted Job.
+
+        Raises:
+            QueueFull: max_pending jobs are already queued or running.
+        """
+        with self.lock:
+            if sum(not job.finished for job in self.jobs.values()) >= self.max_pending:
+                raise QueueFull("Too many pending jobs")
+            if self.executor is None:
+                self.executor = ProcessPoolExecutor(self.max_workers)
+            job = self.add(kind)
+            job.future = self.executor.submit(fn, *args)
+            self.evict()
+
+        job.future.add_done_callback(lambda future: self.finish(job, future, on_done, cleanup))
+        return job
+
+    def add_result(self, kind: str, result) -> Job:
+        """Records a job that is already DONE, e.g. one answered from a cache."""
+        with self.lock:
+            job = self.add(kind)
+            job.result = result
+            job.state = DONE
+            self.evict()
+        return job
+
+    def add(self, kind: str) -> Job:
+        """Creates and registers a Job. Requires self.lock."""
+        job = Job(uuid.uuid4().hex, kind)
+        self.jobs[job.job_id] = job
+        return job
+
+    def evict(self):
+        """Forgets the oldest finished jobs beyond max_jobs. Requires self.lock."""
+        finished = [job_id for job_id, other in self.jobs.items() if other.finished]
+        for job_id in finished[:max(len(finished) - self.max_jobs, 0)]:
+            del self.jobs[job_id]
+
+    def finish(self, job: Job, future, on_done, cleanup):
+        """Records the outcome of a job, called when its future completes."""
+        try:
+            if future.cancelled() or job.cancel_requested:
+                job.state = CANCELLED
+            elif future.exception() is not None:
+                job.error = str(future.exception()) or type(future.exception()).__name__
+                job.state = FAILED
+            else:
+                result = future.result()
+                job.result = on_done(result) if on_done is not None else result
+                job.state = DONE
+        except Exception as e:
+            job.error = str(e) or type(e).__name__
+            job.state = FAILED
+        finally:
+            if cleanup is not None:
+                cleanup()
+
+    def get(self, job_id: str):
+        """Returns the Job with job_id, or None if it is unknown or was evicted."""
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def cancel(self, job_id: str):
+        """Cancels a job.
+
+        Queued jobs never run. Running jobs can't be interrupted in a worker
+        process, so they run to completion but their result is discarded.
+
+        Returns:
+            The Job, or None if it is unknown.
+        """
+        job = self.get(job_id)
+        if job is not None and not job.finished:
+            job.cancel_requested = True
+            job.future.cancel()
+        return job
+
+    def shutdown(self):
+        """Cancels queued jobs and waits for running ones."""
+        if self.executor is not None:
+            self.executor.shutdown(wait=True, cancel_futures=True)
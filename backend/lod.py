@@ -0,0 +1,109 @@
+"""
+Copyright 2020 Google LLC
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    https://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import math
+
+import numpy as np
+
+# Number of buckets of a pyramid level that are merged into one bucket of the next level.
+FACTOR = 4
+
+class Pyramid:
+    """Pyramid holds min/max level-of-detail summaries of a single trace.
+
+    Level k splits the trace into buckets of FACTOR**k consecutive points and
+    keeps the index of the minimum and maximum point of each bucket. Plotting
+    those two points per bucket keeps every spike visible while sending a
+    bounded number of points for any zoom level.
+
+    Attributes:
+        timestamps: np.ndarray - The x-axis of the trace, sorted.
+        values: np.ndarray - The y-axis of the trace.
+        levels: [(argmin, argmax)] - levels[k - 1] holds the index arrays of level k.
+    """
+
+    def __init__(self, timestamps: np.ndarray, values: np.ndarray):
+        """Builds every level of the pyramid with vectorized reductions.
+
+        Raises:
+            ValueError: timestamps and values have different lengths.
+        """
+        if len(timestamps) != len(values):
+            raise ValueError("timestamps and values have different lengths")
+
+        self.timestamps = timestamps
+        self.values = values
+        self.levels = []
+
+        argmin = argmax = np.arange(len(values))
+        while len(argmin) > 1:
+            argmin = self.reduce(argmin, np.argmin)
+            argmax = self.reduce(argmax, np.argmax)
+            self.levels.append((argmin, argmax))
+
+    def reduce(self, indices: np.ndarray, arg) -> np.ndarray:
+        """Merges each group of FACTOR buckets, keeping the index picked by arg."""
+        # Pad with the last index so the final group is complete without changing its result.
+        pad = -len(indices) % FACTOR
+        groups = np.concatenate([indices, np.repeat(indices[-1:], pad)]).reshape(-1, FACTOR)
+        picked = arg(self.values[groups], axis=1)
+        return groups[np.arange(len(groups)), picked]
+
+    def query(self, start=None, end=None, width=1000):
+        """Selects the points needed to plot a time range at a given width.
+
+        Args:
+            start: The first timestamp of the range, None for the start of the trace.
+            end: The last timestamp of the range, None for the end of the trace.
+            width: The width of the plot in pixels. At most two points per pixel,
+                plus the first and last point of the range, are returned.
+
+        Returns:
+            A tuple of the sorted indices of the selected points and the level
+            they were taken from, 0 if every point in the range is returned.
+        """
+        first = 0 if start is None else np.searchsorted(self.timestamps, start, 'left')
+        last = len(self.timestamps) if end is None else np.searchsorted(self.timestamps, end, 'right')
+        count = last - first
+        width = max(int(width), 1)
+
+        if count <= 2 * width:
+            return np.arange(first, last), 0
+
+        level = min(math.ceil(math.log(count / width, FACTOR)), len(self.levels))
+        bucket = FACTOR ** level
+        argmin, argmax = self.levels[level - 1]
+        lo, hi = first // bucket, -(-last // bucket)
+
+        indices = np.concatenate([[first], argmin[lo:hi], argmax[lo:hi], [last - 1]])
+        # Buckets at the edges of the range can pick points outside of it.
+        indices = indices[(indices >= first) & (indices < last)]
+        return np.unique(indices), level
+
+def build_pyramids(sample) -> dict:
+    """Builds a Pyramid for every plotable trace of a Sample.
+
+    Returns:
+        A dict mapping the trace name used by the frontend ('0', ..., 'n' for the
+        data channels, 'timestamp_diffs' and 'latencies') to its Pyramid.
+        latencies is only included when every point recorded a latency.
+    """
+    timestamps = sample.timestamps
+    pyramids = {str(key): Pyramid(timestamps, arr) for key, arr in sample.data.items()}
+    pyramids['timestamp_diffs'] = Pyramid(timestamps, sample.timestamp_diffs)
+    if len(sample.latencies) == len(timestamps):
+        pyramids['latencies'] = Pyramid(timestamps, sample.latencies)
+    return pyramids
@@ -0,0 +1,145 @@
+"""
+Copyright 2020 Google LLC
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    https://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import cProfile
+import io
+import pstats
+import threading
+import time
+import uuid
+
+from collections import OrderedDict
+from contextlib import contextmanager
+
+# Number of rows of the pstats table returned by Metrics.profile.
+PROFILE_ROWS = 50
+
+class Metrics:
+    """Metrics aggregates stage timers and counters over the lifetime of the server.
+
+    Timers and counters are identified by dotted names such as 'upload.parse'.
+    Recording one costs a dict update under a lock, so it is cheap enough to
+    do once per stage of every request, but not once per line or point.
+
+    Attributes:
+        timers: dict - name: [count, total seconds, max seconds].
+        counters: dict - name: total.
+        profiles: The pstats tables of the last max_profiles profiled
+            requests, by profile ID, oldest first.
+        max_profiles: The number of profiles kept.
+    """
+
+    def __init__(self, max_profiles=16):
+        self.timers = {}
+        self.counters = {}
+        self.profiles = OrderedDict()
+        self.max_profiles = max_profiles
+        self.lock = threading.Lock()
+
+    def record(self, name: str, seconds: float):
+        """Adds one measurement of seconds to the timer name."""
+        with self.lock:
+            timer = self.timers.setdefault(name, [0, 0.0, 0.0])
+            timer[0] += 1
+            timer[1] += seconds
+            timer[2] = max(timer[2], seconds)
+
+    def count(self, name: str, value=1):
+        """Adds value to the counter name."""
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    @contextmanager
+    def timer(self, name: str, timings=None):
+        """Times the body of a with statement as a measurement of the timer name.
+
+        Args:
+            name: The name of the timer.
+            timings: (Optional) A list the (name, seconds) pair is appended to,
+                e.g. to report the stages of one request, see server_timing.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.record(name, elapsed)
+            if timings is not None:
+                timings.append((name, elapsed))
+
+    def timed_iter(self, name: str, fragments):
+        """Yields from fragments, timing the time spent producing them and counting their length.
+
+        Used for streamed responses, which are encoded after the request
+        handler returned. The time is recorded as timer name, the total
+        length of the fragments as counter name + '_bytes'.
+        """
+        elapsed, size = 0.0, 0
+        iterator = iter(fragments)
+        try:
+            while True:
+                start = time.perf_counter()
+                try:
+                    fragment = next(iterator)
+                except StopIteration:
+                    break
+                finally:
+                    elapsed += time.perf_counter() - start
+                size += len(fragment)
+                yield fragment
+        finally:
+            self.record(name, elapsed)
+            self.count(name + '_bytes', size)
+
+    def add_profile(self, profile: cProfile.Profile) -> str:
+        """Keeps the pstats table of a finished profile and returns its ID, see profile."""
+        out = io.StringIO()
+        pstats.Stats(profile, stream=out).sort_stats('cumulative').print_stats(PROFILE_ROWS)
+        profile_id = uuid.uuid4().hex
+        with self.lock:
+            self.profiles[profile_id] = out.getvalue()
+            while len(self.profiles) > self.max_profiles:
+                self.profiles.popitem(last=False)
+        return profile_id
+
+    def profile(self, profile_id: str):
+        """Returns the pstats table kept by add_profile, or None if it is unknown or was evicted."""
+        with self.lock:
+            return self.profiles.get(profile_id)
+
+    def snapshot(self) -> dict:
+        """Returns the timers and counters as JSON values.
+
+        Returns:
+            A dict of:
+                timers: name: count, total, mean and max, in milliseconds.
+                counters: name: total.
+        """
+        with self.lock:
+            timers = {name: {'count': count, 'total': total * 1000, 'mean': total * 1000 / count,
+                             'max': longest * 1000}
+                      for name, (count, total, longest) in self.timers.items()}
+            return {'timers': timers, 'counters': dict(self.counters)}
+
+def server_timing(timings: list) -> str:
+    """Formats (name, seconds) pairs as a Server-Timing header value.
+
+    Repeated names, e.g. a stage run once per chunk, are summed into one entry.
+    """
+    totals = OrderedDict()
+    for name, seconds in timings:
+        totals[name] = totals.get(name, 0.0) + seconds
+    return ', '.join('%s;dur=%.3f' % (name, seconds * 1000) for name, seconds in totals.items())
@@ -14,46 +14,190 @@ See the License for the specific language governing permissions and
 limitations under the License.
 """
 
+import io
 import json
+import mmap
+import os
 import re
 
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+
+import numpy as np
+
+from compression import compression_of
+from compression import iter_decompressed
+from compression import read_prefix
+from index import INDEX_BYTES
+from index import TimeIndex
+from index import sidecar_path
+
+# Number of rows allocated for a column before its first resize.
+INITIAL_CAPACITY = 1024
+# Number of points a Sample stages in Python lists before copying them into its columns.
+CHUNK_SIZE = 4096
+# Smallest byte range of a file body that Parser.parse_parallel hands to a worker.
+MIN_RANGE_BYTES = 1 << 20
+# Number of bytes Parser.iter_chunks reads between checks for full batches.
+BLOCK_BYTES = 1 << 20
+# Number of decompressed bytes the headers of compressed files are read from.
+HEADER_BYTES = 1 << 16
+# Number of values summarize reduces at a time, small enough to stay in the CPU cache.
+SUMMARY_BLOCK_SIZE = 1 << 15
+
+class Column:
+    """Column is a growable typed buffer backing one field of a Sample.
+
+    Appended values are staged in a short Python list and copied into a
+    preallocated NumPy array one chunk at a time. The array's capacity doubles
+    whenever it fills up, so appends are amortized O(1) and each stored value
+    costs only its itemsize rather than a full Python object.
+
+    Attributes:
+        buffer: np.ndarray - The backing storage, len(buffer) is the capacity.
+        size: integer - The number of rows written to the buffer.
+        pending: list - Values appended since the last flush.
+    """
+
+    __slots__ = ('buffer', 'size', 'pending')
+
+    def __init__(self, dtype, capacity=INITIAL_CAPACITY):
+        """Initializes an empty column of the given dtype."""
+        self.buffer = np.empty(max(capacity, 1), dtype=dtype)
+        self.size = 0
+        self.pending = []
+
+    @classmethod
+    def wrap(cls, array: np.ndarray):
+        """Returns a full column backed by array without copying it.
+
+        The array may be read-only, e.g. a memory map: appending grows the
+        column into a new buffer first, so array is never written to.
+        """
+        column = cls.__new__(cls)
+        column.buffer = array
+        column.size = len(array)
+        column.pending = []
+        return column
+
+    def __len__(self):
+        return self.size + len(self.pending)
+
+    def append(self, value):
+        """Stages a single value, it is written to the buffer by the next flush."""
+        self.pending.append(value)
+
+    def extend(self, values):
+        """Appends an array of values in a single copy."""
+        self.flush()
+        self.write(values)
+
+    def flush(self):
+        """Copies all staged values into the buffer."""
+        if self.pending:
+            self.write(self.pending)
+            self.pending = []
+
+    def write(self, values):
+        values = np.asarray(values, dtype=self.buffer.dtype)
+        end = self.size + len(values)
+        if end > len(self.buffer):
+            self.reserve(end)
+        self.buffer[self.size:end] = values
+        self.size = end
+
+    def reserve(self, capacity):
+        """Grows the buffer by doubling until it holds at least capacity rows."""
+        new_capacity = len(self.buffer)
+        while new_capacity < capacity:
+            new_capacity *= 2
+        if new_capacity != len(self.buffer):
+            grown = np.empty(new_capacity, dtype=self.buffer.dtype)
+            grown[:self.size] = self.buffer[:self.size]
+            self.buffer = grown
+
+    def trim(self):
+        """Releases unused capacity so the buffer is exactly len(self) rows long."""
+        self.flush()
+        if self.size != len(self.buffer):
+            self.buffer = self.buffer[:self.size].copy()
+
+    def freeze(self):
+        """Trims the column and makes its buffer, and every view of it, read-only."""
+        self.trim()
+        self.buffer.flags.writeable = False
+
+    def view(self) -> np.ndarray:
+        """Returns the written rows as an array without copying."""
+        self.flush()
+        return self.buffer[:self.size]
+
+def summarize(arr: np.ndarray) -> dict:
+    """Computes the min, max, mean and count of an array in a single pass over memory.
+
+    The array is reduced in blocks of SUMMARY_BLOCK_SIZE values, so every
+    statistic of a block is computed while the block is in the CPU cache.
+
+    Returns:
+        A dict of count, and of min, max and mean as Python numbers, which are
+        None if arr is empty.
+    """
+    count = len(arr)
+    if not count:
+        return {'min': None, 'max': None, 'mean': None, 'count': 0}
+
+    low, high, total = [], [], 0.0
+    for start in range(0, count, SUMMARY_BLOCK_SIZE):
+        block = arr[start:start + SUMMARY_BLOCK_SIZE]
+        low.append(block.min())
+        high.append(block.max())
+        total += block.sum(dtype=np.float64)
+    return {'min': min(low).item(), 'max': max(high).item(), 'mean': total / count, 'count': count}
+
 class Sample:
     """Sample holds the data recorded for a sensor.
 
+    Every field is stored column-wise in a typed Column and exposed as a
+    NumPy array: int64 timestamps and latencies, float64 (or the dtype
+    passed in) channel values.
+
     Attributes:
         sensor_name: string - The name of the sensor.
         sensor_id: string - The unique ID of a sensor.
-        timestamps: float[] - Each recorded timestamp in the sample.
-        timestamp_diffs: {
-            id: integer - Always set to -1, a placeholder value for the frontend to replace.
-            minmax: float[] - The minimum and maximum value in the data array.
-                                minmax = [min(timestamp_diffs['arr']), max(timestamp_diffs['arr'])]
-            arr: float[] - The data values recorded for timestamp differences.
-        }
+        timestamps: np.ndarray[int64] - Each recorded timestamp in the sample.
+        timestamp_diffs: np.ndarray[int64] - The difference between each timestamp
+            and the previous one, the first entry is always 0.
         data: {
-            0: {
-                id: integer - Always set to -1, a placeholder value for the frontend to replace.
-                minmax: float[] - The minimum and maximum value in the data array.
-                                    minmax = [min(data[0]['arr']), max(data[0]['arr'])]
-                arr: float[] - The data values recorded for channel 0.
-            },
-            1: {...},
+            0: np.ndarray - The data values recorded for channel 0.
+            1: np.ndarray,
             ...
-            n: {...}
-        },
-        data_len: integer - The number of channels in data, equal to len(data),
-        latencies: { (Optional)
+            n: np.ndarray
+        }
+        latencies: np.ndarray[int64] - The recorded latencies, empty if the
+            format has none.
+        dtype: The NumPy dtype used for channel values.
+        finalized: bool - Whether finalize was called. Finalized Samples are
+            immutable, their arrays are read-only.
+
+    Parser.jsonify converts each array to the frontend trace format:
+        {
             id: integer - Always set to -1, a placeholder value for the frontend to replace.
             minmax: float[] - The minimum and maximum value in the data array.
-                                minmax = [min(latencies['arr']), max(latencies['arr'])]
-            arr: float[] - The data values recorded for latencies.
+            arr: float[] - The data values recorded.
         }
+    without modifying the Sample.
     """
 
-    def __init__(self, sensor_name: str, sensor_id: str):
+    __slots__ = ('sensor_name', 'sensor_id', 'dtype', 'next_index', 'performed_dimension_set',
+                 'initial_timestamp', 'columns', '_timestamps', '_latencies', '_diffs',
+                 'finalized', '_summaries')
+
+    def __init__(self, sensor_name: str, sensor_id: str, dtype=np.float64):
         """Initializes Sample with the sensor_name and a numeric sensor_id"""
         self.sensor_name = sensor_name
         self.sensor_id = sensor_id
+        self.dtype = np.dtype(dtype)
 
         # Tracks the next index where data will be added.
         self.next_index = 0
@@ -61,13 +205,86 @@ class Sample:
         self.performed_dimension_set = False
 
         self.initial_timestamp = None
-        self.timestamps = []
-        self.timestamp_diffs = []
+        self.columns = {0: Column(self.dtype)}
+        self._timestamps = Column(np.int64)
+        self._latencies = Column(np.int64)
+        # Cached result of np.diff over the timestamps, see timestamp_diffs.
+        self._diffs = None
+        self.finalized = False
+        # Cached results of summary, by field.
+        self._summaries = {}
+
+    @classmethod
+    def from_arrays(cls, sensor_name: str, sensor_id: str, timestamps: np.ndarray, data: dict,
+                    latencies: np.ndarray, timestamp_diffs=None):
+        """Returns a finalized Sample backed by existing arrays, without copying them.
+
+        Args:
+            sensor_name, sensor_id: The sensor of the sample.
+            timestamps: The int64 timestamps of the sample.
+            data: A dict of channel arrays, keyed like Sample.data. All channels
+                must have the same dtype.
+            latencies: The int64 latencies, empty if there are none.
+            timestamp_diffs: (Optional) The precomputed timestamp_diffs,
+                computed from timestamps when first accessed otherwise.
+
+        The Sample is finalized, which makes the arrays read-only.
+        """
+        dtype = next(iter(data.values())).dtype if data else np.float64
+        sample = cls(sensor_name, sensor_id, dtype)
+        sample.columns = {key: Column.wrap(arr) for key, arr in data.items()}
+        sample._timestamps = Column.wrap(timestamps)
+        sample._latencies = Column.wrap(latencies)
+        sample._diffs = timestamp_diffs
+        sample.next_index = len(timestamps)
+        sample.performed_dimension_set = True
+        sample.finalize()
+        return sample
+
+    @property
+    def timestamps(self) -> np.ndarray:
+        return self._timestamps.view()
+
+    @property
+    def timestamp_diffs(self) -> np.ndarray:
+        if self._diffs is None or len(self._diffs) != self.next_index:
+            timestamps = self.timestamps
+            self._diffs = np.diff(timestamps, prepend=timestamps[:1])
+        return self._diffs
+
+    @property
+    def latencies(self) -> np.ndarray:
+        return self._latencies.view()
+
+    @property
+    def data(self) -> dict:
+        return {i: column.view() for i, column in self.columns.items()}
+
+    def summary(self, field) -> dict:
+        """Returns the summarize result of a field, cached once the Sample is finalized.
+
+        Args:
+            field: A data channel key, 'timestamps', 'timestamp_diffs' or 'latencies'.
+
+        Raises:
+            KeyError: No such field.
+        """
+        if field in self._summaries:
+            return self._summaries[field]
 
-        self.data = {}
-        self.data[0] = []
+        if field in ('timestamps', 'timestamp_diffs', 'latencies'):
+            arr = getattr(self, field)
+        else:
+            arr = self.columns[field].view()
+        result = summarize(arr)
+        if self.finalized:
+            self._summaries[field] = result
+        return result
 
-        self.latencies = []
+    def check_mutable(self):
+        """Raises ValueError if the Sample is finalized."""
+        if self.finalized:
+            raise ValueError("A finalized Sample can't be modified")
 
     def add_point(self, timestamp, datapoints: list, latency=-1):
         """Adds a single datapoint to the Sample
@@ -80,34 +297,65 @@ class Sample:
             latency: The recorded latency for this datapoint. Optional.
         
         Returns: None
-        """
 
-        self.timestamps.append(timestamp)
+        Raises:
+            KeyError: datapoints has more entries than the Sample has dimensions.
+            ValueError: The Sample is finalized.
+        """
 
-        if self.next_index > 0:
-            self.timestamp_diffs.append(timestamp - self.timestamps[self.next_index-1])
-        else:
-            self.timestamp_diffs.append(0)
+        self.check_mutable()
+        self._timestamps.append(timestamp)
 
         if latency >= 0:
-            self.latencies.append(latency)
+            self._latencies.append(latency)
 
         for i, point in enumerate(datapoints):
-            self.data[i].append(point)
+            self.columns[i].append(point)
             
         self.next_index += 1
+        if self.next_index % CHUNK_SIZE == 0:
+            self.flush()
+
+    def add_points(self, timestamps, datapoints: list, latencies=None):
+        """Adds many datapoints to the Sample with one copy per column.
+
+        Args:
+            timestamps: Array of the recorded timestamps.
+            datapoints: A list of arrays, one per dimension, each as long as timestamps.
+            latencies: Array of the recorded latencies. Optional.
+
+        Raises:
+            KeyError: datapoints has more entries than the Sample has dimensions.
+            ValueError: The Sample is finalized.
+        """
+        self.check_mutable()
+        self._timestamps.extend(timestamps)
+        if latencies is not None:
+            self._latencies.extend(latencies)
+        for i, points in enumerate(datapoints):
+            self.columns[i].extend(points)
+        self.next_index += len(timestamps)
+
+    def flush(self):
+        """Copies the points staged by add_point into the typed columns."""
+        self._timestamps.flush()
+        self._latencies.flush()
+        for column in self.columns.values():
+            column.flush()
 
     def set_dimensions(self, dimensions: int):
-        """Initializes empty lists in dict after parser determines data dimensions.
+        """Initializes empty columns after parser determines data dimensions.
         
         Args:
             dimensions: The number of dimensions that the data has. e.g. if the
                 gyroscope returns (x,y,z) tuples the parser calls set_dimensions(3).
         
         Raises:
-            ValueError: "< 1 dimension error". 0 or negative dimensions are not valid.
+            ValueError: "< 1 dimension error". 0 or negative dimensions are not valid,
+                or the Sample is finalized.
         """
 
+        self.check_mutable()
         if dimensions < 1:
             raise ValueError("< 1 dimension error")
         if dimensions == 1:
@@ -115,10 +363,222 @@ class Sample:
             return
 
         for i in range(1, dimensions):
-            self.data[i] = []
+            self.columns[i] = Column(self.dtype)
 
         self.performed_dimension_set = True
 
+    def extend(self, other):
+        """Appends every point of other, a Sample of the same sensor, after the points of this Sample.
+
+        timestamp_diffs is derived from the joined timestamps, so the first diff
+        of other is taken relative to the last timestamp of this Sample.
+        """
+        if other.performed_dimension_set and not self.performed_dimension_set:
+            self.set_dimensions(len(other.columns))
+
+        self.add_points(other.timestamps, list(other.data.values()), other.latencies)
+
+    def empty_copy(self):
+        """Returns a Sample for the same sensor with the same dimensions and no points."""
+        sample = Sample(self.sensor_name, self.sensor_id, self.dtype)
+        if self.performed_dimension_set:
+            sample.set_dimensions(len(self.columns))
+        return sample
+
+    def finalize(self):
+        """Trims every column to its length, computes timestamp_diffs and freezes the Sample.
+
+        Called by Parser.parse once a file has been read. Afterwards the Sample
+        is immutable: adding points raises ValueError and every array is
+        read-only, which is what lets summaries be cached. Use extend on an
+        empty_copy to add to the points of a finalized Sample.
+        """
+        if self.finalized:
+            return
+        self._timestamps.freeze()
+        self._latencies.freeze()
+        for column in self.columns.values():
+            column.freeze()
+        if self._diffs is None or len(self._diffs) != self.next_index:
+            timestamps = self.timestamps
+            self._diffs = np.diff(timestamps, prepend=timestamps[:1])
+        self._diffs.flags.writeable = False
+        self.finalized = True
+
+def parse_chunk(parser, file, start: int, end: int, headers: list, layout=None) -> list:
+    """Parses the body lines that start in the byte range [start, end) of file.
+
+    Runs in a worker process of Parser.parse_parallel, so it is defined at
+    module level where it can be pickled.
+
+    Args:
+        parser: The Parser whose regexs are used.
+        file: The file containing sensor data.
+        start: Offset of the first line to parse, always at the start of a line.
+        end: Offset at which to stop, always at the start of a line or the end of the file.
+        headers: The (sensor_name, sensor_id) pairs returned by Parser.read_headers.
+        layout: The layout of file returned by Parser.read_layout.
+
+    Returns:
+        A list containing a finalized Sample for each header, in header order.
+    """
+    samples = new_samples(headers)
+    with open_buffer(file) as buffer:
+        parser.read_buffer(buffer, start, end, samples, layout)
+
+    for sample in samples.values():
+        sample.finalize()
+    return list(samples.values())
+
+@contextmanager
+def open_buffer(source):
+    """Exposes the bytes of a file as a buffer that regexes can scan without copying.
+
+    Args:
+        source: A path, or a binary file object such as an uploaded file stream.
+            Files backed by a file descriptor are memory-mapped, other file
+            objects are read into memory.
+
+    Yields:
+        A bytes-like object supporting find() and slicing.
+    """
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, "rb") as f:
+            with open_buffer(f) as buffer:
+                yield buffer
+        return
+
+    try:
+        fileno = source.fileno()
+    except (AttributeError, io.UnsupportedOperation):
+        fileno = None
+
+    # mmap can't map empty files.
+    if fileno is None or os.fstat(fileno).st_size == 0:
+        source.seek(0)
+        yield source.read()
+        return
+
+    with mmap.mmap(fileno, 0, access=mmap.ACCESS_READ) as buffer:
+        yield buffer
+
+def new_samples(headers: list) -> dict:
+    """Creates a dict of empty Samples keyed by sensor_id from (sensor_name, sensor_id) pairs."""
+    samples = {}
+    for sensor_name, sensor_id in headers:
+        samples[sensor_id] = Sample(sensor_name, sensor_id)
+
+    # Check if no header detected and create a Sample.
+    if not samples:
+        samples['0'] = Sample('unknown_sensor', '0')
+    return samples
+
+def merge_segments(segments: list) -> list:
+    """Merges the Samples parsed from consecutive segments of one capture, e.g. rotated log files.
+
+    The Samples of the same sensor are joined into one, with the points of all
+    segments in timestamp order. Segments usually follow each other, and are
+    then concatenated in the order of their first timestamp. When segments
+    overlap in time, the concatenated points are ordered with a stable sort,
+    which merges the sorted runs of the segments in O(n log k).
+
+    Args:
+        segments: A list with the list of Samples of each segment.
+
+    Returns:
+        A list of finalized Samples, one per sensor in order of first appearance.
+
+    Raises:
+        ValueError: The Samples of a sensor have different dimensions.
+    """
+    groups = OrderedDict()
+    for samples in segments:
+        for sample in samples:
+            groups.setdefault(sample.sensor_id, []).append(sample)
+
+    merged = []
+    for sensor_id, parts in groups.items():
+        # Rotated logs repeat the whole header, so segments may declare sensors
+        # without points, whose dimensions were never set.
+        parts = sorted((part for part in parts if len(part.timestamps)),
+                       key=lambda part: part.timestamps[0]) or parts[:1]
+        keys = list(parts[0].data)
+        if any(list(part.data) != keys for part in parts):
+            raise ValueError("Segments of sensor %s have different dimensions" % sensor_id)
+
+        timestamps = np.concatenate([part.timestamps for part in parts])
+        data = {key: np.concatenate([part.data[key] for part in parts]) for key in keys}
+        latencies = np.concatenate([part.latencies for part in parts])
+        aligned = len(latencies) == len(timestamps)
+
+        if any(later.timestamps[0] < earlier.timestamps[-1] for earlier, later in zip(parts, parts[1:])):
+            order = np.argsort(timestamps, kind='stable')
+            timestamps = timestamps[order]
+            data = {key: arr[order] for key, arr in data.items()}
+            # Latencies that don't cover every point can't be reordered with them.
+            if aligned:
+                latencies = latencies[order]
+
+        merged.append(Sample.from_arrays(parts[0].sensor_name, sensor_id, timestamps, data, latencies))
+    return merged
+
+def iter_array_json(arr: np.ndarray, chunk_size=CHUNK_SIZE):
+    """Encodes a column as a JSON list, converting chunk_size values at a time.
+
+    Yields:
+        Fragments that join to json.dumps(arr.tolist()).
+    """
+    yield '['
+    for start in range(0, len(arr), chunk_size):
+        encoded = json.dumps(arr[start:start + chunk_size].tolist())[1:-1]
+        yield ', ' + encoded if start else encoded
+    yield ']'
+
+def iter_trace_json(arr: np.ndarray, summary: dict):
+    """Encodes a column as the trace object consumed by the frontend.
+
+    The trace has fields:
+        id: Always set to -1, a placeholder value for the frontend to replace.
+        minmax: The minimum and maximum value in the data array. Used for normalization.
+        arr: The data values recorded. These values will be plotted on the y-axis while the
+                timestamps are plotted on the x-axis.
+
+    Args:
+        arr: The column.
+        summary: The summarize result of arr, which minmax is taken from.
+
+    Yields:
+        Fragments of the JSON encoded trace.
+    """
+    yield '{"id": -1, "minmax": %s, "arr": ' % json.dumps([summary['min'], summary['max']])
+    yield from iter_array_json(arr)
+    yield '}'
+
+def iter_sample_json(sample):
+    """Encodes a Sample in the format documented on Sample.
+
+    Yields:
+        Fragments of the JSON encoded sample.
+    """
+    yield '{"sensor_name": %s, "sensor_id": %s, "timestamps": ' % (
+        json.dumps(sample.sensor_name), json.dumps(sample.sensor_id))
+    yield from iter_array_json(sample.timestamps)
+
+    yield ', "timestamp_diffs": '
+    yield from iter_trace_json(sample.timestamp_diffs, sample.summary('timestamp_diffs'))
+
+    data = sample.data
+    yield ', "data": {'
+    for i, (key, arr) in enumerate(data.items()):
+        yield '%s"%s": ' % (', ' if i else '', key)
+        yield from iter_trace_json(arr, sample.summary(key))
+    yield '}, "data_len": %d' % len(data)
+
+    if len(sample.latencies):
+        yield ', "latencies": '
+        yield from iter_trace_json(sample.latencies, sample.summary('latencies'))
+    yield '}'
+
 class Parser:
     """Parser takes in one or more files and converts them to JSON
 
@@ -133,10 +593,16 @@ class Parser:
                 'latency': Matches all latency points.
                 'inline_id': For file formats where multiple sensors are present in the file.
                     The id should match the id declared in 'sensor_id'.
+        line_regex: Optional string regular expression that matches a whole body line in one scan.
+            Fields are captured by named groups using the same names as the regex dict:
+            'timestamp' and 'data' are required, 'inline_id' and 'latency' are optional.
+            Lines it does not match are handed to the per-field regex dict instead.
         samples: List of Sample objects parsed from the files
+        lines_read: The number of body lines read by read_buffer in this process,
+            whether or not they held a point.
     """
     
-    def __init__(self, files: list, regex: dict):
+    def __init__(self, files: list, regex: dict, line_regex=None):
         """"Initializes the parser with a list of files and a dict of regex that details the file format
 
         Raises:
@@ -146,6 +612,7 @@ class Parser:
         self.files = files
         self.compiled = {}
         self.samples = []
+        self.lines_read = 0
 
         # Test if any required fields are not defined.
         required = ['sensor_name', 'sensor_id', 'timestamp', 'data']
@@ -157,53 +624,394 @@ class Parser:
         for key in regex.keys():
             self.compiled[key] = re.compile(regex[key])
 
-    def parse_files(self) -> list:
+        self.line_pattern = None
+        self.line_pattern_bytes = None
+        if line_regex is not None:
+            self.line_pattern = re.compile(line_regex)
+            for field in ['timestamp', 'data']:
+                if field not in self.line_pattern.groupindex:
+                    raise KeyError("Missing required line_regex group: " + field)
+            # Used by read_buffer to match directly against undecoded file contents.
+            self.line_pattern_bytes = re.compile(line_regex.encode())
+
+    def parse_files(self, workers=1, merge=False) -> str:
         """Iterates through all files and returns the parsed Sample objects in json format
 
+        Args:
+            workers: The number of processes to parse with. With more than one,
+                the bodies of all files are split into byte ranges that are parsed
+                concurrently. None uses every CPU.
+            merge: If True, the files are segments of one capture, such as
+                rotated logs, and each sensor's points are merged into one
+                Sample, see merge_segments. Otherwise the Samples of every file
+                are listed one after the other.
+
         Returns:
             A list of json strings representing each sample contained in the files
         """
-        json_samples = []
+        if workers == 1:
+            segments = [self.parse(file) for file in self.files]
+        else:
+            workers = workers or os.cpu_count()
+            with ProcessPoolExecutor(workers) as executor:
+                # Submit the ranges of every file before waiting on any of them.
+                submitted = [self.submit_ranges(file, executor, workers) for file in self.files]
+                segments = [self.merge_chunks(headers, futures) for headers, futures in submitted]
 
-        for file in self.files:
-            for sample in self.parse(file):
-                json_samples.append(sample)
+        if merge:
+            return self.jsonify(merge_segments(segments))
+        return self.jsonify([sample for samples in segments for sample in samples])
 
-        return self.jsonify(json_samples)
+    def parse_parallel(self, file, workers=None) -> list:
+        """Parses a single file by splitting its body across worker processes.
+
+        The header is read once, the body is split into byte ranges aligned on
+        line starts, each range is parsed by parse_chunk in a worker and the
+        per-sensor columns are joined back in file order.
 
-    def parse(self, file):
-        """Parses a single file and creates Sample objects based on how many samples are in the file.
         Args:
             file: The file containing sensor data.
+            workers: The number of processes to parse with. None uses every CPU.
 
         Returns:
-            A list containing Sample objects for each sample contained in the file.
+            A list containing Sample objects for each sample contained in the file,
+            equal to what parse(file) returns.
         """
-        
+        workers = workers or os.cpu_count()
+        with ProcessPoolExecutor(workers) as executor:
+            headers, futures = self.submit_ranges(file, executor, workers)
+            return self.merge_chunks(headers, futures)
+
+    def submit_ranges(self, file, executor, parts: int):
+        """Reads the header of file and submits a parse_chunk job for each of up to parts body ranges.
+
+        Compressed files can't be split, they are parsed by a single job.
+
+        Returns:
+            A tuple of the header list and the futures of the submitted jobs, in
+            file order. The header list is None for compressed files.
+        """
+        if compression_of(file) is not None:
+            return None, [executor.submit(self.parse, file)]
+
+        headers, body_start = self.read_headers(file)
+        layout = self.read_layout(file)
+        ranges = self.split_body(file, body_start, parts, layout)
+        futures = [executor.submit(parse_chunk, self, file, start, end, headers, layout)
+                   for start, end in ranges]
+        return headers, futures
+
+    def merge_chunks(self, headers: list, futures: list) -> list:
+        """Joins the Samples returned by parse_chunk jobs into one Sample per sensor."""
+        samples = new_samples(headers) if headers is not None else {}
+        for future in futures:
+            for chunk in future.result():
+                # Formats without sensor headers discover sensors in the body.
+                samples.setdefault(chunk.sensor_id, chunk.empty_copy()).extend(chunk)
+
+        for sample in samples.values():
+            sample.finalize()
+        return list(samples.values())
+
+    def read_headers(self, source):
+        """Reads the header lines of a file.
+
+        Args:
+            source: A path or binary file object, or a buffer from open_buffer.
+
+        Returns:
+            A tuple of the list of (sensor_name, sensor_id) pairs found in the
+            header and the byte offset of the first body line.
+        """
+        if not isinstance(source, (bytes, mmap.mmap)):
+            if compression_of(source) is not None:
+                head = read_prefix(source, HEADER_BYTES)
+                if len(head) == HEADER_BYTES:
+                    # Leave out the last line, it may be cut off.
+                    head = head[:head.rfind(b"\n") + 1]
+                return self.read_headers(head)
+            with open_buffer(source) as buffer:
+                return self.read_headers(buffer)
+
         samples = {}
-        with open(file, "r") as f:
-            # Read the header lines to determine how many samples are present
-            # and create sample objects for each.
-
-            line = f.readline()
-            while line:
-                if self.read_header(line, samples):
-                    line = f.readline()
-                else:
-                    break
-
-            # Check if no header detected and create a Sample.
-            if not samples:
-                samples[0] = Sample('unknown_sensor', '0')
-                
-            # Read data fields and add to the corresponding sample object.
-            while line:
-                self.read_body(line, samples)
-                line = f.readline()
+        body_start = 0
+        while body_start < len(source):
+            line_end = source.find(b"\n", body_start) + 1 or len(source)
+            # Match on text with the same newlines parse() sees in text mode.
+            line = source[body_start:line_end].decode().replace("\r\n", "\n")
+            if not self.read_header(line, samples):
+                break
+            body_start = line_end
+
+        headers = [(sample.sensor_name, sample.sensor_id) for sample in samples.values()]
+        return headers, body_start
+
+    def split_body(self, file, body_start: int, parts: int, layout=None) -> list:
+        """Splits the bytes of file from body_start to the end into ranges aligned on line starts.
+
+        Ranges are at least MIN_RANGE_BYTES long, so small files are not split.
+
+        Returns:
+            A list of (start, end) byte offsets, in file order.
+        """
+        size = os.path.getsize(file)
+        parts = max(1, min(parts, (size - body_start) // MIN_RANGE_BYTES))
+
+        bounds = [body_start]
+        with open(file, "rb") as f:
+            for i in range(1, parts):
+                f.seek(body_start + (size - body_start) * i // parts)
+                # Skip ahead to the start of the next line.
+                f.readline()
+                bounds.append(max(f.tell(), bounds[-1]))
+        bounds.append(size)
+
+        return [(start, end) for start, end in zip(bounds, bounds[1:]) if start < end]
+
+    def parse(self, source, index=False):
+        """Parses a single file and creates Sample objects based on how many samples are in the file.
+        Args:
+            source: The file containing sensor data, a path or a binary file object
+                such as an uploaded file stream. Files compressed by one of
+                compression.CODECS are decompressed as they are parsed.
+            index: If True and source is the path of an uncompressed file, a
+                TimeIndex of the file is built while parsing and saved next to
+                it for parse_range.
+
+        Returns:
+            A list containing Sample objects for each sample contained in the file.
+        """
+
+        # Read the header to create a sample object for every sensor, including
+        # those without any points.
+        headers, _ = self.read_headers(source)
+        samples = new_samples(headers)
+
+        time_index = None
+        if index and isinstance(source, (str, os.PathLike)) and compression_of(source) is None:
+            stat = os.stat(source)
+            time_index = TimeIndex(samples, stat.st_size, stat.st_mtime_ns)
+
+        for chunk in self.iter_chunks(source, index=time_index):
+            # Formats without sensor headers discover sensors in the body.
+            samples.setdefault(chunk.sensor_id, chunk.empty_copy()).extend(chunk)
+
+        for sample in samples.values():
+            sample.finalize()
+
+        if time_index is not None:
+            try:
+                time_index.save(sidecar_path(source))
+            except OSError:
+                # The index is only an optimization, e.g. the directory may be read-only.
+                pass
 
         # Return only the values since the keys are no longer relevant.
         return list(samples.values())
 
+    def load_index(self, file) -> TimeIndex:
+        """Returns the TimeIndex of file, parsing it with index=True if it has no up to date index."""
+        try:
+            time_index = TimeIndex.load(sidecar_path(file))
+            if time_index.matches(file):
+                return time_index
+        except (OSError, ValueError, KeyError):
+            pass
+
+        headers, _ = self.read_headers(file)
+        stat = os.stat(file)
+        time_index = TimeIndex(new_samples(headers), stat.st_size, stat.st_mtime_ns)
+        for _ in self.iter_chunks(file, index=time_index):
+            pass
+        try:
+            time_index.save(sidecar_path(file))
+        except OSError:
+            pass
+        return time_index
+
+    def parse_range(self, file, t_start, t_end, sensor_ids=None) -> list:
+        """Parses only the points of a file within a time range.
+
+        The TimeIndex of the file selects the blocks that can hold such points,
+        so only those are read. The index is built by a full parse the first
+        time a file is queried, see load_index.
+
+        Args:
+            file: The path of the file containing sensor data.
+            t_start, t_end: The time range, inclusive. None leaves a side open.
+            sensor_ids: (Optional) The IDs of the sensors to return, defaults to all.
+
+        Returns:
+            A list of finalized Samples, one per requested sensor in header order,
+            holding only the points with timestamps in [t_start, t_end].
+        """
+        time_index = self.load_index(file)
+
+        with open_buffer(file) as buffer:
+            headers, _ = self.read_headers(buffer)
+            layout = self.read_layout(buffer)
+            samples = new_samples(headers)
+            for start, end in time_index.ranges(t_start, t_end, sensor_ids):
+                self.read_buffer(buffer, start, end, samples, layout)
+
+        selected = []
+        for sensor_id, sample in samples.items():
+            if sensor_ids is not None and sensor_id not in sensor_ids:
+                continue
+            sample.finalize()
+            # Blocks hold whole lines, including points just outside of the range.
+            timestamps = sample.timestamps
+            mask = np.ones(len(timestamps), dtype=bool)
+            if t_start is not None:
+                mask &= timestamps >= t_start
+            if t_end is not None:
+                mask &= timestamps <= t_end
+            latencies = sample.latencies
+            if len(latencies) == len(timestamps):
+                latencies = latencies[mask]
+            selected.append(Sample.from_arrays(
+                sample.sensor_name, sensor_id, timestamps[mask],
+                {key: arr[mask] for key, arr in sample.data.items()}, latencies))
+        return selected
+
+    def iter_chunks(self, source, chunk_size=CHUNK_SIZE, index=None):
+        """Parses a single file incrementally, yielding points in per-sensor batches.
+
+        The file is read in blocks of about BLOCK_BYTES, and after each block every
+        sensor holding at least chunk_size points is yielded and replaced by an
+        empty Sample, so memory use is bounded regardless of file size. The
+        remaining points of every sensor are yielded at the end of the file.
+
+        Args:
+            source: A path or a binary file object, see parse.
+            chunk_size: The number of points at which a sensor's batch is yielded.
+            index: (Optional) An empty TimeIndex to record the blocks of the file
+                in. The file is then read in blocks of about INDEX_BYTES.
+
+        Yields:
+            Finalized Sample objects holding consecutive points of one sensor.
+            The timestamp_diffs of a batch start at 0, use Sample.extend to join
+            batches of the same sensor.
+
+        Raises:
+            ValueError: An index is requested for a compressed file, whose
+                offsets can't be seeked to.
+        """
+        codec = compression_of(source)
+        if codec is not None:
+            if index is not None:
+                raise ValueError("Compressed files can't be indexed")
+            yield from self.iter_decompressed_chunks(source, codec, chunk_size)
+            return
+
+        with open_buffer(source) as buffer:
+            headers, position = self.read_headers(buffer)
+            layout = self.read_layout(buffer)
+            samples = new_samples(headers)
+
+            size = len(buffer)
+            block_bytes = BLOCK_BYTES if index is None else INDEX_BYTES
+            while position < size:
+                block_end = self.block_end(buffer, position, block_bytes, layout)
+                counts = {key: sample.next_index for key, sample in samples.items()}
+                self.read_buffer(buffer, position, block_end, samples, layout)
+                if index is not None:
+                    index.add_block(position, block_end, {
+                        key: sample.timestamps[counts.get(key, 0):] for key, sample in samples.items()})
+                position = block_end
+
+                for key, sample in samples.items():
+                    if sample.next_index >= chunk_size:
+                        samples[key] = sample.empty_copy()
+                        sample.finalize()
+                        yield sample
+
+        if index is not None:
+            index.finish()
+        for sample in samples.values():
+            if sample.next_index:
+                sample.finalize()
+                yield sample
+
+    def iter_decompressed_chunks(self, source, codec: str, chunk_size=CHUNK_SIZE):
+        """Implements iter_chunks for compressed files.
+
+        The file is decompressed a block at a time and each block is fed to a
+        StreamParser, so neither the compressed nor the decompressed file is
+        held in memory.
+        """
+        stream_parser = StreamParser(self)
+        for block in iter_decompressed(source, codec):
+            stream_parser.feed(block)
+            samples = stream_parser.samples or {}
+            for key, sample in samples.items():
+                if sample.next_index >= chunk_size:
+                    samples[key] = sample.empty_copy()
+                    sample.finalize()
+                    yield sample
+
+        for sample in stream_parser.close():
+            if sample.next_index:
+                yield sample
+
+    def read_layout(self, source):
+        """Reads what, besides the parser's own fields, is needed to decode the body of a file.
+
+        Line formats decode every file with the same regexes and have no
+        layout. Formats whose files describe their own columns or records
+        return them here. The layout is passed to read_buffer, block_end,
+        records_end and split_body rather than kept on the parser, since one
+        parser reads many files, e.g. concurrently in parse_files.
+
+        Args:
+            source: A path or binary file object, or a buffer from open_buffer.
+
+        Returns:
+            The layout of the file, None for line formats.
+        """
+        return None
+
+    def block_end(self, buffer, position: int, block_bytes: int, layout=None) -> int:
+        """Returns the end of the block of about block_bytes starting at position.
+
+        Blocks end at the end of a line, or of the buffer, so every line is
+        read whole. Formats with other records override this and records_end.
+        """
+        return buffer.find(b"\n", min(position + block_bytes, len(buffer))) + 1 or len(buffer)
+
+    def records_end(self, buffer, header: bool, layout=None) -> int:
+        """Returns the length of the longest prefix of buffer that holds only whole lines.
+
+        Args:
+            buffer: The start of a file being received, see StreamParser.
+            header: Whether buffer starts at the start of the file. If not,
+                layout is the layout read from the start of the file.
+        """
+        return buffer.rfind(b"\n") + 1
+
+    def iter_points(self, source):
+        """Parses a single file incrementally, yielding one point at a time.
+
+        Args:
+            source: A path or a binary file object, see parse.
+
+        Yields:
+            (sensor_id, timestamp, datapoints, latency) tuples in the order each
+            sensor's batch is produced by iter_chunks. datapoints is a list ordered
+            by dimension and latency is -1 when the sensor doesn't record one for
+            every point.
+        """
+        for chunk in self.iter_chunks(source):
+            timestamps = chunk.timestamps.tolist()
+            if len(chunk.latencies) == len(timestamps):
+                latencies = chunk.latencies.tolist()
+            else:
+                latencies = [-1] * len(timestamps)
+            rows = zip(*(column.tolist() for column in chunk.data.values()))
+
+            for timestamp, datapoints, latency in zip(timestamps, rows, latencies):
+                yield chunk.sensor_id, timestamp, list(datapoints), latency
+
     def read_header(self, line, samples) -> bool:
         """Parses a header line to determine sensor name and id.
             Creates new Sample objects for sensors.
@@ -236,14 +1044,20 @@ class Parser:
             line: The line from a file to be read.
             samples: A dict with keys: sensor_id and values: Sample objects.
         """
-        
+
+        if self.line_pattern is not None and self.read_line(line, samples):
+            return
+
         # Determine this sensors ID.
         if 'inline_id' in self.compiled:
             search = self.compiled['inline_id'].search(line)
             if search:
                 this_id = search.group(0)
+            else:
+                # Points can't be attributed to a sensor without an ID.
+                return
         else:
-            this_id = samples.keys()[0]
+            this_id = next(iter(samples))
             
         # Determine the timestamp for this line.
         search = self.compiled['timestamp'].search(line)
@@ -265,6 +1079,9 @@ class Parser:
         # Detect the dimensions of the data if not already done.
         if not samples[this_id].performed_dimension_set:
             samples[this_id].set_dimensions(len(matched_data))
+        elif len(matched_data) != len(samples[this_id].columns):
+            # Values of a ragged line can't be attributed to channels.
+            return
 
         matched_latency = -1
         if 'latency' in self.compiled:
@@ -274,6 +1091,94 @@ class Parser:
 
         samples[this_id].add_point(matched_timestamp, matched_data, matched_latency)
 
+    def read_line(self, line, samples: dict) -> bool:
+        """Parses every field of a body line with a single line_pattern match.
+
+        Args:
+            line: The line from a file to be read.
+            samples: A dict with keys: sensor_id and values: Sample objects.
+
+        Returns:
+            True if the line was matched and its point added.
+            False if the line should be parsed field by field instead.
+        """
+
+        match = self.line_pattern.search(line)
+        if not match:
+            return False
+
+        self.add_match(match, samples)
+        return True
+
+    def add_match(self, match, samples: dict):
+        """Adds the point captured by a line_pattern or line_pattern_bytes match.
+
+        Points with another number of values than the first point of their
+        sensor are skipped, see read_body.
+
+        Args:
+            match: The match, its groups may be str or bytes.
+            samples: A dict with keys: sensor_id and values: Sample objects.
+                sensor_id must have the same type as the groups of match.
+        """
+
+        fields = match.groupdict()
+        this_id = fields.get('inline_id')
+        if this_id is None:
+            this_id = next(iter(samples))
+        sample = samples[this_id]
+
+        matched_data = list(map(float, fields['data'].split()))
+        if not sample.performed_dimension_set:
+            sample.set_dimensions(len(matched_data))
+        elif len(matched_data) != len(sample.columns):
+            # Values of a ragged line can't be attributed to channels.
+            return
+
+        matched_latency = fields.get('latency')
+        if matched_latency is None:
+            matched_latency = -1
+
+        sample.add_point(int(fields['timestamp']), matched_data, int(matched_latency))
+
+    def read_buffer(self, buffer, start: int, end: int, samples: dict, layout=None):
+        """Reads every body line that starts in the byte range [start, end) of buffer.
+
+        Args:
+            buffer: The file contents, see open_buffer.
+            start: Offset of the first line to read, always at the start of a line.
+            end: Offset at which to stop, always at the start of a line or the end of the buffer.
+            samples: A dict with keys: sensor_id and values: Sample objects.
+            layout: The layout of the file returned by read_layout.
+        """
+        pattern = self.line_pattern_bytes
+        # The same Samples keyed by the undecoded ID that line_pattern_bytes captures.
+        raw_samples = {}
+        for sensor_id, sample in samples.items():
+            raw_samples[sensor_id.encode() if isinstance(sensor_id, str) else sensor_id] = sample
+
+        # Bound methods are looked up once since this loop runs for every line.
+        find = buffer.find
+        search = pattern.search if pattern else None
+        add_match = self.add_match
+
+        size = len(buffer)
+        position = start
+        lines = 0
+        while position < end:
+            line_end = find(b"\n", position) + 1
+            if line_end == 0:
+                line_end = size
+
+            match = search(buffer, position, line_end) if search else None
+            if match:
+                add_match(match, raw_samples)
+            else:
+                self.read_body(buffer[position:line_end].decode(), samples)
+            position = line_end
+            lines += 1
+        self.lines_read += lines
+
     def jsonify(self, samples: list):
         """Takes a list of sample objects and returns a list of JSON versions of those objects.
 
@@ -286,67 +1191,131 @@ class Parser:
                     1: {Sample Object},
                     ....   }
         """
-        ret_dict = {}
+        return "".join(self.iter_json(samples))
+
+    def iter_json(self, samples: list):
+        """Encodes samples like jsonify, one fragment at a time.
+
+        Arrays are converted to Python lists a chunk at a time and each sample's
+        JSON string is escaped fragment by fragment, so neither the full lists
+        nor the intermediate per-sample strings are held in memory.
+
+        Args:
+            samples: A list of sample objects to be converted, they are not modified.
 
+        Yields:
+            Fragments that join to the string returned by jsonify.
+        """
+        yield '{'
         for i, sample in enumerate(samples):
-            for key in sample.data.keys():
-                """ All traces containing plotable data must contain the fields:
-                    id: Always set to -1, a placeholder value for the frontend to replace.
-                    minmax: The minimum and maximum value in the data array. Used for normalization.
-                                minmax = [min(timestamp_diffs['arr']), max(timestamp_diffs['arr'])]
-                    arr: The data values recorded. These values will be plotted on the y-axis while the
-                            timestamps are plotted on the x-axis.
-                """
-                sample.data[key] = {
-                    'id': -1,
-                    'minmax': [min(sample.data[key]), max(sample.data[key])],
-                    'arr': sample.data[key]
-                }
-
-            temp_dict = {
-                "sensor_name": sample.sensor_name,
-                "sensor_id": sample.sensor_id,
-                "timestamps": sample.timestamps,
-                "timestamp_diffs": {
-                    'id': -1,
-                    'minmax': [min(sample.timestamp_diffs), max(sample.timestamp_diffs)],
-                    'arr': sample.timestamp_diffs
-                },
-                "data": sample.data,
-                "data_len": len(sample.data)
-            }
-
-            if sample.latencies:
-                temp_dict['latencies'] = {
-                    'id': -1,
-                    'minmax': [min(sample.latencies), max(sample.latencies)],
-                    'arr': sample.latencies
-                }
-            ret_dict[i] = json.dumps(temp_dict)
-
-        return json.dumps(ret_dict)
+            yield '%s"%d": "' % (', ' if i else '', i)
+            for fragment in iter_sample_json(sample):
+                # Escape the fragment as part of a JSON string, without the quotes.
+                yield json.dumps(fragment)[1:-1]
+            yield '"'
+        yield '}'
+
+class StreamParser:
+    """StreamParser parses a file that is pushed to it in chunks, e.g. as it is uploaded.
+
+    Complete lines are parsed as soon as they arrive, only the trailing
+    partial line of each chunk is kept until the next one.
+
+    Attributes:
+        parser: The Parser whose format is parsed.
+        bytes_read: The number of bytes fed so far.
+        points: The number of points parsed so far, safe to read from other threads.
+        samples: A dict of the Samples by sensor_id, None until the header is read.
+        layout: The layout of the file returned by Parser.read_layout, once
+            the header is read.
+    """
+
+    def __init__(self, parser: Parser):
+        self.parser = parser
+        self.bytes_read = 0
+        self.points = 0
+        self.samples = None
+        self.layout = None
+        self.pending = bytearray()
+
+    def feed(self, data: bytes):
+        """Parses every line completed by data."""
+        self.bytes_read += len(data)
+        self.pending += data
+        end = self.parser.records_end(self.pending, self.samples is None, self.layout)
+        if end:
+            self.read(end)
+
+    def close(self) -> list:
+        """Parses the last line, which may lack a newline, and returns the finalized Samples."""
+        self.read(len(self.pending), last=True)
+        for sample in self.samples.values():
+            sample.finalize()
+        return list(self.samples.values())
+
+    def read(self, end: int, last=False):
+        """Parses the lines in pending[:end] and removes them from pending."""
+        start = 0
+        if self.samples is None:
+            head = bytes(self.pending[:end])
+            headers, start = self.parser.read_headers(head)
+            if start == end and not last:
+                # The next chunk may hold more header lines.
+                return
+            self.layout = self.parser.read_layout(head)
+            self.samples = new_samples(headers)
+
+        self.parser.read_buffer(self.pending, start, end, self.samples, self.layout)
+        del self.pending[:end]
+        self.points = sum(sample.next_index for sample in self.samples.values())
+
+def field_regexes(fields: list):
+    """Generates the regexes of a line-based format from one declaration of its body fields.
+
+    Args:
+        fields: (name, prefix, pattern, optional) tuples in the order the fields
+            appear in a line. name is a key of the Parser regex dict, prefix the
+            literal text preceding the value and pattern a regex matching the
+            value, without capturing groups.
+
+    Returns:
+        A tuple of the per-field regex dict and the fused line_regex matching
+        every field in one scan, see Parser.
+    """
+    regex, line_regex = {}, ""
+    for name, prefix, pattern, optional in fields:
+        regex[name] = "(?<=%s)%s" % (re.escape(prefix), pattern)
+        field = "%s%s(?P<%s>%s)" % (".*?" if line_regex else "", re.escape(prefix), name, pattern)
+        line_regex += "(?:%s)?" % field if optional else field
+    return regex, line_regex
+
+# A decimal number, the values of every field of the Google format.
+NUMBER = "[+-]?(?:[0-9]*[.])?[0-9]+"
 
 class GoogleSensorParser(Parser):
     """Implementation of Parser for Google formatted sensor data.
 
     Attributes:
         regex: A dict that defines the Google sensor data format.
+        line_regex: The fused body line regex generated from LINE_FIELDS.
     """
+
+    # The body fields, in the order they are written, see field_regexes.
+    LINE_FIELDS = [
+        ('inline_id', 'Sensor: ', "[+-]?(?:[0-9]*[.])?[0-9]", False),
+        ('timestamp', 'TS: ', NUMBER, False),
+        # A series of space separated numbers.
+        ('data', 'Data: ', "(?:%s\\s)+" % NUMBER, False),
+        ('latency', 'Latency: ', NUMBER, True),
+    ]
+
     def __init__(self, files: list):
         """Inits class with list of files only."""
 
-        self.regex = {}
+        self.regex, self.line_regex = field_regexes(self.LINE_FIELDS)
         # Space separated words preceded by ': ' followed by '. \n'.
         self.regex['sensor_name'] = "(?<=: )[\w\s]+(?=.\n)"
         # A number preceded by 'sensor type '.
-        self.regex['sensor_id'] = "(?<=sensor type )[+-]?([0-9]*[.])?[0-9]+"
-        # A number preceded by 'TS: '.
-        self.regex['timestamp'] = "(?<=TS: )[+-]?([0-9]*[.])?[0-9]+"
-        # Matches a series of space separated numbers preceded by 'Data: '.
-        self.regex['data'] = "(?<=Data: )([+-]?([0-9]*[.])?[0-9]+\s)+"
-        # Matches the number following 'Sensor'.
-        self.regex['inline_id'] = "(?<=Sensor: )[+-]?([0-9]*[.])?[0-9]"
-        # Matches the number following 'Latency: '.
-        self.regex['latency'] = "(?<=Latency: )[+-]?([0-9]*[.])?[0-9]+"
-
-        super().__init__(files, self.regex)
+        self.regex['sensor_id'] = "(?<=sensor type )" + NUMBER
+
+        super().__init__(files, self.regex, self.line_regex)
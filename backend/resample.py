@@ -0,0 +1,147 @@
+"""
+Copyright 2020 Google LLC
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    https://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import numpy as np
+
+from timing import nominal_period
+
+METHODS = ('nearest', 'linear', 'zoh')
+# Number of grid points resampled per vectorized pass, bounding the size of temporaries.
+CHUNK_SIZE = 1 << 20
+# Maximum number of points of a time base, which sets the size of every resampled trace.
+MAX_GRID_POINTS = 1 << 22
+
+def common_timebase(timestamps_list: list, period=None, start=None, end=None,
+                    max_points=MAX_GRID_POINTS) -> np.ndarray:
+    """Builds a uniform time base covering the time range shared by several traces.
+
+    Args:
+        timestamps_list: The sorted timestamps of each trace.
+        period: The spacing of the time base, defaults to the largest nominal
+            period of the traces, so the slowest trace isn't oversampled.
+        start, end: (Optional) Bounds of the time base, default to the range
+            in which every trace has points.
+        max_points: The maximum number of points of the time base.
+
+    Returns:
+        The timestamps of the time base, int64 if start and period are
+        integers, float64 otherwise. Empty if the traces don't overlap.
+
+    Raises:
+        ValueError: period isn't positive, or can't be derived from the traces,
+            or the time base would have more than max_points points.
+    """
+    if start is None:
+        start = max(ts[0] for ts in timestamps_list if len(ts))
+    if end is None:
+        end = min(ts[-1] for ts in timestamps_list if len(ts))
+    if period is None:
+        period = max(nominal_period(np.diff(ts)) for ts in timestamps_list)
+        if float(period).is_integer():
+            period = int(period)
+    if not period > 0:
+        raise ValueError("The period of the time base must be positive")
+    if end < start:
+        return np.empty(0, dtype=np.result_type(start, period))
+    points = int((end - start) // period) + 1
+    if points > max_points:
+        raise ValueError("The time base would have %d points, more than %d" % (points, max_points))
+    return start + period * np.arange(points)
+
+def resample(timestamps: np.ndarray, values: np.ndarray, grid: np.ndarray, method='linear',
+             chunk_size=CHUNK_SIZE) -> np.ndarray:
+    """Resamples a trace, or several traces sharing timestamps, onto another time base.
+
+    The positions of the grid points in timestamps are looked up once per
+    chunk with searchsorted and applied to every row of values.
+
+    Args:
+        timestamps: The timestamps of the trace, sorted first if needed.
+        values: 1-D values of the trace, or a 2-D array with one trace per row.
+        grid: The sorted timestamps to resample at.
+        method: 'nearest' for the value of the closest point, 'linear' to
+            interpolate between the surrounding points, or 'zoh' (zero-order hold)
+            for the value of the last point at or before each grid timestamp.
+        chunk_size: The number of grid points processed per pass.
+
+    Returns:
+        A float64 array with values' leading dimensions and one column per grid
+        point. Grid points outside of the range of timestamps are NaN.
+
+    Raises:
+        ValueError: method isn't one of METHODS or the lengths don't match.
+    """
+    if method not in METHODS:
+        raise ValueError("Unknown resampling method: %s" % method)
+    values = np.asarray(values, dtype=np.float64)
+    if values.shape[-1] != len(timestamps):
+        raise ValueError("timestamps and values have different lengths")
+
+    out = np.full(values.shape[:-1] + (len(grid),), np.nan)
+    if len(timestamps) == 0:
+        return out
+    if np.any(timestamps[1:] < timestamps[:-1]):
+        # Out-of-order points are resampled at their timestamps, not their position in the log.
+        order = np.argsort(timestamps, kind='stable')
+        timestamps, values = timestamps[order], values[..., order]
+
+    # Only grid points inside the trace's range are computed, the rest stay NaN.
+    first = np.searchsorted(grid, timestamps[0], 'left')
+    last = np.searchsorted(grid, timestamps[-1], 'right')
+    for begin in range(first, last, chunk_size):
+        end = min(begin + chunk_size, last)
+        out[..., begin:end] = resample_chunk(timestamps, values, grid[begin:end], method)
+    return out
+
+def resample_chunk(timestamps: np.ndarray, values: np.ndarray, grid: np.ndarray, method: str):
+    """Resamples at grid points that all lie within the range of timestamps."""
+    # right[i] is the first point after grid[i], so right[i] - 1 is at or before it.
+    right = np.searchsorted(timestamps, grid, 'right')
+    left = right - 1
+    if method == 'zoh':
+        return values[..., left]
+
+    right = np.minimum(right, len(timestamps) - 1)
+    t0 = timestamps[left].astype(np.float64)
+    t1 = timestamps[right].astype(np.float64)
+    if method == 'nearest':
+        return values[..., np.where(grid - t0 <= t1 - grid, left, right)]
+
+    span = t1 - t0
+    weight = np.divide(grid - t0, span, out=np.zeros(len(grid)), where=span > 0)
+    return values[..., left] * (1 - weight) + values[..., right] * weight
+
+def align_samples(dataset, samples: list, method='linear', period=None, start=None, end=None):
+    """Resamples every trace of several samples of a Dataset onto one time base.
+
+    Args:
+        dataset: The Dataset holding the samples.
+        samples: The indices of the samples in the upload response.
+        method, period, start, end: See resample and common_timebase.
+
+    Returns:
+        A tuple of the time base and a list with, for each sample, the channel
+        names from Dataset.stack and the resampled matrix with one row per channel.
+
+    Raises:
+        KeyError: No such sample.
+        ValueError: Invalid method or period.
+    """
+    stacks = [dataset.stack(sample) for sample in samples]
+    timestamps = [dataset.samples[int(sample)].timestamps for sample in samples]
+    grid = common_timebase(timestamps, period, start, end)
+    return grid, [(channels, resample(ts, matrix, grid, method))
+                  for ts, (channels, matrix) in zip(timestamps, stacks)]
@@ -15,25 +15,171 @@ limitations under the License.
 """
 
 from flask import Flask
+from flask import Response
+from flask import g
 from flask import request
 
 from flask_cors import CORS
 
+import cProfile
+import hashlib
 import json
 import numpy as np
+import os
+import tempfile
+import threading
+import time
+
+from collections import OrderedDict
+from contextlib import nullcontext
+
+from cache import DatasetCache
+from cache import content_key
+from cache import parser_digest
+
+from compression import Decompressor
+from compression import detect_compression
+
+from datasets import DatasetStore
+
+from formats import DETECT_BYTES
+from formats import FORMATS
+from formats import detect_format
+from formats import parse_all
+from formats import parser_for
+
+from jobs import JobQueue
+from jobs import QueueFull
+from jobs import starmap
+
+from metrics import Metrics
+from metrics import server_timing
 
 from parser import GoogleSensorParser
 from parser import Parser
+from parser import StreamParser
+from parser import iter_sample_json
+from parser import merge_segments
+
+from resample import align_samples
+
+from spectral import sample_spectrum
 
+from stats import StatsCache
+from stats import batch_stats
 from stats import compute_running_avg
 from stats import compute_stdev
 
+from timing import sample_timing
+
+import transport
+
 from werkzeug.utils import secure_filename
 
 app = Flask(__name__)
 #development only. https://flask-cors.readthedocs.io/en/latest/#resource-specific-cors
 CORS(app)
+# When True, uploads are saved to the working directory and parsed from there.
+# Otherwise they are parsed straight from the uploaded stream.
+app.config.setdefault('SAVE_UPLOADS', False)
+
+# Parsed samples of previous uploads, keyed by content_key so that identical
+# uploads are served without reparsing. See /cache for its counters.
+cache = DatasetCache(os.path.join(tempfile.gettempdir(), 'sensors-data-visualizer-cache'))
+
+# Parsed uploads, keyed by the dataset_id returned from /upload, so later
+# requests can refer to them instead of sending the data back.
+datasets = DatasetStore(cache)
+
+# Rolling statistics by (dataset_id, sample, channel, period), so changing one
+# of the /stats periods only recomputes the statistics for that period.
+stats_cache = StatsCache()
+
+# Number of bytes /upload/stream reads from the request body at a time.
+STREAM_CHUNK_BYTES = 1 << 18
+# Number of /upload/stream uploads whose progress is kept for /upload/progress.
+MAX_TRACKED_UPLOADS = 64
+# upload_id: dict of the bytes_read, bytes_total and points of the upload, oldest first.
+uploads = OrderedDict()
+uploads_lock = threading.Lock()
+
+# When True, requests report the time spent in each stage in a Server-Timing
+# header, and timers and counters are aggregated for /metrics.
+app.config.setdefault('METRICS', True)
+# When True, requests with a profile query parameter are run under cProfile,
+# the result is served by /metrics/profiles/<profile_id>.
+app.config.setdefault('ALLOW_PROFILING', False)
+metrics = Metrics()
+
+# Number of processes /upload/multi parses files with, None for one per CPU.
+app.config.setdefault('UPLOAD_WORKERS', None)
+
+# Parse and stats jobs submitted through /jobs, run on a pool of worker processes.
+jobs = JobQueue(max_workers=app.config.setdefault('JOB_WORKERS', None),
+                max_pending=app.config.setdefault('MAX_PENDING_JOBS', 16))
+
+
+def stage(name: str):
+    """Times a stage of the current request, see Metrics.timer. A no-op unless METRICS is set.
+
+    The timer is named <endpoint>.<name>, e.g. upload_file.parse.
+    """
+    if not app.config['METRICS']:
+        return nullcontext()
+    return metrics.timer('%s.%s' % (request.endpoint, name), g.setdefault('timings', []))
+
+def count(name: str, value=1):
+    """Adds value to a /metrics counter, unless METRICS is unset."""
+    if app.config['METRICS']:
+        metrics.count(name, value)
+
+def count_parse(parser, samples: list):
+    """Counts the lines read by parser and the points it parsed, in total and per sensor."""
+    points = 0
+    for sample in samples:
+        count('parse.points.' + sample.sensor_name, len(sample.timestamps))
+        points += len(sample.timestamps)
+    count('parse.lines', parser.lines_read)
+    count('parse.points', points)
+    count('parse.rejected_lines', max(parser.lines_read - points, 0))
 
+def timed_response(name: str, fragments):
+    """Wraps the fragments of a streamed response in Metrics.timed_iter, unless METRICS is unset."""
+    if not app.config['METRICS']:
+        return fragments
+    return metrics.timed_iter(name, fragments)
+
+@app.before_request
+def start_request():
+    """Starts the request's timer, and its profile if one was requested."""
+    if app.config['METRICS']:
+        g.request_start = time.perf_counter()
+    if app.config['ALLOW_PROFILING'] and 'profile' in request.args:
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # Another profiler is already active.
+            return
+        g.profile = profile
+
+@app.after_request
+def finish_request(response):
+    """Adds the Server-Timing and X-Profile-Id headers of the request.
+
+    Streamed response bodies are produced after this runs, so they are only
+    timed in /metrics, see timed_response.
+    """
+    profile = g.pop('profile', None)
+    if profile is not None:
+        profile.disable()
+        response.headers['X-Profile-Id'] = metrics.add_profile(profile)
+
+    if app.config['METRICS'] and 'request_start' in g:
+        elapsed = time.perf_counter() - g.request_start
+        metrics.record('request.' + (request.endpoint or 'unknown'), elapsed)
+        response.headers['Server-Timing'] = server_timing(g.get('timings', []) + [('total', elapsed)])
+    return response
 
 @app.route('/')
 def index():
@@ -46,6 +192,9 @@ def index():
 def upload_file():
     """Handles file uploads and responds with parsed sensor data.
 
+    The format of the file is detected from its first bytes, see formats.parser_for.
+    Compressed files are decompressed while they are parsed.
+
     Attributes:
         request: What was recieved by the POST request. 
         request.files: A list of the uploaded files.
@@ -54,13 +203,254 @@ def upload_file():
         type: The type of data being returned. Set to 'upload'
             so the fronent knows the source of the data being returned.
         data: The data being returned from the sensor parser.
+        dataset_id: The ID under which the parsed samples are kept for /stats
+            and /lod, the content_key of the upload.
+
+        If the request's Accept header prefers transport.MIMETYPE over JSON,
+        the samples are instead returned in the binary format described in
+        transport.iter_binary.
     """
     if request.method == "POST":
         f = request.files['file']
-        f.save(secure_filename(f.filename))
-        
-        samples = GoogleSensorParser([f.filename]).parse_files()
-        return {'type': 'upload', 'data': samples}
+
+        if app.config['SAVE_UPLOADS']:
+            source = secure_filename(f.filename)
+            with stage('save'):
+                f.save(source)
+        else:
+            # Large uploads are spooled to a temporary file which the parser
+            # maps directly, small ones are parsed from memory.
+            source = f.stream
+        count('upload.bytes', request.content_length or 0)
+        parser = parser_for(source, [f.filename])
+
+        with stage('hash'):
+            dataset_id = content_key(source, parser)
+        samples = cache.get(dataset_id)
+        if samples is None:
+            try:
+                with stage('parse'):
+                    samples = parser.parse(source)
+            except ValueError as e:
+                return {'type': 'error', 'message': str(e)}, 400
+            count_parse(parser, samples)
+            with stage('cache'):
+                cache.put(dataset_id, samples)
+
+        with stage('lod'):
+            datasets.add(dataset_id, samples)
+
+        if wants_binary():
+            return Response(timed_response('serialize.binary', transport.iter_binary(samples)),
+                            mimetype=transport.MIMETYPE, headers={'X-Dataset-Id': dataset_id})
+        with stage('serialize'):
+            data = parser.jsonify(samples)
+        count('serialize.json_bytes', len(data))
+        return {'type': 'upload', 'data': data, 'dataset_id': dataset_id}
+
+@app.route('/upload/stream', methods = ['POST'])
+def upload_stream():
+    """Handles file uploads sent as the raw request body, parsing them as they arrive.
+
+    Each chunk of the body is parsed as soon as it is received, so parsing
+    overlaps the upload instead of starting after it. Compressed files, see
+    compression.CODECS, are decompressed chunk by chunk.
+
+    Attributes:
+        request.data: The contents of the file, not form encoded.
+        request.args.upload_id: (Optional) An ID chosen by the client to poll
+            /upload/progress/<upload_id> with while the upload is running.
+
+    Returns: Newline delimited JSON objects, streamed as they are encoded:
+        One object per sample, in the order of /upload's data:
+            type: Set to 'sample'.
+            index: The index of the sample.
+            sample: The sample, in the format documented on parser.Sample.
+        A final object:
+            type: Set to 'upload'.
+            dataset_id: See /upload.
+    """
+    if request.method == "POST":
+        chunks = iter(lambda: request.stream.read(STREAM_CHUNK_BYTES), b'')
+        # The compression is detected from the first chunk. The format is detected
+        # from the first DETECT_BYTES of the decompressed contents, which codecs
+        # such as bz2 only output once a whole block has been received.
+        received = [next(chunks, b'')]
+        codec = detect_compression(received[0])
+        decompressor = Decompressor(codec) if codec is not None else None
+
+        def decompress(chunk):
+            return decompressor.decompress(chunk) if decompressor else chunk
+
+        head = decompress(received[0])
+        while len(head) < DETECT_BYTES:
+            chunk = next(chunks, None)
+            if chunk is None:
+                break
+            received.append(chunk)
+            head += decompress(chunk)
+        parser = FORMATS[detect_format(head)][0]([])
+        stream_parser = StreamParser(parser)
+        digest = parser_digest(parser)
+
+        # Only counters are tracked, so finished uploads don't keep their samples alive.
+        progress = {'bytes_read': 0, 'bytes_total': request.content_length, 'points': 0}
+        upload_id = request.args.get('upload_id')
+        if upload_id is not None:
+            with uploads_lock:
+                uploads[upload_id] = progress
+                while len(uploads) > MAX_TRACKED_UPLOADS:
+                    uploads.popitem(last=False)
+
+        def feed(chunk, data):
+            # Received bytes are counted as sent, like bytes_total, not decompressed.
+            progress['bytes_read'] += len(chunk)
+            digest.update(chunk)
+            stream_parser.feed(data)
+            progress['points'] = stream_parser.points
+
+        # Receiving and parsing overlap, so they are timed as one stage.
+        try:
+            with stage('parse'):
+                feed(b''.join(received), head)
+                for chunk in chunks:
+                    feed(chunk, decompress(chunk))
+                samples = stream_parser.close()
+                progress['points'] = stream_parser.points
+        except ValueError as e:
+            return {'type': 'error', 'message': str(e)}, 400
+        count('upload.bytes', progress['bytes_read'])
+        count_parse(parser, samples)
+
+        dataset_id = digest.hexdigest()
+        if cache.get(dataset_id) is None:
+            with stage('cache'):
+                cache.put(dataset_id, samples)
+        with stage('lod'):
+            datasets.add(dataset_id, samples)
+
+        def generate():
+            for i, sample in enumerate(samples):
+                yield '{"type": "sample", "index": %d, "sample": ' % i
+                yield from iter_sample_json(sample)
+                yield '}\n'
+            yield json.dumps({'type': 'upload', 'dataset_id': dataset_id}) + '\n'
+
+        return Response(timed_response('serialize.ndjson', generate()), mimetype='application/x-ndjson')
+
+@app.route('/upload/multi', methods = ['POST'])
+def upload_files():
+    """Handles uploads of several files, parsed in parallel.
+
+    Each file is parsed in its detected format, files already in the
+    parsed-dataset cache are not parsed again.
+
+    Attributes:
+        request.files.files: The uploaded files.
+        request.form.mode: (Optional) 'merge', the default, if the files are
+            segments of one capture such as rotated logs. The points of each
+            sensor are then merged in timestamp order, see parser.merge_segments.
+            'sessions' if the files are separate captures to compare.
+
+    Returns: Dictionary object for the frontend to consume.
+        In merge mode, the response of /upload for the merged samples,
+        including its binary form. The dataset_id is derived from the
+        dataset_ids of the files, in upload order.
+
+        In sessions mode:
+            type: Set to 'sessions'.
+            sessions: A list with, for each file in upload order:
+                filename: The name of the file.
+                data, dataset_id: See /upload.
+    """
+    if request.method == "POST":
+        files = request.files.getlist('files')
+        mode = request.form.get('mode', 'merge')
+        if not files:
+            return {'type': 'error', 'message': 'No files uploaded'}, 400
+        if mode not in ('merge', 'sessions'):
+            return {'type': 'error', 'message': 'Unknown mode: %s' % mode}, 400
+
+        with tempfile.TemporaryDirectory() as directory:
+            paths, parsers, keys = [], [], []
+            with stage('save'):
+                for i, f in enumerate(files):
+                    # Saved under their index, the uploaded names may clash.
+                    path = os.path.join(directory, str(i))
+                    f.save(path)
+                    paths.append(path)
+                    count('upload.bytes', os.path.getsize(path))
+            with stage('hash'):
+                for path, f in zip(paths, files):
+                    parsers.append(parser_for(path, [f.filename]))
+                    keys.append(content_key(path, parsers[-1]))
+
+            dataset_id = hashlib.sha256(('merge:' + ','.join(keys)).encode()).hexdigest()
+            merged = cache.get(dataset_id) if mode == 'merge' else None
+            if merged is None:
+                segments = [cache.get(key) for key in keys]
+                missing = [i for i, samples in enumerate(segments) if samples is None]
+                try:
+                    with stage('parse'):
+                        parsed = parse_all([paths[i] for i in missing], app.config['UPLOAD_WORKERS'])
+                except ValueError as e:
+                    return {'type': 'error', 'message': str(e)}, 400
+                count('parse.files', len(missing))
+                for i, samples in zip(missing, parsed):
+                    segments[i] = samples
+                    cache.put(keys[i], samples)
+
+        if mode == 'sessions':
+            sessions = []
+            with stage('lod'):
+                for key, samples in zip(keys, segments):
+                    datasets.add(key, samples)
+            with stage('serialize'):
+                for f, parser, key, samples in zip(files, parsers, keys, segments):
+                    sessions.append({'filename': f.filename, 'dataset_id': key,
+                                     'data': parser.jsonify(samples)})
+            return {'type': 'sessions', 'sessions': sessions}
+
+        if merged is None:
+            try:
+                with stage('merge'):
+                    merged = merge_segments(segments)
+            except ValueError as e:
+                return {'type': 'error', 'message': str(e)}, 400
+            cache.put(dataset_id, merged)
+        with stage('lod'):
+            datasets.add(dataset_id, merged)
+
+        if wants_binary():
+            return Response(timed_response('serialize.binary', transport.iter_binary(merged)),
+                            mimetype=transport.MIMETYPE, headers={'X-Dataset-Id': dataset_id})
+        with stage('serialize'):
+            data = parsers[0].jsonify(merged)
+        count('serialize.json_bytes', len(data))
+        return {'type': 'upload', 'data': data, 'dataset_id': dataset_id}
+
+@app.route('/upload/progress/<upload_id>', methods = ['GET'])
+def upload_progress(upload_id):
+    """Handles polling for the progress of an /upload/stream upload.
+
+    Returns: Dictionary object for the frontend to consume.
+        type: The type of data being returned. Set to 'progress'.
+        bytes_read: The number of bytes of the upload received and parsed,
+            before decompression like bytes_total.
+        bytes_total: The size of the upload, null if the client didn't send it.
+        points: The number of points parsed.
+    """
+    with uploads_lock:
+        progress = uploads.get(upload_id)
+    if progress is None:
+        return {'type': 'error', 'message': 'Unknown upload'}, 404
+    return dict(progress, type='progress')
+
+def wants_binary() -> bool:
+    """Checks if the request's Accept header prefers the binary sample transport over JSON."""
+    # JSON is listed first so that it wins for wildcard and missing Accept headers.
+    best = request.accept_mimetypes.best_match(['application/json', transport.MIMETYPE])
+    return best == transport.MIMETYPE
 
 @app.route('/stats', methods = ['POST'])
 def compute_stats():
@@ -69,8 +459,12 @@ def compute_stats():
 
     Attributes:
         request.data: The data sent from the frontend.
-        request.data.channels: Key value pairs of channels and arrays
-            to compute statistics for.
+        request.data.dataset_id: The ID returned by /upload.
+        request.data.sample: The index of the sample in the upload response.
+        request.data.channels: A list of the channels of the sample to compute
+            statistics for, data channel keys or 'timestamp_diffs' or 'latencies'.
+            Without a dataset_id, key value pairs of channels and arrays instead.
+        request.data.avg_period, request.data.stdev_period: The rolling window sizes.
         
     Returns: Dictionary object for the frontend to consume.
         type: The type of data being returned. Set to 'upload'
@@ -82,13 +476,497 @@ def compute_stats():
         received = json.loads(request.data)
         avgs, stdevs = {}, {}
 
+        required = ['channels', 'avg_period', 'stdev_period']
+        if 'dataset_id' in received:
+            required.append('sample')
+        missing = [field for field in required if field not in received]
+        if missing:
+            return {'type': 'error', 'message': 'Missing field: %s' % missing[0]}, 400
+
         stdev_period = received['stdev_period']
         avg_period = received['avg_period']
-        for i, j in enumerate(received['channels']):
-            avgs[j] = compute_running_avg(received['channels'][j], avg_period)
-            stdevs[j] = compute_stdev(received['channels'][j], avgs[j], stdev_period)
+
+        if 'dataset_id' not in received:
+            for i, j in enumerate(received['channels']):
+                avgs[j] = compute_running_avg(received['channels'][j], avg_period)
+                stdevs[j] = compute_stdev(received['channels'][j], avgs[j], stdev_period)
+            return {'type': 'stats', 'avgs': avgs, 'stdevs': stdevs}
+
+        dataset = datasets.get(received['dataset_id'])
+        if dataset is None:
+            return {'type': 'error', 'message': 'Unknown dataset'}, 404
+
+        sample = int(received['sample'])
+        for channel in received['channels']:
+            try:
+                _, values = dataset.channel(sample, channel)
+            except KeyError as e:
+                return {'type': 'error', 'message': e.args[0]}, 404
+
+            key = (dataset.dataset_id, sample, channel)
+            with stage('stats'):
+                avg = stats_cache.get(key + (avg_period,), values, avg_period)
+                stdev = stats_cache.get(key + (stdev_period,), values, stdev_period)
+            with stage('serialize'):
+                avgs[channel] = avg.means.tolist()
+                stdevs[channel] = stdev.stdevs.tolist()
 
         return {'type': 'stats', 'avgs': avgs, 'stdevs': stdevs}
 
+@app.route('/stats/batch', methods = ['POST'])
+def compute_batch_stats():
+    """Handles requests for the stats of every channel of one or more samples.
+
+    All channels of a sample are stacked and computed with one vectorized call
+    per statistic.
+
+    Attributes:
+        request.data: The data sent from the frontend.
+        request.data.dataset_id: The ID returned by /upload.
+        request.data.samples: (Optional) The indices of the samples in the upload
+            response. Defaults to every sample.
+        request.data.avg_period, request.data.stdev_period: The rolling window sizes.
+        request.data.percentiles: (Optional) The percentiles to compute, defaults to [5, 50, 95].
+
+    Returns: Dictionary object for the frontend to consume.
+        type: The type of data being returned. Set to 'batch_stats'.
+        samples: A list with, for each requested sample:
+            sample: The index of the sample.
+            sensor_name, sensor_id: The sensor of the sample.
+            channels: The channel names, the order of every per-channel value below.
+            percentiles: The computed percentiles.
+            min, max, mean, rms: One value per channel.
+            percentile_values: One list per percentile, one value per channel.
+            avgs, stdevs: One list of rolling statistics per channel.
+
+        If the request's Accept header prefers transport.MIMETYPE over JSON,
+        the same object is returned in the format of transport.iter_arrays.
+    """
+    if request.method == "POST":
+        received = json.loads(request.data)
+        dataset = datasets.get(received['dataset_id'])
+        if dataset is None:
+            return {'type': 'error', 'message': 'Unknown dataset'}, 404
+
+        avg_period = received['avg_period']
+        stdev_period = received['stdev_period']
+        percentiles = tuple(received.get('percentiles', (5, 50, 95)))
+        if not valid_percentiles(percentiles):
+            return {'type': 'error', 'message': 'Percentiles must be between 0 and 100'}, 400
+
+        results = []
+        for sample in received.get('samples', range(len(dataset.samples))):
+            try:
+                channels = dataset.channels(sample)
+                # Stacked only when not memoized, the stack copies every channel.
+                with stage('stats'):
+                    computed = dataset.memoize(
+                        ('batch_stats', int(sample), avg_period, stdev_period, percentiles),
+                        lambda: batch_stats(dataset.stack(sample)[1], avg_period, stdev_period, percentiles))
+            except KeyError as e:
+                return {'type': 'error', 'message': e.args[0]}, 404
+            except ValueError as e:
+                return {'type': 'error', 'message': str(e)}, 400
+            results.append(batch_stats_entry(dataset, int(sample), channels, percentiles, computed))
+
+        response = {'type': 'batch_stats', 'samples': results}
+        if wants_binary():
+            return Response(transport.iter_arrays(response), mimetype=transport.MIMETYPE)
+        return transport.to_lists(response)
+
+def valid_percentiles(percentiles) -> bool:
+    """Returns whether percentiles is a sequence of numbers between 0 and 100."""
+    return all(isinstance(percentile, (int, float)) and not isinstance(percentile, bool)
+               and 0 <= percentile <= 100 for percentile in percentiles)
+
+def batch_stats_entry(dataset, sample: int, channels: list, percentiles: tuple, computed: dict) -> dict:
+    """Returns the /stats/batch response entry of a sample from the batch_stats result."""
+    return {
+        'sample': sample,
+        'sensor_name': dataset.samples[sample].sensor_name,
+        'sensor_id': dataset.samples[sample].sensor_id,
+        'channels': channels,
+        'percentiles': list(percentiles),
+        'min': computed['min'],
+        'max': computed['max'],
+        'mean': computed['mean'],
+        'rms': computed['rms'],
+        'percentile_values': computed['percentiles'],
+        'avgs': computed['avgs'],
+        'stdevs': computed['stdevs']
+    }
+
+@app.route('/timing', methods = ['POST'])
+def timing():
+    """Handles requests for sampling rate and timestamp jitter summaries.
+
+    Attributes:
+        request.data: The data sent from the frontend.
+        request.data.dataset_id: The ID returned by /upload.
+        request.data.samples: (Optional) The indices of the samples in the upload
+            response. Defaults to every sample.
+        request.data.gap_factor: (Optional) Timestamp differences larger than
+            gap_factor times the nominal period are gaps, defaults to 1.5.
+        request.data.bins: (Optional) The number of jitter histogram bins, defaults to 32.
+        request.data.percentiles: (Optional) The latency percentiles to compute.
+
+    Returns: Dictionary object for the frontend to consume.
+        type: The type of data being returned. Set to 'timing'.
+        samples: A list with, for each requested sample, its index as sample,
+            sensor_name, sensor_id and the fields of timing.timing_summary.
+    """
+    if request.method == "POST":
+        received = json.loads(request.data)
+        dataset = datasets.get(received['dataset_id'])
+        if dataset is None:
+            return {'type': 'error', 'message': 'Unknown dataset'}, 404
+
+        try:
+            options = {'gap_factor': float(received.get('gap_factor', 1.5)),
+                       'bins': int(received.get('bins', 32))}
+            if 'percentiles' in received:
+                options['percentiles'] = tuple(received['percentiles'])
+        except (TypeError, ValueError) as e:
+            return {'type': 'error', 'message': str(e)}, 400
+
+        results = []
+        for sample in received.get('samples', range(len(dataset.samples))):
+            sample = int(sample)
+            if not 0 <= sample < len(dataset.samples):
+                return {'type': 'error', 'message': 'Unknown sample: %d' % sample}, 404
+
+            try:
+                summary = dataset.memoize(
+                    ('timing', sample) + tuple(sorted(options.items())),
+                    lambda: sample_timing(dataset.samples[sample], **options))
+            except (TypeError, ValueError) as e:
+                return {'type': 'error', 'message': str(e)}, 400
+            results.append(dict(summary, sample=sample,
+                                sensor_name=dataset.samples[sample].sensor_name,
+                                sensor_id=dataset.samples[sample].sensor_id))
+
+        return {'type': 'timing', 'samples': results}
+
+@app.route('/resample', methods = ['POST'])
+def resample_samples():
+    """Handles requests for samples resampled onto a common time base.
+
+    Attributes:
+        request.data: The data sent from the frontend.
+        request.data.dataset_id: The ID returned by /upload.
+        request.data.samples: The indices of the samples in the upload response.
+        request.data.method: (Optional) 'nearest', 'linear' or 'zoh', defaults to 'linear'.
+        request.data.period: (Optional) The spacing of the time base, defaults
+            to the largest nominal period of the samples.
+        request.data.start, request.data.end: (Optional) The range of the time
+            base, defaults to the range covered by every sample. Time bases of
+            more than resample.MAX_GRID_POINTS points are rejected.
+
+    Returns: Dictionary object for the frontend to consume.
+        type: The type of data being returned. Set to 'resample'.
+        timestamps: The common time base.
+        samples: A list with, for each requested sample:
+            sample: The index of the sample.
+            sensor_name, sensor_id: The sensor of the sample.
+            channels: The channel names, the order of data.
+            data: One list of values per channel, null (NaN in the binary
+                format) outside of the sample's time range.
+
+        If the request's Accept header prefers transport.MIMETYPE over JSON,
+        the same object is returned in the format of transport.iter_arrays.
+    """
+    if request.method == "POST":
+        received = json.loads(request.data)
+        dataset = datasets.get(received['dataset_id'])
+        if dataset is None:
+            return {'type': 'error', 'message': 'Unknown dataset'}, 404
+
+        samples = [int(sample) for sample in received['samples']]
+        options = {key: received.get(key) for key in ('period', 'start', 'end')}
+        options['method'] = received.get('method', 'linear')
+        try:
+            grid, resampled = dataset.memoize(
+                ('resample', tuple(samples)) + tuple(sorted(options.items())),
+                lambda: align_samples(dataset, samples, **options))
+        except KeyError as e:
+            return {'type': 'error', 'message': e.args[0]}, 404
+        except ValueError as e:
+            return {'type': 'error', 'message': str(e)}, 400
+
+        response = {'type': 'resample', 'timestamps': grid, 'samples': [{
+            'sample': sample,
+            'sensor_name': dataset.samples[sample].sensor_name,
+            'sensor_id': dataset.samples[sample].sensor_id,
+            'channels': channels,
+            'data': matrix
+        } for sample, (channels, matrix) in zip(samples, resampled)]}
+
+        if wants_binary():
+            return Response(transport.iter_arrays(response), mimetype=transport.MIMETYPE)
+        # JSON has no NaN, points outside of a sample's range are sent as null.
+        for entry in response['samples']:
+            entry['data'] = np.where(np.isnan(entry['data']), None, entry['data'])
+        return transport.to_lists(response)
+
+@app.route('/spectrum', methods = ['POST'])
+def compute_spectrum():
+    """Handles requests for the frequency spectra of the channels of one sample.
+
+    The spectra of every channel of the sample are computed in one batch and
+    memoized per parameter set, so later requests for any of its channels
+    are answered from memory.
+
+    Attributes:
+        request.data: The data sent from the frontend.
+        request.data.dataset_id: The ID returned by /upload.
+        request.data.sample: The index of the sample in the upload response.
+        request.data.channels: (Optional) The channels to return, as in /stats.
+            Defaults to the data channels.
+        request.data.method: (Optional) 'fft', 'welch' or 'stft', defaults to 'welch'.
+        request.data.segment, request.data.overlap, request.data.period,
+        request.data.time_unit, request.data.max_points, request.data.max_frames:
+            (Optional) See spectral.spectrum.
+
+    Returns: Dictionary object for the frontend to consume.
+        type: The type of data being returned. Set to 'spectrum'.
+        method, sample_rate, frequency_unit, resampled, frequencies, times (stft only):
+            See spectral.spectrum. Frequencies are per timestamp unit unless
+            the request sets time_unit.
+        channels: The returned channel names, the order of values.
+        values: One spectrum per channel, for 'stft' one list per frame.
+
+        If the request's Accept header prefers transport.MIMETYPE over JSON,
+        the same object is returned in the format of transport.iter_arrays.
+    """
+    if request.method == "POST":
+        received = json.loads(request.data)
+        dataset = datasets.get(received['dataset_id'])
+        if dataset is None:
+            return {'type': 'error', 'message': 'Unknown dataset'}, 404
+
+        sample = int(received['sample'])
+        options = {key: received[key] for key in
+                   ('method', 'segment', 'overlap', 'period', 'time_unit', 'max_points', 'max_frames')
+                   if key in received}
+        try:
+            with stage('spectrum'):
+                channels, result = dataset.memoize(
+                    ('spectrum', sample) + tuple(sorted(options.items())),
+                    lambda: sample_spectrum(dataset, sample, **options))
+        except KeyError as e:
+            return {'type': 'error', 'message': e.args[0]}, 404
+        except ValueError as e:
+            return {'type': 'error', 'message': str(e)}, 400
+
+        requested = [str(channel) for channel in
+                     received.get('channels', dataset.samples[sample].data)]
+        unknown = [channel for channel in requested if channel not in channels]
+        if unknown:
+            return {'type': 'error', 'message': 'Unknown channel: %s' % unknown[0]}, 404
+
+        response = dict(result, type='spectrum', channels=requested,
+                        values=result['values'][[channels.index(channel) for channel in requested]])
+        if wants_binary():
+            return Response(transport.iter_arrays(response), mimetype=transport.MIMETYPE)
+        return transport.to_lists(response)
+
+@app.route('/cache', methods = ['GET'])
+def cache_stats():
+    """Responds with the hit/miss counters and sizes of the parsed-dataset cache.
+
+    Returns: Dictionary object with type 'cache' and the fields of DatasetCache.stats.
+    """
+    return dict(type='cache', **cache.stats())
+
+@app.route('/metrics', methods = ['GET'])
+def metrics_snapshot():
+    """Responds with the timers and counters aggregated since the server started.
+
+    Timers include request.<endpoint> for the handling time of every endpoint,
+    and the stages reported in Server-Timing headers. Counters include the
+    bytes uploaded, the lines and points parsed, also per sensor, and the bytes
+    of serialized responses.
+
+    Returns: Dictionary object with type 'metrics' and the fields of Metrics.snapshot.
+    """
+    return dict(type='metrics', **metrics.snapshot())
+
+@app.route('/metrics/profiles/<profile_id>', methods = ['GET'])
+def profile_stats(profile_id):
+    """Responds with the profile of a request made with the profile query parameter.
+
+    Returns: Dictionary object for the frontend to consume.
+        type: Set to 'profile'.
+        stats: The pstats table of the request, sorted by cumulative time.
+    """
+    stats = metrics.profile(profile_id)
+    if stats is None:
+        return {'type': 'error', 'message': 'Unknown profile'}, 404
+    return {'type': 'profile', 'stats': stats}
+
+@app.route('/lod', methods = ['POST'])
+def level_of_detail():
+    """Handles requests for a downsampled view of one trace of an uploaded dataset.
+
+    Attributes:
+        request.data: The data sent from the frontend.
+        request.data.dataset_id: The ID returned by /upload.
+        request.data.sample: The index of the sample in the upload response.
+        request.data.channel: The trace to view, a data channel key or
+            'timestamp_diffs' or 'latencies'.
+        request.data.start, request.data.end: (Optional) The visible time range.
+        request.data.width: The width of the plot in pixels.
+
+    Returns: Dictionary object for the frontend to consume.
+        type: The type of data being returned. Set to 'lod'.
+        timestamps: The timestamps of the selected points.
+        arr: The values of the selected points, at most two per pixel.
+        level: The pyramid level the points were selected from, 0 for raw data.
+    """
+    if request.method == "POST":
+        received = json.loads(request.data)
+        dataset = datasets.get(received['dataset_id'])
+        if dataset is None:
+            return {'type': 'error', 'message': 'Unknown dataset'}, 404
+        try:
+            pyramid = dataset.pyramid(received['sample'], received['channel'])
+        except KeyError as e:
+            return {'type': 'error', 'message': e.args[0]}, 404
+
+        indices, level = pyramid.query(received.get('start'), received.get('end'),
+                                       received.get('width', 1000))
+        return {
+            'type': 'lod',
+            'timestamps': pyramid.timestamps[indices].tolist(),
+            'arr': pyramid.values[indices].tolist(),
+            'level': level
+        }
+
+@app.route('/jobs/parse', methods = ['POST'])
+def submit_parse_job():
+    """Handles file uploads by parsing them in a background job.
+
+    Attributes:
+        request.files: A list of the uploaded files, see /upload.
+
+    Returns: Dictionary object for the frontend to consume, with status 202.
+        type: The type of data being returned. Set to 'job'.
+        job_id, kind, status: See /jobs/<job_id>.
+
+        Responds with status 503 if too many jobs are pending.
+    """
+    if request.method == "POST":
+        f = request.files['file']
+        # Workers parse from a file, so the upload is saved until the job finishes.
+        handle, path = tempfile.mkstemp(suffix='.upload')
+        os.close(handle)
+        f.save(path)
+        parser = parser_for(path, [f.filename])
+
+        dataset_id = content_key(path, parser)
+        samples = cache.get(dataset_id)
+        if samples is not None:
+            os.remove(path)
+            datasets.add(dataset_id, samples)
+            job = jobs.add_result('parse', dataset_id)
+            return dict(job.to_dict(), type='job'), 202
+
+        def store(samples):
+            cache.put(dataset_id, samples)
+            datasets.add(dataset_id, samples)
+            return dataset_id
+
+        try:
+            job = jobs.submit('parse', parser.parse, path, on_done=store,
+                              cleanup=lambda: os.remove(path))
+        except QueueFull as e:
+            os.remove(path)
+            return {'type': 'error', 'message': str(e)}, 503
+        return dict(job.to_dict(), type='job'), 202
+
+@app.route('/jobs/stats', methods = ['POST'])
+def submit_stats_job():
+    """Handles requests for /stats/batch statistics computed in a background job.
+
+    Attributes:
+        request.data: The same fields as for /stats/batch.
+
+    Returns: Dictionary object for the frontend to consume, with status 202.
+        type: The type of data being returned. Set to 'job'.
+        job_id, kind, status: See /jobs/<job_id>.
+
+        Responds with status 503 if too many jobs are pending.
+    """
+    if request.method == "POST":
+        received = json.loads(request.data)
+        dataset = datasets.get(received['dataset_id'])
+        if dataset is None:
+            return {'type': 'error', 'message': 'Unknown dataset'}, 404
+
+        avg_period = received['avg_period']
+        stdev_period = received['stdev_period']
+        percentiles = tuple(received.get('percentiles', (5, 50, 95)))
+        if not valid_percentiles(percentiles):
+            return {'type': 'error', 'message': 'Percentiles must be between 0 and 100'}, 400
+
+        stacks = []
+        for sample in received.get('samples', range(len(dataset.samples))):
+            try:
+                stacks.append((int(sample),) + dataset.stack(sample))
+            except KeyError:
+                return {'type': 'error', 'message': 'Unknown sample: %s' % sample}, 404
+
+        def respond(results):
+            entries = []
+            for (sample, channels, _), computed in zip(stacks, results):
+                computed = dataset.memoize(
+                    ('batch_stats', sample, avg_period, stdev_period, percentiles), lambda: computed)
+                entries.append(batch_stats_entry(dataset, sample, channels, percentiles, computed))
+            return transport.to_lists({'type': 'batch_stats', 'samples': entries})
+
+        arguments = [(matrix, avg_period, stdev_period, percentiles) for _, _, matrix in stacks]
+        try:
+            job = jobs.submit('stats', starmap, batch_stats, arguments, on_done=respond)
+        except QueueFull as e:
+            return {'type': 'error', 'message': str(e)}, 503
+        return dict(job.to_dict(), type='job'), 202
+
+@app.route('/jobs/<job_id>', methods = ['GET', 'DELETE'])
+def job_status(job_id):
+    """Handles polling for and cancelling background jobs.
+
+    DELETE cancels the job: queued jobs never run, running jobs finish in
+    their worker but their result is discarded.
+
+    Returns: Dictionary object for the frontend to consume.
+        type: The type of data being returned. Set to 'job'.
+        job_id: The ID returned when the job was submitted.
+        kind: 'parse' or 'stats'.
+        status: 'queued', 'running', 'done', 'failed' or 'cancelled'.
+        error: The reason a failed job failed.
+        result: Once a job is done, for parse jobs the /upload response and
+            for stats jobs the /stats/batch response. Not sent for DELETE.
+    """
+    if request.method == "DELETE":
+        job = jobs.cancel(job_id)
+    else:
+        job = jobs.get(job_id)
+    if job is None:
+        return {'type': 'error', 'message': 'Unknown job'}, 404
+
+    response = dict(job.to_dict(), type='job')
+    if request.method == "DELETE":
+        return response
+    if job.status == 'done' and job.kind == 'parse':
+        dataset = datasets.get(job.result)
+        if dataset is None:
+            return {'type': 'error', 'message': 'Unknown dataset'}, 404
+        parser = GoogleSensorParser([])
+        response['result'] = {'type': 'upload', 'data': parser.jsonify(dataset.samples),
+                              'dataset_id': dataset.dataset_id}
+    elif job.status == 'done':
+        response['result'] = job.result
+    return response
+
 if __name__ == '__main__':
     app.run(debug=True)
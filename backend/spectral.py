@@ -0,0 +1,206 @@
+"""
+Copyright 2020 Google LLC
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    https://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import numpy as np
+
+from numpy.lib.stride_tricks import sliding_window_view
+
+from resample import common_timebase
+from resample import resample
+from timing import nominal_period
+
+METHODS = ('fft', 'welch', 'stft')
+# Largest relative deviation of a timestamp difference from the nominal
+# period for a trace to be used as uniformly sampled without resampling.
+UNIFORM_TOLERANCE = 0.01
+# Default number of frequency bins and spectrogram frames returned for display.
+MAX_POINTS = 1024
+MAX_FRAMES = 256
+# Minimum number of points of a trace or segment, a Hann window of fewer points is all zeros.
+MIN_POINTS = 3
+# Number of segments transformed per vectorized pass, bounding the size of temporaries.
+FRAME_BLOCK = 1024
+
+def uniform_matrix(timestamps: np.ndarray, matrix: np.ndarray, period=None):
+    """Returns traces sampled on a uniform time base, resampling them only if needed.
+
+    Args:
+        timestamps: The timestamps shared by the rows of matrix.
+        matrix: One trace per row.
+        period: (Optional) The spacing of the time base, defaults to the nominal
+            period of timestamps. Traces are resampled whenever it is given.
+
+    Returns:
+        A tuple of the first timestamp, the period, the uniformly sampled
+        matrix and whether it was resampled.
+
+    Raises:
+        ValueError: There are fewer than MIN_POINTS points, or no period.
+    """
+    if len(timestamps) < MIN_POINTS:
+        raise ValueError("Spectra need at least %d points" % MIN_POINTS)
+    diffs = np.diff(timestamps).astype(np.float64)
+    nominal = nominal_period(diffs)
+    if period is None:
+        if not nominal:
+            raise ValueError("The timestamps have no positive differences")
+        if np.all(np.abs(diffs - nominal) <= UNIFORM_TOLERANCE * nominal):
+            return timestamps[0], nominal, matrix, False
+        period = nominal
+
+    grid = common_timebase([np.sort(timestamps)], period)
+    return grid[0], float(period), resample(timestamps, matrix, grid, 'linear'), True
+
+def segment_starts(length: int, segment: int, overlap: float) -> np.ndarray:
+    """Returns the start indices of the segments of a trace, see spectrum for the arguments."""
+    if not 0 <= overlap < 1:
+        raise ValueError("overlap must be in [0, 1)")
+    step = max(int(segment * (1 - overlap)), 1)
+    return np.arange(0, length - segment + 1, step)
+
+def mean_power(windows: np.ndarray, starts: np.ndarray, window: np.ndarray) -> np.ndarray:
+    """Averages the power spectra of the segments of every trace starting at starts.
+
+    Args:
+        windows: The sliding_window_view of the traces, with one row per trace.
+        starts: The start indices of the segments to average.
+        window: The window function applied to every segment.
+
+    Returns:
+        An array with one row per trace and one column per frequency bin.
+    """
+    total = 0.0
+    for block in range(0, len(starts), FRAME_BLOCK):
+        frames = windows[:, starts[block:block + FRAME_BLOCK]]
+        frames = frames - frames.mean(axis=-1, keepdims=True)
+        total = total + (np.abs(np.fft.rfft(frames * window, axis=-1)) ** 2).sum(axis=1)
+    return total / len(starts)
+
+def downsample_bins(frequencies: np.ndarray, values: np.ndarray, max_points: int):
+    """Reduces the frequency bins of values to at most max_points.
+
+    Groups of adjacent bins are replaced by their largest value, so narrow
+    peaks stay visible, at the mean frequency of the group.
+
+    Returns:
+        A tuple of the frequencies and the values, bins along the last axis.
+    """
+    count = len(frequencies)
+    if count <= max_points:
+        return frequencies, values
+    edges = np.unique(np.linspace(0, count, max_points + 1).astype(np.int64))
+    return (np.add.reduceat(frequencies, edges[:-1]) / np.diff(edges),
+            np.maximum.reduceat(values, edges[:-1], axis=-1))
+
+def spectrum(timestamps: np.ndarray, matrix: np.ndarray, method='welch', segment=256, overlap=0.5,
+             period=None, time_unit=None, max_points=MAX_POINTS, max_frames=MAX_FRAMES) -> dict:
+    """Computes the spectra of several traces sharing timestamps, all rows at once.
+
+    Irregularly sampled traces are first resampled onto a uniform time base,
+    see uniform_matrix. Every segment is detrended by its mean and weighted
+    with a Hann window.
+
+    Args:
+        timestamps: The timestamps shared by the rows of matrix.
+        matrix: One trace per row.
+        method: 'fft' for the amplitude spectrum of the whole trace, 'welch'
+            for the power spectral density averaged over segments, or 'stft'
+            for a spectrogram of the amplitude of each segment.
+        segment: The number of points per segment for 'welch' and 'stft',
+            at most the length of the traces and at least MIN_POINTS.
+        overlap: The fraction by which consecutive segments overlap.
+        period: (Optional) The sampling period to resample to, see uniform_matrix.
+        time_unit: (Optional) The length of one timestamp unit in seconds, e.g.
+            1e-9 for nanoseconds, so frequencies are in Hz. Log formats don't
+            declare the unit of their timestamps, so by default frequencies
+            are in cycles per timestamp unit.
+        max_points: The maximum number of frequency bins returned, see downsample_bins.
+        max_frames: The maximum number of spectrogram frames returned. Consecutive
+            segments are averaged into each frame.
+
+    Returns:
+        A dict of:
+            method: The method.
+            sample_rate: The sampling rate of the uniform traces, in frequency_unit.
+            frequency_unit: 'Hz' if time_unit is given, otherwise
+                'per timestamp unit'.
+            resampled: Whether the traces were resampled.
+            frequencies: The frequency of each bin, in frequency_unit.
+            values: One spectrum per row of matrix, for 'stft' one row per frame.
+                Amplitudes in the unit of the traces for 'fft' and 'stft',
+                power per frequency_unit for 'welch'.
+            times: For 'stft', the timestamp at the middle of each frame.
+
+    Raises:
+        ValueError: Invalid method, segment or overlap, or too few points.
+    """
+    if method not in METHODS:
+        raise ValueError("Unknown method: %s" % method)
+    start, period, matrix, resampled = uniform_matrix(timestamps, np.atleast_2d(matrix), period)
+    length = matrix.shape[-1]
+    if length < MIN_POINTS:
+        raise ValueError("Spectra need at least %d points" % MIN_POINTS)
+    sample_rate = 1 / (period * (time_unit or 1.0))
+    result = {'method': method, 'sample_rate': sample_rate,
+              'frequency_unit': 'Hz' if time_unit else 'per timestamp unit', 'resampled': resampled}
+
+    if method == 'fft':
+        window = np.hanning(length)
+        centered = matrix - matrix.mean(axis=-1, keepdims=True)
+        values = np.abs(np.fft.rfft(centered * window, axis=-1)) * (2 / window.sum())
+        values[:, 0] /= 2
+        frequencies = np.fft.rfftfreq(length, 1 / sample_rate)
+        result['frequencies'], result['values'] = downsample_bins(frequencies, values, max_points)
+        return result
+
+    segment = min(int(segment), length)
+    if segment < MIN_POINTS:
+        raise ValueError("segment must be at least %d" % MIN_POINTS)
+    window = np.hanning(segment)
+    windows = sliding_window_view(matrix, segment, axis=-1)
+    starts = segment_starts(length, segment, overlap)
+    frequencies = np.fft.rfftfreq(segment, 1 / sample_rate)
+
+    if method == 'welch':
+        # One-sided density: every bin but DC and Nyquist holds the power of two.
+        values = mean_power(windows, starts, window) * (2 / (sample_rate * (window ** 2).sum()))
+        values[:, 0] /= 2
+        if segment % 2 == 0:
+            values[:, -1] /= 2
+        result['frequencies'], result['values'] = downsample_bins(frequencies, values, max_points)
+        return result
+
+    groups = np.array_split(starts, min(max_frames, len(starts)))
+    # Amplitudes of the power averaged over the segments of each frame, frames along axis 1.
+    values = np.stack([np.sqrt(mean_power(windows, group, window)) for group in groups], axis=1)
+    values *= 2 / window.sum()
+    values[..., 0] /= 2
+    result['times'] = np.array([start + (group.mean() + segment / 2) * period for group in groups])
+    result['frequencies'], result['values'] = downsample_bins(frequencies, values, max_points)
+    return result
+
+def sample_spectrum(dataset, sample: int, **kwargs):
+    """Computes the spectrum of every trace of a sample of a Dataset, see spectrum for kwargs.
+
+    Returns:
+        A tuple of the channel names from Dataset.stack and the spectrum result.
+
+    Raises:
+        KeyError: No such sample.
+        ValueError: See spectrum.
+    """
+    channels, matrix = dataset.stack(sample)
+    return channels, spectrum(dataset.samples[int(sample)].timestamps, matrix, **kwargs)
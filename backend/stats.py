@@ -14,8 +14,219 @@ See the License for the specific language governing permissions and
 limitations under the License.
 """
 
+import threading
+
+from collections import OrderedDict
+
 import numpy as np
-import pandas as pd
+
+from parser import Column
+
+# Number of new points RollingStats.extend processes per vectorized pass. Sums
+# are accumulated per block, which bounds their rounding error.
+BLOCK_SIZE = 1 << 16
+
+class RollingStats:
+    """RollingStats holds the rolling mean and standard deviation of a growing trace.
+
+    The window at each point covers it and up to period - 1 previous points,
+    matching pandas' rolling(period, min_periods=1). Both statistics are
+    computed together from running sums over each block of new points, so
+    appending points only costs work proportional to the new points.
+
+    Attributes:
+        period: The size of the window.
+        means: np.ndarray - The rolling mean at each point.
+        stdevs: np.ndarray - The rolling sample standard deviation at each point,
+            0 where the window holds a single point.
+    """
+
+    def __init__(self, period: int):
+        """Initializes empty statistics.
+
+        Raises:
+            ValueError: period is less than 1.
+        """
+        if period < 1:
+            raise ValueError("period must be at least 1")
+        self.period = int(period)
+        self._means = Column(np.float64)
+        self._stdevs = Column(np.float64)
+        # The last period - 1 points, the start of the windows of the next points.
+        self.tail = np.empty(0)
+
+    def __len__(self):
+        return len(self._means)
+
+    @property
+    def means(self) -> np.ndarray:
+        return self._means.view()
+
+    @property
+    def stdevs(self) -> np.ndarray:
+        return self._stdevs.view()
+
+    @property
+    def nbytes(self) -> int:
+        return self._means.buffer.nbytes + self._stdevs.buffer.nbytes + self.tail.nbytes
+
+    def extend(self, values):
+        """Computes the statistics of points appended to the trace.
+
+        Args:
+            values: The new points, in order.
+        """
+        values = np.asarray(values, dtype=np.float64)
+        for start in range(0, len(values), BLOCK_SIZE):
+            self.extend_block(values[start:start + BLOCK_SIZE])
+
+    def extend_block(self, block: np.ndarray):
+        """Computes the statistics of block with one cumulative sum pass."""
+        window = np.concatenate([self.tail, block])
+        means, stdevs = window_moments(window, len(self.tail), self.period, len(self))
+
+        self._means.extend(means)
+        self._stdevs.extend(stdevs)
+        self.tail = window[max(len(window) - (self.period - 1), 0):]
+
+def window_moments(window: np.ndarray, history: int, period: int, seen: int):
+    """Computes rolling means and sample standard deviations along the last axis.
+
+    Args:
+        window: The points, along the last axis. Leading axes are independent traces.
+        history: The number of leading points that are only used as window starts.
+        period: The size of the window.
+        seen: The number of points before window[..., history], windows never reach
+            further back than that.
+
+    Returns:
+        A tuple of the means and standard deviations of the points after history.
+    """
+    # Variance doesn't depend on the offset, so shift values close to zero
+    # to avoid cancellation in the sum of squares.
+    shift = window[..., :1] if window.shape[-1] else 0.0
+    shifted = window - shift
+
+    zeros = np.zeros(window.shape[:-1] + (1,))
+    sums = np.concatenate([zeros, np.cumsum(shifted, axis=-1)], axis=-1)
+    squares = np.concatenate([zeros, np.cumsum(shifted * shifted, axis=-1)], axis=-1)
+
+    ends = np.arange(history + 1, window.shape[-1] + 1)
+    counts = np.minimum(period, ends + seen - history)
+    starts = np.maximum(ends - counts, 0)
+
+    total = sums[..., ends] - sums[..., starts]
+    means = total / counts
+    with np.errstate(divide='ignore', invalid='ignore'):
+        variances = (squares[..., ends] - squares[..., starts] - total * means) / (counts - 1)
+    variances = np.where(counts > 1, np.maximum(variances, 0.0), 0.0)
+    return means + shift, np.sqrt(variances)
+
+def rolling_mean_stdev(trace, period=100):
+    """Computes the rolling mean and standard deviation of a trace in one pass.
+
+    Args:
+        trace: The data trace, a list or array.
+        period: The size of the window of previous data points.
+
+    Returns:
+        A tuple of arrays holding the rolling mean and standard deviation at each point.
+    """
+    stats = RollingStats(max(min(period, len(trace)), 1))
+    stats.extend(trace)
+    return stats.means, stats.stdevs
+
+def batch_stats(matrix: np.ndarray, avg_period=100, stdev_period=100, percentiles=(5, 50, 95)) -> dict:
+    """Computes summary and rolling statistics of many equal-length traces at once.
+
+    Every statistic is a vectorized reduction over the rows of matrix. The
+    rolling statistics are computed in blocks of BLOCK_SIZE points, like
+    RollingStats.extend, to bound the rounding error of their running sums.
+
+    Args:
+        matrix: 2-D array with one trace per row.
+        avg_period: The window size of the rolling averages.
+        stdev_period: The window size of the rolling standard deviations.
+        percentiles: The percentiles to compute, between 0 and 100.
+
+    Returns:
+        A dict of arrays:
+            min, max, mean, rms: One value per trace.
+            percentiles: One row per percentile, one value per trace.
+            avgs, stdevs: The rolling statistics, one row per trace.
+        min, max, mean, rms and percentiles are empty if the traces are.
+    """
+    matrix = np.asarray(matrix, dtype=np.float64)
+    traces, length = matrix.shape
+
+    def rolling(period):
+        period = max(min(int(period), length), 1)
+        means, stdevs = np.empty_like(matrix), np.empty_like(matrix)
+        for start in range(0, length, BLOCK_SIZE):
+            # The last period - 1 points of the previous blocks start the first windows.
+            history = min(start, period - 1)
+            window = matrix[:, start - history:start + BLOCK_SIZE]
+            block = slice(start, start + BLOCK_SIZE)
+            means[:, block], stdevs[:, block] = window_moments(window, history, period, start)
+        return means, stdevs
+
+    avgs, stdevs = rolling(avg_period)
+    if stdev_period != avg_period:
+        stdevs = rolling(stdev_period)[1]
+
+    if length == 0:
+        empty = np.empty(0)
+        return {'min': empty, 'max': empty, 'mean': empty, 'rms': empty,
+                'percentiles': np.empty((len(percentiles), 0)), 'avgs': avgs, 'stdevs': stdevs}
+
+    return {
+        'min': matrix.min(axis=1),
+        'max': matrix.max(axis=1),
+        'mean': matrix.mean(axis=1),
+        'rms': np.sqrt(np.einsum('ij,ij->i', matrix, matrix) / length),
+        'percentiles': np.percentile(matrix, percentiles, axis=1).reshape(len(percentiles), traces),
+        'avgs': avgs,
+        'stdevs': stdevs
+    }
+
+class StatsCache:
+    """StatsCache keeps RollingStats by key, evicting the least recently used past a byte limit.
+
+    Attributes:
+        max_bytes: The maximum size of the cached statistics.
+    """
+
+    def __init__(self, max_bytes=256 << 20):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key, trace, period: int) -> RollingStats:
+        """Returns the statistics of trace, reusing and extending cached results.
+
+        Args:
+            key: Identifies the trace and period, e.g. (dataset_id, sample, channel, period).
+            trace: The full trace. If it has grown since the statistics under key
+                were cached, only the new points are computed.
+            period: The size of the window.
+
+        Returns:
+            A RollingStats covering every point of trace.
+        """
+        with self.lock:
+            stats = self.entries.pop(key, None)
+        if stats is None or len(stats) > len(trace):
+            stats = RollingStats(period)
+        if len(stats) < len(trace):
+            stats.extend(trace[len(stats):])
+
+        with self.lock:
+            self.entries[key] = stats
+            used = sum(entry.nbytes for entry in self.entries.values())
+            while used > self.max_bytes and len(self.entries) > 1:
+                _, evicted = self.entries.popitem(last=False)
+                used -= evicted.nbytes
+        return stats
 
 def compute_running_avg(trace, period=100):
     """Computes the running average of a single data trace.
@@ -27,29 +238,18 @@ def compute_running_avg(trace, period=100):
 
     Returns: Python list containing the running average at each point.
     """
-    n = len(trace)
-    if period > n:
-        period = n
-
-    avgs = pd.Series(trace).rolling(period, min_periods=1).mean()
-    return avgs.to_list()
+    return rolling_mean_stdev(trace, period)[0].tolist()
 
 def compute_stdev(trace, avgs, period=100):
     """Computes the standard deviation of a single data trace.
 
     Attributes:
         trace: The Python list data trace to compute stdev for.
-        avgs: The previously computed averages for the same trace, used
-            in the computation of the first period-1 standard deviations.
+        avgs: Unused, kept for compatibility. The averages over period are
+            computed together with the standard deviation.
         period: The size of the window of previous data points that are
             used in the standard deviation computation.
 
     Returns: Python list containing the standard deviation at each point.
     """
-    n = len(trace)
-    if period > n:
-        period = n
-
-    stdevs = pd.Series(trace).rolling(period, min_periods=1).std()
-    stdevs[0] = 0
-    return stdevs.to_list()
+    return rolling_mean_stdev(trace, period)[1].tolist()
@@ -0,0 +1,52 @@
+"""
+Copyright 2020 Google LLC
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    https://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import os
+import tempfile
+import unittest
+
+from benchmark import compare
+from benchmark import generate_log
+from parser import GoogleSensorParser
+
+class TestBenchmark(unittest.TestCase):
+    def test_generate_log(self):
+        """Tests that generated logs are deterministic and follow the requested shape."""
+
+        with tempfile.TemporaryDirectory() as directory:
+            first, second = os.path.join(directory, 'a.txt'), os.path.join(directory, 'b.txt')
+            generate_log(first, 30, sensors=2, dimensions=4, latency=False, header_sensors=5)
+            generate_log(second, 30, sensors=2, dimensions=4, latency=False, header_sensors=5)
+            with open(first, 'rb') as f, open(second, 'rb') as g:
+                self.assertEqual(f.read(), g.read())
+
+            samples = GoogleSensorParser([]).parse(first)
+            self.assertEqual(len(samples), 5)
+            self.assertEqual([len(sample.timestamps) for sample in samples], [15, 15, 0, 0, 0])
+            self.assertEqual(len(samples[0].data), 4)
+            self.assertEqual(len(samples[0].latencies), 0)
+
+    def test_compare(self):
+        """Tests that regressions are detected in the direction each metric improves."""
+
+        baseline = {'parse.lines_per_s': 100.0, 'stats.cold_s': 1.0, 'serialize.json_s': 1.0}
+        results = {'parse.lines_per_s': 80.0, 'stats.cold_s': 1.05, 'serialize.json_s': 0.5,
+                   'new_s': 1.0}
+        self.assertEqual(compare(results, baseline, 0.1), [('parse.lines_per_s', 100.0, 80.0)])
+        self.assertEqual(len(compare(results, baseline, 0.01)), 2)
+
+if __name__ == '__main__':
+    unittest.main()
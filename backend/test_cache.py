@@ -0,0 +1,161 @@
+"""
+Copyright 2020 Google LLC
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    https://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import io
+import os
+import tempfile
+import threading
+import unittest
+
+from unittest import mock
+
+import numpy as np
+
+from cache import DatasetCache
+from cache import content_key
+from cache import load_samples
+from cache import save_samples
+from cache import samples_size
+
+from parser import GoogleSensorParser
+from parser import Parser
+from parser import Sample
+
+def make_samples(points):
+    sample = Sample("Gyro", "4.0")
+    sample.set_dimensions(3)
+    for i in range(points):
+        sample.add_point(i * 10, [i, -i, 0.5], i % 3)
+    sample.finalize()
+    return [sample]
+
+class TestCache(unittest.TestCase):
+    def test_content_key(self):
+        """Tests that the key depends on the contents and the parser format."""
+
+        google = GoogleSensorParser([])
+        generic = Parser([], google.regex)
+        stream = io.BytesIO(b"Sensor: 4.0 TS: 1 Data: 1 2 3 \n")
+
+        key = content_key(stream, google)
+        self.assertEqual(stream.tell(), 0)
+        self.assertEqual(key, content_key(io.BytesIO(stream.getvalue()), google))
+        self.assertNotEqual(key, content_key(stream, generic))
+        self.assertNotEqual(key, content_key(io.BytesIO(b"other"), google))
+
+    def test_memory_eviction(self):
+        """Tests that the memory tier evicts the least recently used entry."""
+
+        size = samples_size(make_samples(100))
+        cache = DatasetCache(memory_bytes=2 * size)
+        cache.put('a', make_samples(100))
+        cache.put('b', make_samples(100))
+        cache.get('a')
+        cache.put('c', make_samples(100))
+
+        self.assertIsNotNone(cache.get('a'))
+        self.assertIsNone(cache.get('b'))
+        self.assertIsNotNone(cache.get('c'))
+        stats = cache.stats()
+        self.assertEqual((stats['hits'], stats['misses']), (3, 1))
+        self.assertEqual(stats['memory_bytes'], 2 * size)
+
+    def test_disk_tier(self):
+        """Tests that entries evicted from memory are reloaded from disk."""
+
+        with tempfile.TemporaryDirectory() as tmp:
+            cache = DatasetCache(tmp, memory_bytes=0)
+            expected = make_samples(50)
+            cache.put('a', expected)
+
+            loaded = cache.get('a')
+            self.assertEqual(cache.stats()['disk_hits'], 1)
+
+        self.assertEqual(loaded[0].sensor_name, "Gyro")
+        self.assertEqual(loaded[0].timestamps.tolist(), expected[0].timestamps.tolist())
+        self.assertEqual(loaded[0].latencies.tolist(), expected[0].latencies.tolist())
+        self.assertEqual(loaded[0].data[1].tolist(), expected[0].data[1].tolist())
+
+    def test_lazy_load(self):
+        """Tests loading selected sensors, channels and time ranges of a capture."""
+
+        other = Sample("Accel", "1.0")
+        other.set_dimensions(1)
+        for ts in [30, 10, 20]:
+            other.add_point(ts, [ts / 10])
+        other.finalize()
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'capture')
+            save_samples(path, make_samples(100) + [other])
+            # Captures are named by content, an existing one is kept.
+            save_samples(path, make_samples(50) + [other])
+
+            everything = load_samples(path)
+            gyro, = load_samples(path, sensor_ids=['4.0'], channels=[2], start=95, end=300)
+            accel, = load_samples(path, sensor_ids=['1.0'], start=15)
+
+            self.assertEqual(len(everything[0].timestamps), 100)
+            self.assertIsInstance(everything[0].timestamps, np.memmap)
+            self.assertEqual(everything[1].timestamp_diffs.tolist(), [0, -20, 10])
+
+            self.assertEqual(gyro.timestamps.tolist(), list(range(100, 301, 10)))
+            self.assertEqual(list(gyro.data), [2])
+            self.assertEqual(gyro.latencies.tolist(), [i % 3 for i in range(10, 31)])
+            self.assertEqual(gyro.timestamp_diffs[0], 0)
+            self.assertEqual(accel.data[0].tolist(), [3, 2])
+            self.assertEqual(accel.latencies.tolist(), [])
+
+            # Loaded samples are finalized, the capture can't be written through them.
+            self.assertTrue(everything[0].finalized)
+            self.assertRaises(ValueError, everything[0].add_point, 1000, [1, 2, 1.5], 0)
+
+    def test_save_concurrent(self):
+        """Tests that concurrent saves of the same capture all succeed."""
+
+        samples = make_samples(100)
+        errors = []
+
+        def save(path):
+            try:
+                save_samples(path, samples)
+            except OSError as e:
+                errors.append(e)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            for i in range(10):
+                path = os.path.join(tmp, str(i))
+                threads = [threading.Thread(target=save, args=(path,)) for _ in range(4)]
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+                self.assertEqual(len(load_samples(path)[0].timestamps), 100)
+            self.assertEqual(errors, [])
+            self.assertEqual(sorted(os.listdir(tmp)), [str(i) for i in range(10)])
+
+    def test_put_disk_error(self):
+        """Tests that failing to write the disk tier still caches samples in memory."""
+
+        with tempfile.TemporaryDirectory() as tmp:
+            cache = DatasetCache(tmp)
+            with mock.patch('cache.save_samples', side_effect=OSError("No space left")):
+                with self.assertLogs('cache', 'WARNING'):
+                    cache.put('ab', make_samples(10))
+            self.assertEqual(len(cache.get('ab')[0].timestamps), 10)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+"""
+Copyright 2020 Google LLC
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    https://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import bz2
+import gzip
+import io
+import lzma
+import unittest
+
+from compression import Decompressor
+from compression import compression_of
+from compression import detect_compression
+from compression import iter_decompressed
+from compression import read_prefix
+
+DATA = b"".join(b"line %d\n" % i for i in range(10000))
+
+class TestCompression(unittest.TestCase):
+    def test_detect(self):
+        """Tests detecting codecs from magic bytes."""
+
+        self.assertEqual(detect_compression(gzip.compress(DATA)), 'gzip')
+        self.assertEqual(detect_compression(bz2.compress(DATA)), 'bzip2')
+        self.assertEqual(detect_compression(lzma.compress(DATA)), 'xz')
+        self.assertEqual(detect_compression(b'\x28\xb5\x2f\xfd\x00'), 'zstd')
+        self.assertIsNone(detect_compression(DATA))
+
+        stream = io.BytesIO(gzip.compress(DATA))
+        self.assertEqual(compression_of(stream), 'gzip')
+        self.assertEqual(stream.tell(), 0)
+
+    def test_decompressor(self):
+        """Tests decompressing chunks of concatenated streams."""
+
+        for compress in (gzip.compress, bz2.compress, lzma.compress):
+            data = compress(DATA[:5000]) + compress(DATA[5000:])
+            decompressor = Decompressor(detect_compression(data))
+            blocks = [decompressor.decompress(data[i:i + 100]) for i in range(0, len(data), 100)]
+            self.assertEqual(b"".join(blocks), DATA)
+
+    def test_iter_decompressed(self):
+        """Tests reading files a block at a time and reading only their start."""
+
+        stream = io.BytesIO(gzip.compress(DATA))
+        blocks = list(iter_decompressed(stream, 'gzip', read_bytes=64))
+        self.assertGreater(len(blocks), 1)
+        self.assertEqual(b"".join(blocks), DATA)
+
+        self.assertEqual(read_prefix(stream, 20), DATA[:20])
+        self.assertEqual(stream.tell(), 0)
+        self.assertEqual(read_prefix(io.BytesIO(DATA), 20), DATA[:20])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,103 @@
+"""
+Copyright 2020 Google LLC
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    https://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import unittest
+
+import numpy as np
+
+from cache import DatasetCache
+
+from datasets import DatasetStore
+
+from parser import Sample
+
+def make_samples():
+    sample = Sample("Gyro", "4.0")
+    sample.set_dimensions(2)
+    for i in range(20):
+        sample.add_point(i * 10, [i, -i], i)
+    sample.finalize()
+    return [sample]
+
+class TestDatasets(unittest.TestCase):
+    def test_channel_lookup(self):
+        """Tests looking up traces by the references the frontend sends."""
+
+        dataset = DatasetStore().add('a', make_samples())
+
+        timestamps, values = dataset.channel(0, '1')
+        self.assertEqual(values.tolist(), [float(-i) for i in range(20)])
+        self.assertEqual(timestamps.tolist(), [i * 10 for i in range(20)])
+        self.assertEqual(dataset.channel('0', 'latencies')[1].tolist(), list(range(20)))
+        self.assertRaises(KeyError, dataset.channel, 0, '2')
+        self.assertRaises(KeyError, dataset.channel, 1, '0')
+        self.assertIs(dataset.pyramid('0', 1), dataset.pyramids[0]['1'])
+        self.assertRaises(KeyError, dataset.pyramid, -1, '0')
+
+    def test_stack(self):
+        """Tests stacking every trace of a sample into one array."""
+
+        channels, matrix = DatasetStore().add('a', make_samples()).stack(0)
+
+        self.assertEqual(channels, ['0', '1', 'timestamp_diffs', 'latencies'])
+        self.assertEqual(matrix.shape, (4, 20))
+        self.assertEqual(matrix[1].tolist(), [float(-i) for i in range(20)])
+        self.assertEqual(matrix[2, 1], 10)
+
+    def test_memoize(self):
+        """Tests that results are computed once per key."""
+
+        dataset = DatasetStore().add('a', make_samples())
+        calls = []
+
+        def compute():
+            calls.append(1)
+            return len(calls)
+
+        self.assertEqual(dataset.memoize(('avg', 0, '0', 5), compute), 1)
+        self.assertEqual(dataset.memoize(('avg', 0, '0', 5), compute), 1)
+        self.assertEqual(dataset.memoize(('avg', 0, '0', 6), compute), 2)
+
+    def test_memoize_eviction(self):
+        """Tests that memoized results are bounded by max_result_bytes."""
+
+        dataset = DatasetStore().add('a', make_samples())
+        dataset.max_result_bytes = 2000
+
+        dataset.memoize('a', lambda: np.zeros(100))
+        dataset.memoize('b', lambda: {'avgs': np.zeros(100)})
+        dataset.memoize('a', lambda: None)
+        dataset.memoize('c', lambda: (np.zeros(100), [np.zeros(50)]))
+        self.assertEqual(list(dataset.results), ['a', 'c'])
+
+        self.assertEqual(len(dataset.memoize('d', lambda: np.zeros(1000))), 1000)
+        self.assertNotIn('d', dataset.results)
+
+    def test_store_eviction(self):
+        """Tests that evicted datasets are restored from the cache."""
+
+        cache = DatasetCache()
+        store = DatasetStore(cache, max_datasets=1)
+        cache.put('a', make_samples())
+        store.add('a', cache.get('a'))
+        store.add('b', make_samples())
+
+        self.assertNotIn('a', store.datasets)
+        self.assertEqual(store.get('a').samples[0].sensor_name, "Gyro")
+        self.assertIsNone(store.get('c'))
+
+if __name__ == '__main__':
+    unittest.main()
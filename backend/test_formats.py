@@ -0,0 +1,242 @@
+"""
+Copyright 2020 Google LLC
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    https://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import gzip
+import io
+import lzma
+import os
+import re
+import tempfile
+import unittest
+
+import numpy as np
+
+from formats import BinarySensorParser
+from formats import CsvSensorParser
+from formats import HEADER_START
+from formats import encode_binary_log
+from formats import parse_all
+from formats import detect_format
+from formats import parser_for
+
+from parser import GoogleSensorParser
+from parser import Sample
+from parser import StreamParser
+from parser import field_regexes
+
+CSV = (b"Timestamp;Sensor;Name;x;y;Latency\r\n"
+       b"100;4;Gyro;1.0;2.0;5\r\n"
+       b"\r\n"
+       b"110;9;Light;7.5;;\r\n"
+       b"120;4;Gyro;1.5;2.5;6\r\n"
+       b"bad;4;Gyro;1.5;2.5;6\r\n")
+
+LOG = (b"Sensor 0: sensor type 4.0: BMI160 Gyroscope.\n"
+       b"Sensor 1: sensor type 5.0: TMD2725 Ambient Light.\n"
+       b"Sensor: 4.0 TS: 100 Data: 0.1 0.2 0.3 Latency: 5\n"
+       b"Sensor: 5.0 TS: 105 Data: 53.471672 \n"
+       b"Sensor: 4.0 TS: 120 Data: 0.4 0.5 0.6 Latency: 7\n"
+       b"Sensor: 4.0 TS: 140 Data: -0.7 0.8 -0.9 Latency: 9\n")
+
+class TestFormats(unittest.TestCase):
+    def test_field_regexes(self):
+        """Tests generating the per-field and fused regexes from one declaration."""
+
+        regex, line_regex = field_regexes([('timestamp', 'TS: ', '[0-9]+', False),
+                                           ('latency', 'L: ', '[0-9]+', True)])
+        self.assertEqual(re.search(regex['latency'], "TS: 1 L: 22").group(0), "22")
+        self.assertEqual(re.search(line_regex, "x TS: 1 y L: 22").groupdict(),
+                         {'timestamp': '1', 'latency': '22'})
+        self.assertEqual(re.search(line_regex, "TS: 1").groupdict()['latency'], None)
+
+    def test_detect(self):
+        """Tests detecting formats from the start of a file."""
+
+        self.assertEqual(detect_format(b"Sensor 0: sensor type 4.0: BMI160 Gyroscope.\n"), 'google')
+        self.assertEqual(detect_format(b"Sensor: 4.0 TS: 1 Data: 1 2 3 \n"), 'google')
+        self.assertEqual(detect_format(CSV), 'csv')
+        self.assertEqual(detect_format(b"unknown"), 'google')
+
+        stream = io.BytesIO(CSV)
+        self.assertIsInstance(parser_for(stream), CsvSensorParser)
+        self.assertEqual(stream.tell(), 0)
+        self.assertIsInstance(parser_for(io.BytesIO(b"")), GoogleSensorParser)
+        self.assertIsInstance(parser_for(io.BytesIO(gzip.compress(CSV))), CsvSensorParser)
+
+    def test_csv(self):
+        """Tests parsing CSV rows, whole and streamed."""
+
+        parser = CsvSensorParser([])
+        gyro, light = parser.parse(io.BytesIO(CSV))
+
+        self.assertEqual((gyro.sensor_name, gyro.sensor_id), ("Gyro", "4"))
+        self.assertEqual(gyro.timestamps.tolist(), [100, 120])
+        self.assertEqual(gyro.data[1].tolist(), [2.0, 2.5])
+        self.assertEqual(gyro.latencies.tolist(), [5, 6])
+        self.assertEqual(list(light.data), [0])
+        self.assertEqual(light.latencies.tolist(), [])
+        # The blank and the undecodable rows are read but hold no point.
+        self.assertEqual(parser.lines_read, 5)
+
+        stream_parser = StreamParser(parser)
+        for start in range(0, len(CSV), 5):
+            stream_parser.feed(CSV[start:start + 5])
+        self.assertEqual(parser.jsonify(stream_parser.close()), parser.jsonify([gyro, light]))
+
+    def test_csv_single_sensor(self):
+        """Tests that CSV files without a sensor column hold one sensor."""
+
+        sample, = CsvSensorParser([]).parse(io.BytesIO(b"ts,a,b,c\n1,0.5,1,2\n2,0.5,1,3\n"))
+        self.assertEqual(sample.sensor_id, '0')
+        self.assertEqual(sample.data[2].tolist(), [2, 3])
+        self.assertRaises(ValueError, CsvSensorParser([]).parse, io.BytesIO(b"a,b\n1,2\n"))
+
+    def test_csv_row_shapes(self):
+        """Tests that CSV rows with empty or missing cells never shift values into other channels."""
+
+        parser = CsvSensorParser([])
+        sample, = parser.parse(io.BytesIO(b"ts,a,b,c\n1,1,2,3\n2,4,,6\n3,7,8,9\n4,1,2\n5,1,2,3,4\n"))
+        self.assertEqual(sample.timestamps.tolist(), [1, 3, 5])
+        self.assertEqual([column.tolist() for column in sample.data.values()], [[1, 7, 1], [2, 8, 2], [3, 9, 3]])
+
+        sample, = parser.parse(io.BytesIO(b"ts,a,b,c\n1,,2,3\n2,,,\n3,4,5,6\n"))
+        self.assertEqual(sample.timestamps.tolist(), [3])
+        self.assertEqual(len(sample.data), 3)
+
+        sample, = parser.parse(io.BytesIO(b"ts,a,b,c\n1,1,,\n2,4,5,\n3,7,,\n"))
+        self.assertEqual(sample.timestamps.tolist(), [1, 3])
+        self.assertEqual(sample.data[0].tolist(), [1, 7])
+
+    def test_csv_fractional_timestamps(self):
+        """Tests that CSV files with fractional timestamps are rejected rather than skipped."""
+
+        parser = CsvSensorParser([])
+        self.assertRaises(ValueError, parser.parse, io.BytesIO(b"time,x\n0.000,1\n0.010,2\n"))
+        sample, = parser.parse(io.BytesIO(b"time,x\n10,1\nbad,2\n20,3\n"))
+        self.assertEqual(sample.timestamps.tolist(), [10, 20])
+
+    def test_csv_parse_range(self):
+        """Tests that parse_range returns CSV sensors first seen after the head of the file."""
+
+        rows = ["%d,a,%d" % (t, t) for t in range(1000)] + ["%d,b,%d" % (t, t) for t in range(5000, 6000)]
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'log.csv')
+            with open(path, 'w') as f:
+                f.write("ts,sensor,x\n" + "\n".join(rows) + "\n")
+            self.assertLess(len(CsvSensorParser([]).read_headers(path)[0]), 2)
+            a, b = CsvSensorParser([]).parse_range(path, 5500, 5600)
+
+        self.assertEqual(a.timestamps.tolist(), [])
+        self.assertEqual(b.timestamps.tolist(), list(range(5500, 5601)))
+
+    def test_binary(self):
+        """Tests that binary logs parse to the same Samples as the text log they encode."""
+
+        text_parser = GoogleSensorParser([])
+        expected = text_parser.parse(io.BytesIO(LOG))
+        log = encode_binary_log(expected, data_dtype='<f8')
+        self.assertEqual(detect_format(log), 'binary')
+
+        parser = parser_for(io.BytesIO(log))
+        self.assertIsInstance(parser, BinarySensorParser)
+        gyro, light = parser.parse(io.BytesIO(log))
+        self.assertEqual(gyro.latencies.tolist(), [5, 7, 9])
+        self.assertEqual(list(light.data), [0])
+        self.assertEqual(light.data[0].tolist(), [53.471672])
+        self.assertEqual(parser.jsonify([gyro, light]), text_parser.jsonify(expected))
+
+        compressed = lzma.compress(log)
+        self.assertEqual(parser.read_headers(io.BytesIO(compressed))[0], [("BMI160 Gyroscope", "4.0"),
+                                                                         ("TMD2725 Ambient Light", "5.0")])
+        self.assertEqual(parser.jsonify(parser.parse(io.BytesIO(compressed))), text_parser.jsonify(expected))
+
+        stream_parser = StreamParser(parser)
+        for start in range(0, len(log), 7):
+            stream_parser.feed(log[start:start + 7])
+        self.assertEqual(parser.jsonify(stream_parser.close()), text_parser.jsonify(expected))
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'log.bin')
+            with open(path, 'wb') as f:
+                f.write(log)
+            gyro, light = parser.parse_range(path, 110, 130)
+            self.assertEqual(gyro.timestamps.tolist(), [120])
+            self.assertEqual(light.timestamps.tolist(), [])
+
+    def test_parse_all(self):
+        """Tests parsing files of different formats in worker processes."""
+
+        with tempfile.TemporaryDirectory() as directory:
+            paths = [os.path.join(directory, name) for name in ('log.txt', 'log.csv')]
+            for path, contents in zip(paths, [LOG, CSV]):
+                with open(path, 'wb') as f:
+                    f.write(contents)
+
+            (gyro, _), (csv_gyro, _) = parse_all(paths, workers=2)
+            self.assertEqual(gyro.timestamps.tolist(), [100, 120, 140])
+            self.assertEqual(csv_gyro.timestamps.tolist(), [100, 120])
+            self.assertEqual(parse_all(paths[:1], workers=2)[0][0].sensor_id, '4.0')
+
+    def test_binary_blocks(self):
+        """Tests that blocks and ranges of binary logs end on record boundaries."""
+
+        points = np.arange(1000)
+        sample = Sample.from_arrays('Gyro', '4.0', points, {0: points, 1: points + 1}, points)
+        log = encode_binary_log([sample])
+        parser = BinarySensorParser([])
+        _, body_start = parser.read_headers(log)
+        layout = parser.read_layout(log)
+        itemsize = layout['dtype'].itemsize
+        self.assertEqual((len(log) - body_start) % itemsize, 0)
+
+        end = parser.block_end(log, body_start, 100, layout)
+        self.assertEqual(end - body_start, 100 // itemsize * itemsize)
+        chunk, = parser.iter_chunks(io.BytesIO(log + b"partial"))
+        self.assertEqual(chunk.data[1].tolist(), (points + 1).tolist())
+        self.assertEqual(chunk.latencies.tolist(), points.tolist())
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'log.bin')
+            with open(path, 'wb') as f:
+                f.write(log)
+            for start, end in parser.split_body(path, body_start, 3, layout):
+                self.assertEqual((start - body_start) % itemsize, 0)
+
+        self.assertRaises(ValueError, parser.read_headers, log[:HEADER_START])
+        # Binary logs have no text lines, the field names aren't regexes.
+        self.assertIsNone(parser.compiled['timestamp'].search("timestamp"))
+        self.assertEqual(parser.read_header("Sensor 0: sensor type 4.0: Gyro.", {}), False)
+
+    def test_parse_files_layouts(self):
+        """Tests that files with different layouts are parsed concurrently by one parser."""
+
+        points = np.arange(50)
+        logs = [encode_binary_log([Sample.from_arrays('Gyro', '4.0', points, {0: points, 1: -points}, points)]),
+                encode_binary_log([Sample.from_arrays('Light', '5.0', points, {0: points * 2}, points)],
+                                  data_dtype='<f8')]
+        csvs = [CSV, b"ts,a,b,c\n1,1,2,3\n2,4,5,6\n"]
+        with tempfile.TemporaryDirectory() as directory:
+            for parser_class, contents in ((BinarySensorParser, logs), (CsvSensorParser, csvs)):
+                paths = []
+                for i, data in enumerate(contents):
+                    paths.append(os.path.join(directory, 'log%d' % i))
+                    with open(paths[-1], 'wb') as f:
+                        f.write(data)
+                parser = parser_class(paths)
+                self.assertEqual(parser.parse_files(workers=2), parser.parse_files())
+
+if __name__ == '__main__':
+    unittest.main()
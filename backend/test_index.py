@@ -0,0 +1,69 @@
+"""
+Copyright 2020 Google LLC
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    https://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from index import TimeIndex
+
+def make_index():
+    index = TimeIndex(['a', 'b'], size=400)
+    index.add_block(0, 100, {'a': np.array([10, 20]), 'b': np.array([15])})
+    index.add_block(100, 200, {'a': np.array([30, 25])})
+    # Out-of-order timestamps widen the block's bounds.
+    index.add_block(200, 300, {'a': np.array([40, 5]), 'b': np.array([])})
+    index.add_block(300, 400, {'b': np.array([60])})
+    index.finish()
+    return index
+
+class TestIndex(unittest.TestCase):
+    def test_ranges(self):
+        """Tests mapping time ranges and sensors to merged byte ranges."""
+
+        index = make_index()
+        self.assertEqual(index.ranges(), [(0, 400)])
+        self.assertEqual(index.ranges(26, 35), [(100, 300)])
+        self.assertEqual(index.ranges(26, 35, ['b']), [])
+        self.assertEqual(index.ranges(None, 12, ['a']), [(0, 100), (200, 300)])
+        self.assertEqual(index.ranges(50, None), [(300, 400)])
+
+    def test_new_sensors(self):
+        """Tests that sensors first seen after the first block get a column."""
+
+        index = TimeIndex(['a'])
+        index.add_block(0, 100, {'a': np.array([10])})
+        index.add_block(100, 200, {'a': np.array([20]), 'c': np.array([25])})
+        index.finish()
+        self.assertEqual(index.sensor_ids, ['a', 'c'])
+        self.assertEqual(index.ranges(0, 30, ['c']), [(100, 200)])
+        self.assertEqual(index.ranges(None, 15, ['c']), [])
+
+    def test_save_load(self):
+        """Tests that a saved index gives the same ranges."""
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'index.npz')
+            make_index().save(path)
+            loaded = TimeIndex.load(path)
+
+        self.assertEqual((loaded.sensor_ids, loaded.size), (['a', 'b'], 400))
+        self.assertEqual(loaded.ranges(None, 12, ['a']), [(0, 100), (200, 300)])
+
+if __name__ == '__main__':
+    unittest.main()
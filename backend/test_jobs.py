@@ -0,0 +1,75 @@
+"""
+Copyright 2020 Google LLC
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    https://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import threading
+import unittest
+
+from concurrent.futures import ThreadPoolExecutor
+
+from jobs import JobQueue
+from jobs import QueueFull
+from jobs import starmap
+
+class TestJobs(unittest.TestCase):
+    def test_process_pool(self):
+        """Tests running a job in a worker process and post-processing its result."""
+
+        queue = JobQueue(max_workers=1)
+        cleaned = []
+        job = queue.submit('stats', starmap, pow, [(2, 3), (3, 2)],
+                           on_done=sum, cleanup=lambda: cleaned.append(1))
+        job.future.result()
+        queue.shutdown()
+
+        self.assertEqual(queue.get(job.job_id).to_dict(),
+                         {'job_id': job.job_id, 'kind': 'stats', 'status': 'done'})
+        self.assertEqual(job.result, 17)
+        self.assertEqual(cleaned, [1])
+
+    def test_queue_limit_and_cancel(self):
+        """Tests that the queue rejects jobs when full and cancels queued and running jobs."""
+
+        release = threading.Event()
+        queue = JobQueue(max_pending=2, executor=ThreadPoolExecutor(1))
+        running = queue.submit('parse', release.wait)
+        queued = queue.submit('parse', int, '5')
+        self.assertRaises(QueueFull, queue.submit, 'parse', int, '6')
+
+        queue.cancel(queued.job_id)
+        queue.cancel(running.job_id)
+        self.assertEqual(queued.status, 'cancelled')
+        self.assertEqual(running.status, 'running')
+
+        release.set()
+        queue.shutdown()
+        self.assertEqual(running.status, 'cancelled')
+        self.assertIsNone(queue.cancel('unknown'))
+
+    def test_failure_and_eviction(self):
+        """Tests that failures are reported and only max_jobs finished jobs are kept."""
+
+        queue = JobQueue(max_jobs=2, executor=ThreadPoolExecutor(1))
+        failed = queue.submit('parse', int, 'x')
+        queue.shutdown()
+        self.assertEqual(failed.status, 'failed')
+        self.assertIn('invalid literal', failed.error)
+
+        done = [queue.add_result('parse', i) for i in range(3)]
+        self.assertIsNone(queue.get(failed.job_id))
+        self.assertEqual(list(queue.jobs), [job.job_id for job in done[1:]])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+"""
+Copyright 2020 Google LLC
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    https://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import unittest
+
+import numpy as np
+
+from lod import FACTOR
+from lod import Pyramid
+
+class TestLod(unittest.TestCase):
+    def test_pyramid_levels(self):
+        """Tests that every level keeps the extremes of its buckets."""
+
+        values = np.random.default_rng(0).normal(size=1000)
+        pyramid = Pyramid(np.arange(1000) * 10, values)
+
+        for level, (argmin, argmax) in enumerate(pyramid.levels, start=1):
+            bucket = FACTOR ** level
+            for i in range(len(argmin)):
+                window = values[i * bucket:(i + 1) * bucket]
+                self.assertEqual(values[argmin[i]], window.min())
+                self.assertEqual(values[argmax[i]], window.max())
+        self.assertEqual(len(pyramid.levels[-1][0]), 1)
+
+    def test_pyramid_query(self):
+        """Tests that queries are bounded by the width and keep spikes in range."""
+
+        values = np.zeros(100000)
+        values[31337] = 50
+        values[70000] = -50
+        pyramid = Pyramid(np.arange(100000), values)
+
+        indices, level = pyramid.query(width=200)
+        self.assertGreater(level, 0)
+        self.assertLessEqual(len(indices), 2 * 200 + 2)
+        self.assertIn(31337, indices)
+        self.assertIn(70000, indices)
+
+        indices, level = pyramid.query(start=30000, end=60000, width=200)
+        self.assertTrue(np.all((indices >= 30000) & (indices <= 60000)))
+        self.assertIn(31337, indices)
+        self.assertNotIn(70000, indices)
+
+        indices, level = pyramid.query(start=500, end=599, width=200)
+        self.assertEqual(level, 0)
+        self.assertEqual(indices.tolist(), list(range(500, 600)))
+
+    def test_pyramid_length_mismatch(self):
+        """Tests that timestamps and values must have the same length."""
+        self.assertRaises(ValueError, Pyramid, np.arange(3), np.arange(4))
+
+if __name__ == '__main__':
+    unittest.main()
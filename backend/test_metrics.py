@@ -0,0 +1,70 @@
+"""
+Copyright 2020 Google LLC
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    https://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import cProfile
+import unittest
+
+from metrics import Metrics
+from metrics import server_timing
+
+class TestMetrics(unittest.TestCase):
+    def test_timers_and_counters(self):
+        """Tests aggregating timers and counters and reporting them in milliseconds."""
+
+        metrics = Metrics()
+        timings = []
+        with metrics.timer('parse', timings):
+            pass
+        metrics.record('parse', 0.5)
+        metrics.count('lines', 3)
+        metrics.count('lines')
+
+        snapshot = metrics.snapshot()
+        self.assertEqual(snapshot['counters'], {'lines': 4})
+        self.assertEqual(snapshot['timers']['parse']['count'], 2)
+        self.assertEqual(snapshot['timers']['parse']['max'], 500)
+        self.assertEqual([name for name, _ in timings], ['parse'])
+
+    def test_timed_iter(self):
+        """Tests that streamed fragments are passed through, timed and counted."""
+
+        metrics = Metrics()
+        self.assertEqual(list(metrics.timed_iter('serialize', iter(['ab', 'c']))), ['ab', 'c'])
+        snapshot = metrics.snapshot()
+        self.assertEqual(snapshot['counters'], {'serialize_bytes': 3})
+        self.assertEqual(snapshot['timers']['serialize']['count'], 1)
+
+    def test_server_timing(self):
+        """Tests formatting a Server-Timing header, summing repeated stages."""
+
+        self.assertEqual(server_timing([('parse', 0.001), ('total', 0.5), ('parse', 0.002)]),
+                         'parse;dur=3.000, total;dur=500.000')
+        self.assertEqual(server_timing([]), '')
+
+    def test_profiles(self):
+        """Tests keeping the pstats tables of the last profiles only."""
+
+        metrics = Metrics(max_profiles=1)
+        profile_ids = []
+        for _ in range(2):
+            profile = cProfile.Profile()
+            profile.runcall(sum, range(10))
+            profile_ids.append(metrics.add_profile(profile))
+        self.assertIsNone(metrics.profile(profile_ids[0]))
+        self.assertIn('cumulative', metrics.profile(profile_ids[1]))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -14,11 +14,24 @@ See the License for the specific language governing permissions and
 limitations under the License.
 """
 
+import gzip
+import io
+import json
+import os
+import tempfile
 import unittest
 
+from unittest import mock
+
+import numpy as np
+
+from parser import Column
 from parser import GoogleSensorParser
 from parser import Parser
 from parser import Sample
+from parser import StreamParser
+from parser import merge_segments
+from parser import new_samples
 
 class TestParser(unittest.TestCase):
     def test_sample_init(self):
@@ -36,7 +49,7 @@ class TestParser(unittest.TestCase):
 
         sample.add_point(100, [1])
 
-        self.assertEqual(sample.data[0], [1])
+        self.assertEqual(sample.data[0].tolist(), [1])
         self.assertEqual(sample.timestamps[0], 100)
 
     def test_sample_add_point_many(self):
@@ -77,8 +90,8 @@ class TestParser(unittest.TestCase):
         sample_3d.add_point(1, [1, 2, 3])
         sample_5d.add_point(1, [1, 2, 3, 4, 5])
 
-        self.assertEqual(sample_3d.data[2], [3])
-        self.assertEqual(sample_5d.data[4], [5])
+        self.assertEqual(sample_3d.data[2].tolist(), [3])
+        self.assertEqual(sample_5d.data[4].tolist(), [5])
 
         self.assertTrue(sample_3d.performed_dimension_set)
         self.assertTrue(sample_5d.performed_dimension_set)
@@ -88,6 +101,61 @@ class TestParser(unittest.TestCase):
         self.assertRaises(ValueError, sample_5d.set_dimensions, -10)
 
 
+    def test_column_growth(self):
+        """Tests that a Column doubles its capacity and keeps written rows."""
+        column = Column(np.int64, capacity=4)
+
+        for i in range(10):
+            column.append(i)
+
+        self.assertEqual(column.view().tolist(), list(range(10)))
+        self.assertEqual(len(column.buffer), 16)
+
+        column.extend([10, 11])
+        column.trim()
+        self.assertEqual(len(column.buffer), 12)
+        self.assertEqual(column.view().dtype, np.int64)
+
+    def test_sample_timestamp_diffs(self):
+        """Tests that timestamp_diffs is derived from the timestamps."""
+        sample = Sample("Test", 1)
+
+        for ts in [100, 110, 125, 160]:
+            sample.add_point(ts, [0.0])
+
+        self.assertEqual(sample.timestamp_diffs.tolist(), [0, 10, 15, 35])
+
+        sample.finalize()
+        grown = sample.empty_copy()
+        grown.extend(sample)
+        grown.add_point(170, [0.0])
+        self.assertEqual(grown.timestamp_diffs.tolist(), [0, 10, 15, 35, 10])
+
+    def test_sample_finalized(self):
+        """Tests that finalized samples are immutable and cache their summaries."""
+        sample = Sample("Test", 1)
+        sample.set_dimensions(2)
+        for i in range(5):
+            sample.add_point(i * 10, [i, -2.0 * i], 1)
+
+        self.assertEqual(sample.summary(1), {'min': -8.0, 'max': 0.0, 'mean': -4.0, 'count': 5})
+        self.assertNotIn(1, sample._summaries)
+
+        sample.finalize()
+        self.assertIs(sample.summary('timestamp_diffs'), sample.summary('timestamp_diffs'))
+        self.assertEqual(sample.summary('latencies')['mean'], 1.0)
+        self.assertRaises(ValueError, sample.add_point, 50, [0.0, 0.0])
+        self.assertRaises(ValueError, sample.set_dimensions, 3)
+        with self.assertRaises(ValueError):
+            sample.data[0][0] = 1.0
+        with self.assertRaises(AttributeError):
+            sample.extra = 1
+
+        json_before = GoogleSensorParser([]).jsonify([sample])
+        self.assertEqual(GoogleSensorParser([]).jsonify([sample]), json_before)
+        decoded = json.loads(json.loads(json_before)['0'])
+        self.assertEqual(decoded['data']['1']['minmax'], [-8.0, 0.0])
+
     def test_parser_regex(self):
         """Tests loading a regex into the basic Parser class."""
 
@@ -103,6 +171,299 @@ class TestParser(unittest.TestCase):
         except KeyError:
             self.fail("Unexpected exception on correct Parser() init.")
 
+    def test_parser_fused_line_regex(self):
+        """Tests that the fused line regex and the per-field regex dict agree,
+        including on lines the fused regex doesn't match."""
+
+        lines = [
+            "Sensor 0: sensor type 4.0: BMI160 Gyroscope.\n",
+            "Sensor 1: sensor type 5.0: TMD2725 Ambient Light.\n",
+            "Sensor: 4.0 TS: 100 Data: 0.1 0.2 0.3 Latency: 5\n",
+            "Sensor: 5.0 TS: 105 Data: 53.471672 \n",
+            "TS: 120 Sensor: 4.0 Data: 0.4 0.5 0.6 Latency: 7\n",
+            "Sensor: 4.0 TS: 140 Data: -0.7 0.8 -0.9 Latency: 9\n",
+            "Sensor: 5.0 no data on this line\n",
+        ]
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'fused.txt')
+            with open(path, 'w') as f:
+                f.writelines(lines)
+
+            fused = GoogleSensorParser([path])
+            generic = Parser([path], fused.regex)
+            fused_samples = fused.parse(path)
+            generic_samples = generic.parse(path)
+
+        self.assertEqual(len(fused_samples), 2)
+        for a, b in zip(fused_samples, generic_samples):
+            self.assertEqual(a.sensor_id, b.sensor_id)
+            self.assertEqual(a.timestamps.tolist(), b.timestamps.tolist())
+            self.assertEqual(a.latencies.tolist(), b.latencies.tolist())
+            for key in a.data:
+                self.assertEqual(a.data[key].tolist(), b.data[key].tolist())
+
+        gyro = fused_samples[0]
+        self.assertEqual(gyro.timestamps.tolist(), [100, 120, 140])
+        self.assertEqual(gyro.data[2].tolist(), [0.3, 0.6, -0.9])
+        self.assertEqual(gyro.latencies.tolist(), [5, 7, 9])
+        self.assertEqual(len(fused_samples[1].latencies), 0)
+
+    @mock.patch('parser.MIN_RANGE_BYTES', 64)
+    def test_parser_parallel(self):
+        """Tests that parse_parallel splits the body and matches parse."""
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'parallel.txt')
+            with open(path, 'w') as f:
+                f.write("Sensor 0: sensor type 4.0: BMI160 Gyroscope.\n")
+                f.write("Sensor 1: sensor type 10.0: Linear Acceleration Sensor.\n")
+                for i in range(200):
+                    f.write("Sensor: %d.0 TS: %d Data: %d.5 %d.25 -1.0 Latency: %d\n"
+                            % (4 if i % 3 else 10, 1000 + i * 7, i, -i, i % 11))
+
+            parser = GoogleSensorParser([path])
+            headers, body_start = parser.read_headers(path)
+            self.assertEqual(headers, [('BMI160 Gyroscope', '4.0'),
+                                       ('Linear Acceleration Sensor', '10.0')])
+            self.assertGreater(len(parser.split_body(path, body_start, 4)), 1)
+
+            serial = parser.parse(path)
+            parallel = parser.parse_parallel(path, workers=4)
+
+        for a, b in zip(serial, parallel):
+            self.assertEqual(a.sensor_id, b.sensor_id)
+            self.assertEqual(a.timestamps.tolist(), b.timestamps.tolist())
+            self.assertEqual(a.timestamp_diffs.tolist(), b.timestamp_diffs.tolist())
+            self.assertEqual(a.latencies.tolist(), b.latencies.tolist())
+            for key in a.data:
+                self.assertEqual(a.data[key].tolist(), b.data[key].tolist())
+
+    def test_parser_stream(self):
+        """Tests that parse gives the same result for paths and in-memory streams."""
+
+        contents = (b"Sensor 0: sensor type 4.0: BMI160 Gyroscope.\r\n"
+                    b"Sensor: 4.0 TS: 100 Data: 0.1 0.2 0.3 Latency: 5\r\n"
+                    b"TS: 120 Sensor: 4.0 Data: 0.4 0.5 0.6 Latency: 7\r\n"
+                    b"Sensor: 4.0 TS: 140 Data: -0.7 0.8 -0.9 ")
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'mmap.txt')
+            with open(path, 'wb') as f:
+                f.write(contents)
+
+            parser = GoogleSensorParser([path])
+            expected = parser.parse(path)[0]
+            with open(path, 'rb') as f:
+                from_file = parser.parse(f)[0]
+        from_stream = parser.parse(io.BytesIO(contents))[0]
+
+        self.assertEqual(expected.sensor_name, 'BMI160 Gyroscope')
+        self.assertEqual(expected.timestamps.tolist(), [100, 120, 140])
+        for sample in [from_file, from_stream]:
+            self.assertEqual(sample.sensor_name, expected.sensor_name)
+            self.assertEqual(sample.timestamps.tolist(), expected.timestamps.tolist())
+            self.assertEqual(sample.latencies.tolist(), expected.latencies.tolist())
+            for key in expected.data:
+                self.assertEqual(sample.data[key].tolist(), expected.data[key].tolist())
+
+    @mock.patch('parser.BLOCK_BYTES', 64)
+    def test_parser_iter_chunks(self):
+        """Tests that iter_chunks yields bounded batches that join back to parse."""
+
+        contents = "Sensor 0: sensor type 4.0: BMI160 Gyroscope.\n"
+        contents += "Sensor 1: sensor type 10.0: Linear Acceleration Sensor.\n"
+        for i in range(100):
+            contents += "Sensor: %s TS: %d Data: %d.0 1.5 \n" % ('4.0' if i % 4 else '10.0', i * 10, i)
+        parser = GoogleSensorParser([])
+
+        chunks = list(parser.iter_chunks(io.BytesIO(contents.encode()), chunk_size=8))
+        self.assertTrue(all(chunk.next_index < 16 for chunk in chunks))
+        gyro_chunks = [chunk for chunk in chunks if chunk.sensor_id == '4.0']
+        joined = gyro_chunks[0].empty_copy()
+        for chunk in gyro_chunks:
+            joined.extend(chunk)
+
+        expected = parser.parse(io.BytesIO(contents.encode()))[0]
+        self.assertEqual(joined.timestamps.tolist(), expected.timestamps.tolist())
+        self.assertEqual(joined.timestamp_diffs.tolist(), expected.timestamp_diffs.tolist())
+        self.assertEqual(joined.data[0].tolist(), expected.data[0].tolist())
+
+        points = list(parser.iter_points(io.BytesIO(contents.encode())))
+        self.assertEqual(len(points), 100)
+        self.assertIn(('10.0', 0, [0.0, 1.5], -1), points)
+
+    @mock.patch('parser.INDEX_BYTES', 128)
+    def test_parser_parse_range(self):
+        """Tests that parse_range reads only indexed blocks overlapping the range."""
+
+        contents = "Sensor 0: sensor type 4.0: BMI160 Gyroscope.\n"
+        contents += "Sensor 1: sensor type 10.0: Linear Acceleration Sensor.\n"
+        for i in range(200):
+            contents += "Sensor: %s TS: %d Data: %d.0 1.5 Latency: 3\n" % ('4.0' if i % 4 else '10.0', i * 10, i)
+        parser = GoogleSensorParser([])
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'log.txt')
+            with open(path, 'w') as f:
+                f.write(contents)
+
+            full = parser.parse(path, index=True)
+            self.assertTrue(os.path.exists(path + '.idx.npz'))
+
+            with mock.patch.object(parser, 'read_buffer', wraps=parser.read_buffer) as read_buffer:
+                gyro, = parser.parse_range(path, 500, 705, sensor_ids=['4.0'])
+            read_bytes = sum(call.args[2] - call.args[1] for call in read_buffer.call_args_list)
+            self.assertLess(read_bytes, len(contents) / 2)
+
+            mask = (full[0].timestamps >= 500) & (full[0].timestamps <= 705)
+            self.assertEqual(gyro.timestamps.tolist(), full[0].timestamps[mask].tolist())
+            self.assertEqual(gyro.data[0].tolist(), full[0].data[0][mask].tolist())
+            self.assertEqual(gyro.latencies.tolist(), [3] * int(mask.sum()))
+
+            # A changed file is indexed again instead of using the stale index.
+            with open(path, 'a') as f:
+                f.write("Sensor: 10.0 TS: 5000 Data: 1.0 2.0 Latency: 3\n")
+            gyro, accel = parser.parse_range(path, 4000, None)
+            self.assertEqual((len(gyro.timestamps), accel.timestamps.tolist()), (0, [5000]))
+
+    def test_stream_parser(self):
+        """Tests that parsing chunks as they arrive gives the same samples as parse."""
+
+        contents = "Sensor 0: sensor type 4.0: BMI160 Gyroscope.\n"
+        contents += "Sensor 1: sensor type 10.0: Linear Acceleration Sensor.\n"
+        for i in range(50):
+            contents += "Sensor: %s TS: %d Data: %d.0 1.5 Latency: 3\n" % ('4.0' if i % 4 else '10.0', i * 10, i)
+        contents = contents.encode()[:-1]
+        parser = GoogleSensorParser([])
+        expected = parser.parse(io.BytesIO(contents))
+
+        # Chunk boundaries fall inside header and body lines alike.
+        stream_parser = StreamParser(parser)
+        for start in range(0, len(contents), 7):
+            stream_parser.feed(contents[start:start + 7])
+        self.assertEqual(stream_parser.bytes_read, len(contents))
+        self.assertEqual(stream_parser.points, 49)
+        samples = stream_parser.close()
+
+        self.assertEqual(parser.jsonify(samples), parser.jsonify(expected))
+        self.assertEqual(len(StreamParser(parser).close()), 1)
+
+    def test_parser_compressed(self):
+        """Tests that compressed files parse like the uncompressed file, a block at a time."""
+
+        contents = "Sensor 0: sensor type 4.0: BMI160 Gyroscope.\n"
+        for i in range(1000):
+            contents += "Sensor: 4.0 TS: %d Data: %d.0 1.5 Latency: 3\n" % (i * 10, i)
+        contents = contents.encode()
+        compressed = gzip.compress(contents)
+        parser = GoogleSensorParser([])
+        expected = parser.jsonify(parser.parse(io.BytesIO(contents)))
+
+        self.assertEqual(parser.jsonify(parser.parse(io.BytesIO(compressed))), expected)
+        self.assertEqual(parser.read_headers(io.BytesIO(compressed))[0], [("BMI160 Gyroscope", "4.0")])
+        chunks = list(parser.iter_chunks(io.BytesIO(compressed), chunk_size=100))
+        self.assertEqual(sum(len(chunk.timestamps) for chunk in chunks), 1000)
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'log.txt.gz')
+            with open(path, 'wb') as f:
+                f.write(compressed)
+            self.assertEqual(parser.jsonify(parser.parse(path, index=True)), expected)
+            self.assertFalse(os.path.exists(path + '.idx.npz'))
+            self.assertRaises(ValueError, parser.parse_range, path, 0, 100)
+
+    def test_parser_ragged_lines(self):
+        """Tests that lines with a different number of values than their sensor are skipped."""
+
+        log = (b"Sensor 0: sensor type 4.0: BMI160 Gyroscope.\n"
+               b"Sensor: 4.0 TS: 10 Data: 0.1 0.2 0.3 \n"
+               b"Sensor: 4.0 TS: 20 Data: 0.1 0.2 \n"
+               b"Sensor: 4.0 TS: 30 Data: 0.1 0.2 0.3 0.4 \n"
+               b"Sensor: 4.0 TS: 40 Data: 0.4 0.5 0.6 \n")
+        parser = GoogleSensorParser([])
+        gyro, = parser.parse(io.BytesIO(log))
+        self.assertEqual(gyro.timestamps.tolist(), [10, 40])
+        self.assertEqual([len(column) for column in gyro.data.values()], [2, 2, 2])
+
+        samples = new_samples([("BMI160 Gyroscope", "4.0")])
+        for line in log.decode().splitlines(True)[1:]:
+            parser.read_body(line, samples)
+        self.assertEqual(samples["4.0"].next_index, 2)
+
+    def test_merge_segments(self):
+        """Tests merging the samples of consecutive and overlapping log segments."""
+
+        def segment(sensor_id, timestamps, latencies=True):
+            timestamps = np.array(timestamps, dtype=np.int64)
+            return Sample.from_arrays("Gyro", sensor_id, timestamps, {0: timestamps * 0.5},
+                                      timestamps + 1 if latencies else np.array([], dtype=np.int64))
+
+        gyro, light = merge_segments([[segment('4.0', [30, 40]), segment('5.0', [])],
+                                      [segment('4.0', [10, 20]), segment('5.0', [7], False)]])
+        self.assertEqual(gyro.timestamps.tolist(), [10, 20, 30, 40])
+        self.assertEqual(gyro.data[0].tolist(), [5, 10, 15, 20])
+        self.assertEqual(gyro.latencies.tolist(), [11, 21, 31, 41])
+        self.assertEqual(gyro.timestamp_diffs.tolist(), [0, 10, 10, 10])
+        self.assertEqual(light.timestamps.tolist(), [7])
+
+        gyro, = merge_segments([[segment('4.0', [10, 30, 50])], [segment('4.0', [20, 40], False)]])
+        self.assertEqual(gyro.timestamps.tolist(), [10, 20, 30, 40, 50])
+        self.assertEqual(gyro.data[0].tolist(), [5, 10, 15, 20, 25])
+        # Partial latencies can't be reordered and are kept in segment order.
+        self.assertEqual(gyro.latencies.tolist(), [11, 31, 51])
+
+        other = Sample.from_arrays("Gyro", '4.0', np.array([1]), {0: np.ones(1), 1: np.ones(1)},
+                                   np.array([], dtype=np.int64))
+        self.assertRaises(ValueError, merge_segments, [[segment('4.0', [0])], [other]])
+
+    def test_parser_parse_files_merge(self):
+        """Tests that parse_files merges rotated segments of a log."""
+
+        # Every segment repeats the header, including sensors without points in it.
+        header = ("Sensor 0: sensor type 4.0: BMI160 Gyroscope.\n"
+                  "Sensor 1: sensor type 5.0: BMI160 Accelerometer.\n")
+        with tempfile.TemporaryDirectory() as directory:
+            paths = []
+            for i, start in enumerate([100, 0]):
+                paths.append(os.path.join(directory, '%d.txt' % i))
+                with open(paths[-1], 'w') as f:
+                    f.write(header)
+                    for ts in range(start, start + 100, 10):
+                        f.write("Sensor: 4.0 TS: %d Data: 1 2 3 \n" % ts)
+                    if i:
+                        f.write("Sensor: 5.0 TS: 5 Data: 1 2 3 \n")
+
+            parser = GoogleSensorParser(paths)
+            merged = json.loads(parser.parse_files(merge=True))
+            self.assertEqual(json.loads(merged['0'])['timestamps'], list(range(0, 200, 10)))
+            self.assertEqual(json.loads(merged['1'])['timestamps'], [5])
+            self.assertEqual(len(json.loads(parser.parse_files())), 4)
+
+    def test_parser_jsonify(self):
+        """Tests that jsonify encodes samples as nested JSON strings without modifying them."""
+
+        sample = Sample("Test", "1.0")
+        sample.set_dimensions(2)
+        for i in range(10):
+            sample.add_point(i * 10, [i / 3, -i], i)
+        sample.finalize()
+
+        def trace(arr):
+            return {'id': -1, 'minmax': [min(arr), max(arr)], 'arr': arr}
+        expected = {
+            "sensor_name": "Test",
+            "sensor_id": "1.0",
+            "timestamps": [i * 10 for i in range(10)],
+            "timestamp_diffs": trace([0] + [10] * 9),
+            "data": {0: trace([i / 3 for i in range(10)]), 1: trace([float(-i) for i in range(10)])},
+            "data_len": 2,
+            "latencies": trace(list(range(10)))
+        }
+
+        parser = GoogleSensorParser([])
+        encoded = parser.jsonify([sample, sample])
+        self.assertEqual(encoded, json.dumps({0: json.dumps(expected), 1: json.dumps(expected)}))
+        self.assertEqual(sample.data[1].tolist(), [-i for i in range(10)])
+
     def test_parser_file(self):
         """Opens and parses a test file with multiple samples and checks if each sample was found"""
 
@@ -0,0 +1,67 @@
+"""
+Copyright 2020 Google LLC
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    https://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import unittest
+
+import numpy as np
+
+from resample import common_timebase
+from resample import resample
+
+class TestResample(unittest.TestCase):
+    def test_common_timebase(self):
+        """Tests that the time base covers the shared range at the slowest period."""
+
+        grid = common_timebase([np.arange(0, 100, 10), np.arange(25, 200, 20)])
+        self.assertEqual(grid.tolist(), [25, 45, 65, 85])
+        self.assertEqual(common_timebase([np.arange(5)], period=2.5).tolist(), [0, 2.5])
+        self.assertEqual(len(common_timebase([np.arange(5), np.arange(10, 15)])), 0)
+        self.assertRaises(ValueError, common_timebase, [np.arange(5)], 0)
+        self.assertRaises(ValueError, common_timebase, [np.arange(5)], 1, max_points=4)
+        self.assertRaises(ValueError, common_timebase, [np.arange(5)], 1e-9)
+
+    def test_methods(self):
+        """Tests nearest, linear and zero-order hold resampling of several channels."""
+
+        timestamps = np.array([0, 10, 20])
+        values = np.array([[0., 10., 40.], [1., 2., 3.]])
+        grid = np.array([-5, 0, 4, 6, 15, 20, 25])
+
+        nan = float('nan')
+        np.testing.assert_equal(resample(timestamps, values, grid, 'nearest')[0],
+                                [nan, 0, 0, 10, 10, 40, nan])
+        np.testing.assert_equal(resample(timestamps, values, grid, 'linear')[0],
+                                [nan, 0, 4, 6, 25, 40, nan])
+        np.testing.assert_equal(resample(timestamps, values, grid, 'zoh')[1],
+                                [nan, 1, 1, 1, 2, 3, nan])
+        self.assertRaises(ValueError, resample, timestamps, values, grid, 'cubic')
+
+    def test_chunks_and_order(self):
+        """Tests that chunking doesn't change results and out-of-order points are sorted."""
+
+        rng = np.random.default_rng(1)
+        timestamps = np.cumsum(rng.integers(1, 20, 1000))
+        values = rng.normal(size=1000)
+        grid = np.arange(timestamps[0], timestamps[-1], 7)
+
+        whole = resample(timestamps, values, grid, 'linear')
+        np.testing.assert_array_equal(resample(timestamps, values, grid, 'linear', chunk_size=33), whole)
+
+        order = rng.permutation(1000)
+        np.testing.assert_allclose(resample(timestamps[order], values[order], grid), whole)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,290 @@
+"""
+Copyright 2020 Google LLC
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    https://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+
+import bz2
+import gzip
+import io
+import json
+import time
+import unittest
+
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+import numpy as np
+
+import server
+import transport
+
+from cache import DatasetCache
+
+from datasets import DatasetStore
+
+from jobs import JobQueue
+
+from metrics import Metrics
+
+LOG = (b"Sensor 0: sensor type 4.0: BMI160 Gyroscope.\n"
+       b"Sensor 1: sensor type 5.0: TMD2725 Ambient Light.\n"
+       + b"".join(b"Sensor: 4.0 TS: %d Data: %d.5 -%d.5 1.0 Latency: %d\n" % (100 + i * 10, i, i, i)
+                  for i in range(40))
+       + b"Sensor: 5.0 TS: 105 Data: 53.471672 \n")
+
+class TestServer(unittest.TestCase):
+    def setUp(self):
+        # Uploads are kept in memory only, instead of the server's cache directory.
+        cache = DatasetCache()
+        # Jobs run on a thread, the test client can't share state with worker processes.
+        executor = ThreadPoolExecutor(1)
+        self.addCleanup(executor.shutdown)
+        for name, value in [('cache', cache), ('datasets', DatasetStore(cache)), ('metrics', Metrics()),
+                            ('jobs', JobQueue(executor=executor))]:
+            patcher = mock.patch.object(server, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.client = server.app.test_client()
+
+    def upload(self, **kwargs):
+        return self.client.post('/upload', data={'file': (io.BytesIO(LOG), 'log.txt')}, **kwargs)
+
+    def post(self, path, body, **kwargs):
+        return self.client.post(path, data=json.dumps(body), **kwargs)
+
+    def wait(self, job_id):
+        """Polls /jobs/<job_id> until the job finishes and returns its last status."""
+        deadline = time.monotonic() + 10
+        while True:
+            job = self.client.get('/jobs/' + job_id).get_json()
+            if job['status'] not in ('queued', 'running') or time.monotonic() > deadline:
+                return job
+            time.sleep(0.01)
+
+    def test_upload(self):
+        """Tests uploading a log and receiving its samples as JSON."""
+
+        response = self.upload()
+        self.assertEqual(response.status_code, 200)
+        body = response.get_json()
+        self.assertEqual(body['type'], 'upload')
+
+        gyro = json.loads(json.loads(body['data'])['0'])
+        self.assertEqual((gyro['sensor_name'], gyro['sensor_id']), ("BMI160 Gyroscope", "4.0"))
+        self.assertEqual(gyro['timestamps'][:3], [100, 110, 120])
+        self.assertEqual(gyro['data']['1']['arr'][:2], [-0.5, -1.5])
+        self.assertIsNotNone(server.datasets.get(body['dataset_id']))
+
+    def test_upload_ragged(self):
+        """Tests that a log line with too few values doesn't fail the upload."""
+
+        log = LOG + b"Sensor: 4.0 TS: 900 Data: 0.1 0.2 \n"
+        response = self.client.post('/upload', data={'file': (io.BytesIO(log), 'log.txt')})
+        self.assertEqual(response.status_code, 200)
+        gyro = json.loads(json.loads(response.get_json()['data'])['0'])
+        self.assertEqual(len(gyro['timestamps']), 40)
+
+    def test_upload_invalid(self):
+        """Tests that files the parser rejects are answered with 400."""
+
+        log = b"time,x\n0.000,1\n0.010,2\n"
+        for path, data in [('/upload', {'file': (io.BytesIO(log), 'log.csv')}),
+                           ('/upload/stream', log),
+                           ('/upload/multi', {'files': [(io.BytesIO(log), 'log.csv')]})]:
+            response = self.client.post(path, data=data)
+            self.assertEqual(response.status_code, 400)
+            self.assertIn('integers', response.get_json()['message'])
+
+    def test_upload_binary(self):
+        """Tests uploading a log and receiving its samples in the binary format."""
+
+        response = self.upload(headers={'Accept': transport.MIMETYPE})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, transport.MIMETYPE)
+        self.assertEqual(response.headers['X-Dataset-Id'], self.upload().get_json()['dataset_id'])
+
+        gyro, light = transport.decode(response.data)
+        self.assertEqual(gyro['sensor_id'], "4.0")
+        self.assertEqual(gyro['timestamps'].tolist(), list(range(100, 500, 10)))
+        self.assertEqual(gyro['data'][0][:2].tolist(), [0.5, 1.5])
+        self.assertEqual(light['data'][0].tolist(), [53.471672])
+
+    def test_upload_stream(self):
+        """Tests streaming an upload and polling its progress."""
+
+        *entries, last = self.stream(LOG, 'log')
+        self.assertEqual([entry['index'] for entry in entries], [0, 1])
+        self.assertEqual(entries[0]['sample']['timestamps'][:2], [100, 110])
+        self.assertEqual(entries[1]['sample']['sensor_name'], "TMD2725 Ambient Light")
+        # The dataset is the one /upload creates for the same file.
+        self.assertEqual(last['dataset_id'], self.upload().get_json()['dataset_id'])
+
+        progress = self.client.get('/upload/progress/log').get_json()
+        self.assertEqual(progress, {'type': 'progress', 'bytes_read': len(LOG),
+                                    'bytes_total': len(LOG), 'points': 41})
+        self.assertEqual(self.client.get('/upload/progress/unknown').status_code, 404)
+
+    def test_upload_multi(self):
+        """Tests merging rotated segments and comparing sessions uploaded together."""
+
+        header = LOG[:LOG.index(b"Sensor:")]
+        segments = [header + b"Sensor: 4.0 TS: 300 Data: 1 2 3 \n",
+                    header + b"Sensor: 4.0 TS: 100 Data: 4 5 6 \nSensor: 5.0 TS: 105 Data: 7 \n"]
+
+        def post(segments, mode):
+            files = [(io.BytesIO(data), 'log%d.txt' % i) for i, data in enumerate(segments)]
+            return self.client.post('/upload/multi', data={'files': files, 'mode': mode})
+
+        body = post(segments, 'merge').get_json()
+        self.assertEqual(body['type'], 'upload')
+        gyro = json.loads(json.loads(body['data'])['0'])
+        self.assertEqual(gyro['timestamps'], [100, 300])
+        # The first segment declares the light sensor without points of it.
+        light = json.loads(json.loads(body['data'])['1'])
+        self.assertEqual(light['timestamps'], [105])
+
+        body = post(segments, 'sessions').get_json()
+        self.assertEqual([session['filename'] for session in body['sessions']], ['log0.txt', 'log1.txt'])
+
+        other = header + b"Sensor: 4.0 TS: 500 Data: 1 2 \n"
+        self.assertEqual(post(segments + [other], 'merge').status_code, 400)
+        self.assertEqual(post(segments, 'unknown').status_code, 400)
+
+    def test_jobs(self):
+        """Tests parsing and computing statistics in background jobs."""
+
+        response = self.client.post('/jobs/parse', data={'file': (io.BytesIO(LOG), 'log.txt')})
+        self.assertEqual(response.status_code, 202)
+        job = self.wait(response.get_json()['job_id'])
+        self.assertEqual((job['kind'], job['status']), ('parse', 'done'))
+        dataset_id = job['result']['dataset_id']
+        self.assertEqual(dataset_id, self.upload().get_json()['dataset_id'])
+
+        request = {'dataset_id': dataset_id, 'samples': [0], 'avg_period': 3, 'stdev_period': 3}
+        response = self.post('/jobs/stats', request)
+        self.assertEqual(response.status_code, 202)
+        job = self.wait(response.get_json()['job_id'])
+        self.assertEqual(job['result'], self.post('/stats/batch', request).get_json())
+
+        self.assertEqual(self.client.delete('/jobs/' + job['job_id']).get_json()['status'], 'done')
+        self.assertEqual(self.client.get('/jobs/unknown').status_code, 404)
+
+    def test_metrics(self):
+        """Tests reporting the stages of a request in Server-Timing and aggregating them in /metrics."""
+
+        response = self.upload()
+        stages = [entry.split(';')[0] for entry in response.headers['Server-Timing'].split(', ')]
+        self.assertEqual(stages, ['upload_file.' + name for name in ['hash', 'parse', 'cache', 'lod', 'serialize']]
+                         + ['total'])
+
+        snapshot = self.client.get('/metrics').get_json()
+        self.assertEqual(snapshot['type'], 'metrics')
+        self.assertEqual(snapshot['counters']['parse.points'], 41)
+        self.assertEqual(snapshot['timers']['request.upload_file']['count'], 1)
+        self.assertEqual(snapshot['timers']['upload_file.parse']['count'], 1)
+
+    def stream(self, data, upload_id):
+        response = self.client.post('/upload/stream?upload_id=' + upload_id, data=data)
+        self.assertEqual(response.status_code, 200)
+        return [json.loads(line) for line in response.data.splitlines()]
+
+    def test_upload_stream_compressed(self):
+        """Tests detecting the format of compressed streams and counting their received bytes."""
+
+        # Large enough that bz2 outputs nothing until after the first chunk.
+        rows = b"".join(b"%d,%d,%d\n" % (i, i * 7919 % 100003, i * 104729 % 65537) for i in range(100000))
+        for compress in (bz2.compress, gzip.compress):
+            data = compress(b"ts,x,y\n" + rows)
+            *entries, last = self.stream(data, compress.__module__)
+            sample = entries[0]['sample']
+            self.assertEqual(len(sample['timestamps']), 100000)
+            self.assertEqual(last['type'], 'upload')
+
+            progress = self.client.get('/upload/progress/' + compress.__module__).get_json()
+            self.assertEqual(progress['bytes_read'], len(data))
+            self.assertEqual(progress['bytes_total'], len(data))
+            self.assertEqual(progress['points'], 100000)
+
+    def test_stats(self):
+        """Tests computing rolling statistics of an uploaded dataset by reference."""
+
+        dataset_id = self.upload().get_json()['dataset_id']
+        request = {'dataset_id': dataset_id, 'sample': 0, 'channels': ['0', 'latencies'],
+                   'avg_period': 2, 'stdev_period': 3}
+
+        body = self.post('/stats', request).get_json()
+        self.assertEqual(body['type'], 'stats')
+        self.assertEqual(body['avgs']['0'][:3], [0.5, 1.0, 2.0])
+        self.assertEqual(body['stdevs']['latencies'][:2], [0.0, np.std([0, 1], ddof=1)])
+
+        # Requests without a dataset_id send the traces themselves.
+        body = self.post('/stats', {'channels': {'0': [1, 2, 3]}, 'avg_period': 2, 'stdev_period': 2}).get_json()
+        self.assertEqual(body['avgs']['0'], [1, 1.5, 2.5])
+
+    def test_stats_unknown(self):
+        """Tests that /stats responds 404 to unknown datasets, samples and channels."""
+
+        dataset_id = self.upload().get_json()['dataset_id']
+        request = {'dataset_id': dataset_id, 'sample': 0, 'channels': ['0'], 'avg_period': 2, 'stdev_period': 2}
+        for changes, message in [({'dataset_id': 'unknown'}, 'Unknown dataset'),
+                                 ({'sample': 2}, 'Unknown sample: 2'),
+                                 ({'channels': ['7']}, 'Unknown channel: 7')]:
+            response = self.post('/stats', dict(request, **changes))
+            self.assertEqual(response.status_code, 404)
+            self.assertEqual(response.get_json(), {'type': 'error', 'message': message})
+
+        del request['sample']
+        response = self.post('/stats', request)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.get_json()['message'], 'Missing field: sample')
+
+    def test_batch_stats(self):
+        """Tests that batch statistics are memoized before stacking and reject invalid percentiles."""
+
+        dataset_id = self.upload().get_json()['dataset_id']
+        request = {'dataset_id': dataset_id, 'samples': [0], 'avg_period': 2, 'stdev_period': 2}
+        body = self.post('/stats/batch', request).get_json()
+        gyro, = body['samples']
+        self.assertEqual(gyro['channels'][:3], ['0', '1', '2'])
+        self.assertEqual(gyro['max'][0], 39.5)
+
+        with mock.patch.object(server.datasets.get(dataset_id), 'stack') as stack:
+            self.assertEqual(self.post('/stats/batch', request).get_json(), body)
+        stack.assert_not_called()
+
+        response = self.post('/stats/batch', dict(request, percentiles=[101]))
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.post('/stats/batch', dict(request, samples=[5])).status_code, 404)
+
+    def test_timing(self):
+        """Tests summarizing the sampling rate of every sample of a dataset."""
+
+        dataset_id = self.upload().get_json()['dataset_id']
+        body = self.post('/timing', {'dataset_id': dataset_id}).get_json()
+        self.assertEqual(body['type'], 'timing')
+        gyro, light = body['samples']
+        self.assertEqual((gyro['sample'], gyro['sensor_id']), (0, "4.0"))
+        self.assertEqual(gyro['nominal_period'], 10)
+        self.assertEqual(light['sensor_name'], "TMD2725 Ambient Light")
+
+        response = self.post('/timing', {'dataset_id': dataset_id, 'samples': [3]})
+        self.assertEqual(response.status_code, 404)
+        for options in [{'bins': 0}, {'bins': 'many'}, {'gap_factor': -1}, {'percentiles': [101]},
+                        {'percentiles': ['high']}]:
+            response = self.post('/timing', dict(options, dataset_id=dataset_id))
+            self.assertEqual(response.status_code, 400)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,103 @@
+"""
+Copyright 2020 Google LLC
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    https://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import unittest
+
+import numpy as np
+
+from datasets import Dataset
+from parser import Sample
+from spectral import downsample_bins
+from spectral import sample_spectrum
+from spectral import spectrum
+
+# One second of a 50 Hz sine of amplitude 3 and a constant, sampled at 1 kHz with millisecond timestamps.
+TIMESTAMPS = np.arange(1000, dtype=np.int64)
+MATRIX = np.vstack([3 * np.sin(2 * np.pi * 50 * TIMESTAMPS / 1000), np.ones(1000)])
+
+class TestSpectral(unittest.TestCase):
+    def test_fft(self):
+        """Tests that the amplitude spectrum peaks at the frequency and amplitude of a sine."""
+
+        result = spectrum(TIMESTAMPS, MATRIX, 'fft', time_unit=1e-3)
+        self.assertEqual(result['sample_rate'], 1000)
+        self.assertEqual(result['frequency_unit'], 'Hz')
+        self.assertFalse(result['resampled'])
+        peak = np.argmax(result['values'][0])
+        self.assertEqual(result['frequencies'][peak], 50)
+        self.assertAlmostEqual(result['values'][0][peak], 3, places=1)
+        # The constant is removed by detrending.
+        self.assertAlmostEqual(result['values'][1].max(), 0)
+
+    def test_welch(self):
+        """Tests that the power spectral density peaks at the sine and integrates to its variance."""
+
+        result = spectrum(TIMESTAMPS, MATRIX, 'welch', segment=200, time_unit=1e-3)
+        frequencies, values = result['frequencies'], result['values']
+        self.assertEqual(values.shape, (2, 101))
+        self.assertEqual(frequencies[np.argmax(values[0])], 50)
+        power = values[0].sum() * (frequencies[1] - frequencies[0])
+        self.assertAlmostEqual(power, MATRIX[0].var(), delta=0.1)
+
+    def test_stft(self):
+        """Tests the frames of a spectrogram and their times."""
+
+        result = spectrum(TIMESTAMPS, MATRIX, 'stft', segment=100, overlap=0, time_unit=1e-3,
+                          max_frames=5)
+        self.assertEqual(result['values'].shape, (2, 5, 51))
+        self.assertEqual(result['times'].tolist(), [100, 300, 500, 700, 900])
+        self.assertTrue(np.all(np.argmax(result['values'][0], axis=-1) == 5))
+
+    def test_irregular(self):
+        """Tests that irregularly sampled traces are resampled first."""
+
+        timestamps = TIMESTAMPS * 2
+        timestamps[500:] += 1
+        result = spectrum(timestamps, MATRIX[:1], 'fft')
+        self.assertTrue(result['resampled'])
+        self.assertEqual(result['sample_rate'], 0.5)
+        self.assertEqual(result['frequency_unit'], 'per timestamp unit')
+
+    def test_errors(self):
+        """Tests rejecting invalid methods, overlaps and traces."""
+
+        self.assertRaises(ValueError, spectrum, TIMESTAMPS, MATRIX, 'unknown')
+        self.assertRaises(ValueError, spectrum, TIMESTAMPS, MATRIX, 'welch', overlap=1)
+        self.assertRaises(ValueError, spectrum, TIMESTAMPS[:1], MATRIX[:, :1])
+        # A Hann window of 2 points is all zeros.
+        self.assertRaises(ValueError, spectrum, TIMESTAMPS[:2], MATRIX[:, :2], 'fft')
+        self.assertRaises(ValueError, spectrum, TIMESTAMPS, MATRIX, 'welch', segment=2)
+        self.assertTrue(np.all(np.isfinite(spectrum(TIMESTAMPS[:3], MATRIX[:, :3], 'fft')['values'])))
+        self.assertRaises(ValueError, spectrum, np.zeros(5, dtype=np.int64), np.zeros((1, 5)))
+
+    def test_downsample_bins(self):
+        """Tests keeping the peak of each group of frequency bins."""
+
+        frequencies, values = downsample_bins(np.arange(6.0), np.array([[1, 5, 2, 2, 0, 3]]), 3)
+        self.assertEqual(frequencies.tolist(), [0.5, 2.5, 4.5])
+        self.assertEqual(values.tolist(), [[5, 2, 3]])
+
+    def test_sample_spectrum(self):
+        """Tests computing the spectra of every trace of a sample of a Dataset."""
+
+        sample = Sample.from_arrays("Gyro", "4.0", TIMESTAMPS, {0: MATRIX[0], 1: MATRIX[1]},
+                                    np.array([], dtype=np.int64))
+        channels, result = sample_spectrum(Dataset('id', [sample]), 0, method='welch')
+        self.assertEqual(channels[:2], ['0', '1'])
+        self.assertEqual(len(result['values']), len(channels))
+
+if __name__ == '__main__':
+    unittest.main()
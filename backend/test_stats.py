@@ -0,0 +1,103 @@
+"""
+Copyright 2020 Google LLC
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    https://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import unittest
+
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+
+from stats import RollingStats
+from stats import StatsCache
+from stats import batch_stats
+from stats import compute_running_avg
+from stats import compute_stdev
+from stats import rolling_mean_stdev
+
+class TestStats(unittest.TestCase):
+    def test_matches_pandas(self):
+        """Tests the rolling statistics against pandas' rolling window."""
+
+        trace = np.random.default_rng(0).normal(1000, 5, size=3000)
+        for period in [1, 2, 50, 3000, 5000]:
+            window = pd.Series(trace).rolling(min(period, len(trace)), min_periods=1)
+            expected_stdevs = window.std().fillna(0).to_numpy()
+
+            means, stdevs = rolling_mean_stdev(trace, period)
+            np.testing.assert_allclose(means, window.mean().to_numpy(), rtol=1e-12)
+            np.testing.assert_allclose(stdevs, expected_stdevs, rtol=1e-7, atol=1e-7)
+
+        self.assertEqual(compute_running_avg([1, 2, 3, 4], 2), [1, 1.5, 2.5, 3.5])
+        self.assertEqual(compute_stdev([1, 1, 3], None, 2)[:2], [0, 0])
+
+    def test_incremental(self):
+        """Tests that extending in pieces matches computing all points at once."""
+
+        trace = np.random.default_rng(1).normal(size=1000)
+        stats = RollingStats(40)
+        for start, end in [(0, 10), (10, 11), (11, 700), (700, 1000)]:
+            stats.extend(trace[start:end])
+
+        means, stdevs = rolling_mean_stdev(trace, 40)
+        np.testing.assert_allclose(stats.means, means, atol=1e-12)
+        np.testing.assert_allclose(stats.stdevs, stdevs, atol=1e-12)
+        self.assertRaises(ValueError, RollingStats, 0)
+
+    def test_cache(self):
+        """Tests that cached statistics are reused and extended when the trace grows."""
+
+        trace = np.arange(100, dtype=float)
+        cache = StatsCache()
+
+        first = cache.get(('a', 0, '0', 10), trace[:60], 10)
+        second = cache.get(('a', 0, '0', 10), trace, 10)
+        self.assertIs(first, second)
+        self.assertEqual(len(second), 100)
+        self.assertEqual(second.means[-1], np.mean(trace[-10:]))
+
+        cache.max_bytes = 0
+        cache.get(('a', 0, '0', 20), trace, 20)
+        self.assertEqual(list(cache.entries), [('a', 0, '0', 20)])
+
+    def test_batch_stats(self):
+        """Tests that batch statistics match the per-trace computations."""
+
+        matrix = np.random.default_rng(3).normal(size=(4, 500))
+        result = batch_stats(matrix, avg_period=30, stdev_period=7, percentiles=(10, 50))
+
+        for i, trace in enumerate(matrix):
+            np.testing.assert_allclose(result['avgs'][i], rolling_mean_stdev(trace, 30)[0], atol=1e-12)
+            np.testing.assert_allclose(result['stdevs'][i], rolling_mean_stdev(trace, 7)[1], atol=1e-12)
+            self.assertEqual(result['min'][i], trace.min())
+            self.assertEqual(result['max'][i], trace.max())
+            self.assertAlmostEqual(result['rms'][i], np.sqrt(np.mean(trace ** 2)))
+            np.testing.assert_allclose(result['percentiles'][:, i], np.percentile(trace, [10, 50]))
+
+        # Traces longer than a block match RollingStats, which restarts its sums per block.
+        with mock.patch('stats.BLOCK_SIZE', 64):
+            result = batch_stats(matrix, avg_period=100, stdev_period=30)
+            stats = RollingStats(100)
+            stats.extend(matrix[2])
+        np.testing.assert_allclose(result['avgs'][2], stats.means, atol=1e-12)
+        np.testing.assert_allclose(result['stdevs'][2], rolling_mean_stdev(matrix[2], 30)[1], atol=1e-12)
+
+        empty = batch_stats(np.empty((2, 0)))
+        self.assertEqual(empty['percentiles'].shape, (3, 0))
+        self.assertEqual(empty['avgs'].shape, (2, 0))
+
+if __name__ == '__main__':
+    unittest.main()
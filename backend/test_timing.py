@@ -0,0 +1,69 @@
+"""
+Copyright 2020 Google LLC
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    https://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import unittest
+
+import numpy as np
+
+from timing import timing_summary
+
+class TestTiming(unittest.TestCase):
+    def test_regular(self):
+        """Tests the summary of evenly spaced timestamps."""
+
+        summary = timing_summary(np.arange(0, 1000, 10), np.arange(100))
+
+        self.assertEqual(summary['count'], 100)
+        self.assertEqual(summary['nominal_period'], 10)
+        self.assertAlmostEqual(summary['effective_rate'], 0.1)
+        self.assertEqual(summary['jitter']['max_abs'], 0)
+        self.assertEqual(sum(summary['histogram']['counts']), 99)
+        self.assertEqual(summary['gaps']['count'], 0)
+        self.assertEqual(summary['out_of_order']['count'], 0)
+        self.assertEqual(summary['latency']['values'][0], 49.5)
+
+    def test_irregular(self):
+        """Tests detecting gaps, dropped samples and out-of-order timestamps."""
+
+        timestamps = np.array([0, 10, 20, 50, 60, 55, 80, 80, 90, 101])
+        summary = timing_summary(timestamps, gap_factor=1.5)
+
+        self.assertEqual(summary['nominal_period'], 10)
+        self.assertEqual(summary['gaps']['count'], 2)
+        self.assertEqual(summary['gaps']['dropped'], 3)
+        self.assertEqual(summary['gaps']['events'], [[50, 30.0], [80, 25.0]])
+        self.assertEqual(summary['out_of_order'], {'count': 1, 'duplicates': 1, 'events': [[55, -5.0]]})
+        self.assertEqual(summary['jitter']['max_abs'], 1)
+        self.assertNotIn('latency', summary)
+
+    def test_empty(self):
+        """Tests that traces with fewer than two points are summarized without errors."""
+
+        for timestamps in (np.empty(0, dtype=np.int64), np.array([5])):
+            summary = timing_summary(timestamps, np.ones(len(timestamps)))
+            self.assertEqual(summary['effective_rate'], 0)
+            self.assertEqual(summary['gaps']['count'], 0)
+
+    def test_invalid_options(self):
+        """Tests rejecting histogram bins, gap factors and percentiles out of range."""
+
+        timestamps = np.arange(0, 100, 10)
+        for options in [{'bins': 0}, {'bins': 1 << 20}, {'gap_factor': 0},
+                        {'gap_factor': float('nan')}, {'percentiles': (50, 101)}]:
+            self.assertRaises(ValueError, timing_summary, timestamps, **options)
+
+if __name__ == '__main__':
+    unittest.main()
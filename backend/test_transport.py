@@ -0,0 +1,71 @@
+"""
+Copyright 2020 Google LLC
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    https://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import unittest
+
+import numpy as np
+
+import transport
+
+from parser import Sample
+
+class TestTransport(unittest.TestCase):
+    def test_round_trip(self):
+        """Tests that decode returns the columns passed to encode, aligned for typed arrays."""
+
+        gyro = Sample("Gyro", "4.0")
+        gyro.set_dimensions(3)
+        for i in range(7):
+            gyro.add_point(100 + i * 3, [i, -i, i / 7], i)
+        light = Sample("Light", "5.0", dtype=np.float32)
+        light.add_point(5, [53.5])
+        gyro.finalize()
+        light.finalize()
+
+        buffer = transport.encode([gyro, light])
+        decoded = transport.decode(buffer)
+
+        self.assertEqual([entry['sensor_name'] for entry in decoded], ["Gyro", "Light"])
+        self.assertEqual(decoded[0]['timestamps'].tolist(), gyro.timestamps.tolist())
+        self.assertEqual(decoded[0]['timestamp_diffs'].tolist(), gyro.timestamp_diffs.tolist())
+        self.assertEqual(decoded[0]['latencies'].tolist(), gyro.latencies.tolist())
+        self.assertEqual(decoded[0]['data'][2].tolist(), gyro.data[2].tolist())
+        self.assertEqual(decoded[0]['data_len'], 3)
+        self.assertNotIn('latencies', decoded[1])
+        self.assertEqual(decoded[1]['data'][0].dtype, np.float32)
+
+        for arr in decoded[0]['data'] + decoded[1]['data']:
+            offset = arr.ctypes.data - np.frombuffer(buffer, np.uint8).ctypes.data
+            self.assertEqual(offset % transport.ALIGNMENT, 0)
+
+    def test_nested_arrays(self):
+        """Tests encoding arbitrary structures with 1-D and 2-D arrays."""
+
+        header = {'type': 'batch_stats', 'rows': np.arange(6.0).reshape(2, 3),
+                  'items': [{'name': 'a', 'values': np.array([1.5], dtype=np.float32)}]}
+        decoded = transport.decode_arrays(b"".join(transport.iter_arrays(header)))
+
+        self.assertEqual(decoded['type'], 'batch_stats')
+        self.assertEqual([row.tolist() for row in decoded['rows']], [[0, 1, 2], [3, 4, 5]])
+        self.assertEqual(decoded['items'][0]['values'].dtype, np.float32)
+        self.assertEqual(transport.to_lists(header)['rows'], [[0, 1, 2], [3, 4, 5]])
+
+    def test_decode_bad_magic(self):
+        """Tests that decode rejects buffers in another format."""
+        self.assertRaises(ValueError, transport.decode, b"{}")
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,134 @@
+"""
+Copyright 2020 Google LLC
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    https://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import numpy as np
+
+# Maximum number of gap and out-of-order events listed in a summary, counts cover all of them.
+MAX_EVENTS = 100
+# Maximum number of bins of the jitter histogram.
+MAX_BINS = 4096
+
+def timing_summary(timestamps: np.ndarray, latencies=None, gap_factor=1.5, bins=32,
+                   percentiles=(50, 90, 99, 99.9)) -> dict:
+    """Summarizes the sampling regularity of one sensor.
+
+    The timestamp differences are computed once and every statistic is a
+    vectorized reduction over them, so the cost is a single pass over the trace.
+    All times are in the unit of the timestamps.
+
+    Args:
+        timestamps: The timestamps of the sensor, in the order they were logged.
+        latencies: (Optional) The latency of every point.
+        gap_factor: Differences larger than gap_factor times the nominal period
+            are reported as gaps with dropped samples.
+        bins: The number of bins of the jitter histogram.
+        percentiles: The latency percentiles to compute, between 0 and 100.
+
+    Returns:
+        A dict of JSON values:
+            count: The number of points.
+            duration: The time between the first and the last point.
+            nominal_period: The median of the positive timestamp differences.
+            mean_period: The mean of the positive timestamp differences.
+            effective_rate: Points per unit of time over the whole trace.
+            jitter: mean, stdev and max_abs of the deviation of the differences
+                from the nominal period, gaps excluded.
+            histogram: counts of the differences up to the gap threshold in
+                bins equal bins, whose bounds are edges.
+            gaps: count, dropped (the estimated number of missing points),
+                max, and events, [timestamp, difference] pairs for at most
+                MAX_EVENTS gaps ending at timestamp.
+            out_of_order: count of negative differences, duplicates count of
+                zero differences and events as for gaps.
+            latency: count, mean, max, percentiles and their values, only if
+                latencies has a value for every point.
+
+    Raises:
+        ValueError: gap_factor isn't positive, bins isn't between 1 and
+            MAX_BINS or a percentile isn't between 0 and 100.
+    """
+    if not 0 < gap_factor < np.inf:
+        raise ValueError("gap_factor must be positive")
+    if not 1 <= bins <= MAX_BINS:
+        raise ValueError("bins must be between 1 and %d" % MAX_BINS)
+    if not all(0 <= percentile <= 100 for percentile in percentiles):
+        raise ValueError("Percentiles must be between 0 and 100")
+    timestamps = np.asarray(timestamps)
+    count = len(timestamps)
+    diffs = np.diff(timestamps).astype(np.float64)
+
+    positive = diffs[diffs > 0]
+    nominal = nominal_period(positive)
+    duration = float(timestamps[-1] - timestamps[0]) if count else 0.0
+
+    threshold = gap_factor * nominal
+    regular = positive[positive <= threshold]
+    gap_mask = diffs > threshold if nominal else np.zeros(len(diffs), dtype=bool)
+    gap_diffs = diffs[gap_mask]
+    backwards = diffs < 0
+
+    deviations = regular - nominal
+    counts, edges = np.histogram(regular, bins=bins, range=(0, threshold or 1))
+
+    summary = {
+        'count': count,
+        'duration': duration,
+        'nominal_period': nominal,
+        'mean_period': float(positive.mean()) if len(positive) else 0.0,
+        'effective_rate': (count - 1) / duration if duration > 0 else 0.0,
+        'jitter': {
+            'mean': float(deviations.mean()) if len(deviations) else 0.0,
+            'stdev': float(deviations.std()) if len(deviations) else 0.0,
+            'max_abs': float(np.abs(deviations).max()) if len(deviations) else 0.0
+        },
+        'histogram': {'edges': edges.tolist(), 'counts': counts.tolist()},
+        'gaps': {
+            'count': int(len(gap_diffs)),
+            'dropped': int(np.sum(np.round(gap_diffs / nominal) - 1)) if len(gap_diffs) else 0,
+            'max': float(gap_diffs.max()) if len(gap_diffs) else 0.0,
+            'events': events(timestamps, diffs, gap_mask)
+        },
+        'out_of_order': {
+            'count': int(np.count_nonzero(backwards)),
+            'duplicates': int(np.count_nonzero(diffs == 0)),
+            'events': events(timestamps, diffs, backwards)
+        }
+    }
+
+    if latencies is not None and len(latencies) == count and count:
+        latencies = np.asarray(latencies, dtype=np.float64)
+        summary['latency'] = {
+            'count': count,
+            'mean': float(latencies.mean()),
+            'max': float(latencies.max()),
+            'percentiles': list(percentiles),
+            'values': np.percentile(latencies, percentiles).tolist()
+        }
+    return summary
+
+def nominal_period(diffs: np.ndarray) -> float:
+    """Returns the median of the positive timestamp differences, 0 if there are none."""
+    positive = diffs[diffs > 0]
+    return float(np.median(positive)) if len(positive) else 0.0
+
+def events(timestamps: np.ndarray, diffs: np.ndarray, mask: np.ndarray) -> list:
+    """Lists [timestamp, difference] for the first MAX_EVENTS differences selected by mask."""
+    indices = np.flatnonzero(mask)[:MAX_EVENTS]
+    return [[timestamps[i + 1].item(), float(diffs[i])] for i in indices]
+
+def sample_timing(sample, **kwargs) -> dict:
+    """Returns the timing_summary of a Sample, see timing_summary for kwargs."""
+    return timing_summary(sample.timestamps, sample.latencies, **kwargs)
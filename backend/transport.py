@@ -0,0 +1,211 @@
+"""
+Copyright 2020 Google LLC
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    https://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import json
+import struct
+
+import numpy as np
+
+MAGIC = b"SDV1"
+MIMETYPE = "application/vnd.sensors-data-visualizer.samples"
+# Every column starts at a multiple of ALIGNMENT bytes, the size of a float64.
+ALIGNMENT = 8
+
+def padding(size: int) -> int:
+    """Returns the number of bytes needed to align size to ALIGNMENT."""
+    return -size % ALIGNMENT
+
+def column_dtype(arr: np.ndarray) -> np.dtype:
+    """Returns the little-endian dtype a column is sent as.
+
+    float32 channels are kept as float32, everything else is sent as float64,
+    which is also the precision the frontend gets from JSON numbers.
+    """
+    if arr.dtype == np.float32:
+        return np.dtype("<f4")
+    return np.dtype("<f8")
+
+def iter_binary(samples: list):
+    """Encodes samples in a binary format the frontend can view as typed arrays.
+
+    The header holds, for each sample:
+        sensor_name: string - The name of the sensor.
+        sensor_id: string - The unique ID of a sensor.
+        timestamps, timestamp_diffs, latencies (Optional): Column descriptors.
+        data: A list of column descriptors, one per channel.
+        data_len: integer - The number of data channels.
+    See iter_arrays for the layout and the column descriptors.
+
+    Args:
+        samples: A list of Sample objects, they are not modified.
+
+    Yields:
+        bytes objects that join to the encoded buffer.
+    """
+    entries, summaries = [], {}
+    for sample in samples:
+        fields = {key: getattr(sample, key) for key in ("timestamps", "timestamp_diffs", "latencies")}
+        fields.update(sample.data)
+        for key, arr in fields.items():
+            summaries[id(arr)] = sample.summary(key)
+
+        entry = {
+            "sensor_name": sample.sensor_name,
+            "sensor_id": sample.sensor_id,
+            "timestamps": fields["timestamps"],
+            "timestamp_diffs": fields["timestamp_diffs"],
+            "data": [fields[key] for key in sample.data],
+            "data_len": len(sample.data)
+        }
+        if len(fields["latencies"]):
+            entry["latencies"] = fields["latencies"]
+        entries.append(entry)
+    return iter_arrays({"samples": entries}, summaries)
+
+def iter_arrays(header, summaries=None):
+    """Encodes a JSON-like structure whose leaves may be NumPy arrays.
+
+    Layout, all numbers little-endian:
+        magic: 4 bytes - MAGIC.
+        header_len: uint32 - The length of the header in bytes.
+        header: UTF-8 JSON - header, with every array replaced by a column descriptor.
+        padding: Zero bytes up to the next multiple of ALIGNMENT.
+        columns: The raw column values. Each column starts at a multiple of
+            ALIGNMENT, so it can be viewed without copying, e.g.
+            new Float64Array(buffer, column.offset, column.length).
+
+    A column descriptor is:
+        dtype: 'float32' or 'float64'.
+        offset: integer - Byte offset of the column from the start of the buffer.
+        length: integer - The number of values in the column.
+        minmax: float[] - The minimum and maximum value, empty if length is 0.
+    Arrays with more than one dimension are sent as a list of their rows.
+
+    Args:
+        header: Nested dicts and lists of JSON values and arrays. It is not modified.
+        summaries: (Optional) A dict from the id() of arrays in header to their
+            parser.summarize result, which minmax is then taken from.
+
+    Yields:
+        bytes objects that join to the encoded buffer.
+    """
+    columns = []
+
+    def describe(node):
+        if isinstance(node, dict):
+            return {key: describe(value) for key, value in node.items()}
+        if isinstance(node, (list, tuple)):
+            return [describe(value) for value in node]
+        if not isinstance(node, np.ndarray):
+            return node
+        if node.ndim > 1:
+            return [describe(row) for row in node]
+
+        summary = summaries.get(id(node)) if summaries else None
+        if not len(node):
+            minmax = []
+        elif summary is not None:
+            minmax = [summary["min"], summary["max"]]
+        else:
+            minmax = [node.min().item(), node.max().item()]
+
+        descriptor = {
+            "dtype": column_dtype(node).name,
+            "offset": 0,
+            "length": len(node),
+            "minmax": minmax
+        }
+        columns.append((descriptor, node))
+        return descriptor
+
+    header = describe(header)
+
+    # Offsets are written into the header, so the header length they start after
+    # is found by encoding until it no longer changes.
+    encoded = b""
+    while True:
+        offset = 8 + len(encoded) + padding(8 + len(encoded))
+        for descriptor, arr in columns:
+            descriptor["offset"] = offset
+            size = len(arr) * column_dtype(arr).itemsize
+            offset += size + padding(size)
+        previous, encoded = encoded, json.dumps(header).encode()
+        if len(encoded) == len(previous):
+            break
+
+    yield MAGIC + struct.pack("<I", len(encoded)) + encoded
+    yield b"\0" * padding(8 + len(encoded))
+
+    for _, arr in columns:
+        data = np.ascontiguousarray(arr, dtype=column_dtype(arr)).tobytes()
+        yield data
+        yield b"\0" * padding(len(data))
+
+def to_lists(node):
+    """Returns a copy of a structure accepted by iter_arrays with arrays converted to lists,
+    for responses encoded as JSON instead."""
+    if isinstance(node, dict):
+        return {key: to_lists(value) for key, value in node.items()}
+    if isinstance(node, (list, tuple)):
+        return [to_lists(value) for value in node]
+    if isinstance(node, (np.ndarray, np.generic)):
+        return node.tolist()
+    return node
+
+def encode(samples: list) -> bytes:
+    """Returns the binary encoding of samples, see iter_binary."""
+    return b"".join(iter_binary(samples))
+
+def decode_arrays(buffer):
+    """Decodes a buffer produced by iter_arrays.
+
+    Args:
+        buffer: A bytes-like object.
+
+    Returns:
+        The header, where every column descriptor is replaced by a read-only
+        NumPy array viewing buffer.
+
+    Raises:
+        ValueError: The buffer doesn't start with MAGIC.
+    """
+    if bytes(buffer[:4]) != MAGIC:
+        raise ValueError("Not a binary samples buffer")
+    header_len, = struct.unpack_from("<I", buffer, 4)
+
+    def view(node):
+        if isinstance(node, list):
+            return [view(value) for value in node]
+        if not isinstance(node, dict):
+            return node
+        if set(node) == {"dtype", "offset", "length", "minmax"}:
+            return np.frombuffer(buffer, dtype=np.dtype(node["dtype"]).newbyteorder("<"),
+                                 count=node["length"], offset=node["offset"])
+        return {key: view(value) for key, value in node.items()}
+
+    return view(json.loads(bytes(buffer[8:8 + header_len])))
+
+def decode(buffer) -> list:
+    """Decodes a buffer produced by encode.
+
+    Returns:
+        The list of sample entries from the header, where every column
+        descriptor is replaced by a read-only NumPy array viewing buffer.
+
+    Raises:
+        ValueError: The buffer doesn't start with MAGIC.
+    """
+    return decode_arrays(buffer)["samples"]
@@ -69,6 +69,8 @@ export class DatasetComponent {
                               minmax = [min(latencies['arr']), max(latencies['arr'])]
           arr: float[] - The data values recorded for latencies.
       }
+      dataset_id: string - The ID the backend keeps the upload under, set by side-menu.
+      sample_index: integer - The index of this sample in the upload, set by side-menu.
    */
   sample: any;
   /**
@@ -220,19 +222,20 @@ export class DatasetComponent {
           'stdevs' + this.currentOptions + this.sample.sensor_name
         )
       );
-      // Package data to send to the backend.
+      // Package data to send to the backend. The backend already holds the
+      // parsed upload, so only references to the channels are sent.
       const data = {
         avg_period: periods.avg,
         stdev_period: periods.stdev,
-        channels: {
-          timestamp_diffs: this.sample.timestamp_diffs['arr'],
-        },
+        dataset_id: this.sample.dataset_id,
+        sample: this.sample.sample_index,
+        channels: ['timestamp_diffs'],
       };
       for (const i in this.sample.data) {
-        data.channels[i] = this.sample.data[i]['arr'];
+        data.channels.push(i);
       }
       if (this.hasLatencies) {
-        data.channels['latencies'] = this.sample.latencies['arr'];
+        data.channels.push('latencies');
       }
       this.requestStats(data, channel);
     } else {
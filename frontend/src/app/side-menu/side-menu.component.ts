@@ -134,6 +134,8 @@ export class SideMenuComponent {
           for (const i in parsed) {
             let sample = JSON.parse(parsed[i]);
             sample = this.idMan.assignIDs(sample);
+            sample.dataset_id = event.body.dataset_id;
+            sample.sample_index = Number(i);
             samples.push(sample);
 
             this.sharedService